@@ -25,7 +25,9 @@ class HabitStates(StatesGroup):
     execution = State()
     execution_habit = State()
     not_completed = State()
+    batch_execution = State()  # Отметка нескольких привычек за раз
     statistics = State()
+    notification_settings = State()  # Ввод часового пояса и времени напоминания
 
 
 async def switch_keyboard(callback: CallbackQuery, state: FSMContext, next_state: State, keyboard_func):
@@ -0,0 +1,222 @@
+"""
+Встроенный режим работы бота: вызовы UserCRUD / HabitCRUD / HabitLogCRUD напрямую
+на общем асинхронном движке, без HTTP, JSON и JWT.
+
+Включается настройкой BOT_TRANSPORT=embedded, когда бот и API работают на одном хосте
+с одной базой. Методы совпадают по сигнатурам и форме ответа с HTTP-клиентом
+TG.funcs_tg.HttpUser, поэтому обработчики не меняются.
+"""
+from collections import OrderedDict
+from datetime import time
+from typing import Any, Dict, List
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from aiogram.types import User as TgUser
+from fastapi import HTTPException
+from loguru import logger
+from pydantic import ValidationError
+from sqlalchemy.exc import NoResultFound, SQLAlchemyError
+
+from api.pydantic_models import (HabitCreate, HabitUpdate, HabitResponse, HabitLogCreate,
+                                 HabitLogResponse, HabitLogBatchCreate, UserSettingsUpdate, UserSettingsResponse)
+from config import config
+from database.db import engine, shard_engines, shard_unit_of_work, unit_of_work
+from database.func_db import UserCRUD, HabitCRUD, HabitLogCRUD, user_today, check_log_date
+from database.models import UserInDB
+
+
+def habit_to_dict(habit) -> dict:
+    return HabitResponse.model_validate(habit).model_dump(mode="json")
+
+
+def log_to_dict(log) -> dict:
+    return HabitLogResponse.model_validate(log).model_dump(mode="json")
+
+
+class EmbeddedUser:
+    """
+    Клиент базы данных от имени пользователя Telegram, повторяющий интерфейс HttpUser.
+
+    Пользователь находится по ID Telegram так же, как при входе через /token/bot (и создается
+    без пароля, если его нет), после чего ID пользователя в базе хранится в ограниченном
+    LRU-кэше `user_ids` вместо токенов.
+    Как и HTTP-клиент, при любой ошибке возвращает None.
+    """
+    user_ids: OrderedDict[int, int] = OrderedDict()
+
+    @classmethod
+    async def startup(cls) -> None:
+        logger.info("Бот работает со встроенным доступом к базе данных.")
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        await engine.dispose()
+        for shard_engine in shard_engines:
+            await shard_engine.dispose()
+
+    @classmethod
+    async def _call(cls, tg_user: TgUser, operation) -> Any:
+        """
+        Выполняет `operation(session, user)` одной транзакцией в шарде пользователя Telegram.
+        """
+        try:
+            user_id = cls.user_ids.get(tg_user.id)
+            if user_id is None:
+                async with unit_of_work() as session:
+                    user, _ = await cls._authenticate(session, tg_user)
+                user_id = user.id
+            else:
+                cls.user_ids.move_to_end(tg_user.id)
+
+            async with shard_unit_of_work(user_id, write=True) as session:
+                user = await session.get(UserInDB, user_id)
+                if user is None:
+                    return None
+                return await operation(session, user)
+        except (HTTPException, NoResultFound, ValidationError) as e:
+            logger.error(f"Embedded request failed: {e}")
+            return None
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {e}")
+            return None
+
+    @classmethod
+    async def _authenticate(cls, session, tg_user: TgUser) -> tuple[UserInDB, bool]:
+        """
+        Пользователь бота и флаг, создан ли он сейчас; занятое имя — HTTPException 409.
+        """
+        user, created = await UserCRUD(session).get_or_create_bot_user(tg_user.id, tg_user.username)
+        cls.user_ids[tg_user.id] = user.id
+        if len(cls.user_ids) > config.BOT_TOKEN_CACHE_SIZE:
+            cls.user_ids.popitem(last=False)
+        return user, created
+
+    @classmethod
+    async def create_habit_log(cls, tg_user: TgUser, habit_id: int, log_data: Dict[str, Any]) -> dict | None:
+        async def operation(session, user):
+            new_log = await HabitLogCRUD(session).create_habit_log(
+                user.id, habit_id, user_today(user), HabitLogCreate(**log_data)
+            )
+            return log_to_dict(new_log)
+
+        return await cls._call(tg_user, operation)
+
+    @classmethod
+    async def create_habit_logs_batch(cls, tg_user: TgUser, logs: List[Dict[str, Any]]) -> list | None:
+        async def operation(session, user):
+            batch = HabitLogBatchCreate(logs=logs)
+            today = user_today(user)
+            check_log_date(batch.log_date or today, today)
+            new_logs = await HabitLogCRUD(session).create_habit_logs_batch(
+                user.id, batch.log_date or today, batch.logs
+            )
+            return [log_to_dict(log) for log in new_logs]
+
+        return await cls._call(tg_user, operation)
+
+    @classmethod
+    async def update_habit(cls, tg_user: TgUser, habit_id: int, habit_update: dict) -> dict | None:
+        async def operation(session, user):
+            update = HabitUpdate(**habit_update)
+            updated_habit = await HabitCRUD(session).update_habit(
+                habit_id=habit_id,
+                user_id=user.id,
+                name=update.name,
+                description=update.description,
+                target_days=update.target_days,
+                streak_days=update.streak_days,
+                start_date=update.start_date,
+                is_tracked=update.is_tracked
+            )
+            return HabitUpdate.model_validate(updated_habit).model_dump(mode="json")
+
+        return await cls._call(tg_user, operation)
+
+    @classmethod
+    async def update_settings(cls, tg_user: TgUser, settings: dict) -> dict | None:
+        async def operation(session, user):
+            update = UserSettingsUpdate(**settings)
+            if update.timezone is not None:
+                try:
+                    ZoneInfo(update.timezone)
+                except (ZoneInfoNotFoundError, ValueError):
+                    return None
+
+            user = await UserCRUD(session).update_settings(user, update.timezone, update.reminder_time)
+            return UserSettingsResponse(
+                timezone=user.timezone,
+                reminder_time=time(hour=user.reminder_minute // 60, minute=user.reminder_minute % 60)
+            ).model_dump(mode="json")
+
+        return await cls._call(tg_user, operation)
+
+    @classmethod
+    async def get_unlogged_habits(cls, tg_user: TgUser) -> list | None:
+        async def operation(session, user):
+            habits = await HabitCRUD(session).get_unlogged_tracked_habits(user.id, user_today(user))
+            return [habit_to_dict(habit) for habit in habits]
+
+        return await cls._call(tg_user, operation)
+
+    @classmethod
+    async def get_habits(cls, tg_user: TgUser) -> list | None:
+        async def operation(session, user):
+            habits = await HabitCRUD(session).get_habits_by_user(user.id)
+            return [habit_to_dict(habit) for habit in habits]
+
+        return await cls._call(tg_user, operation)
+
+    @classmethod
+    async def delete_habit(cls, tg_user: TgUser, habit_id: int) -> dict | None:
+        async def operation(session, user):
+            await HabitCRUD(session).delete_habit(habit_id, user.id)
+            return {"detail": "Habit deleted successfully"}
+
+        return await cls._call(tg_user, operation)
+
+    @classmethod
+    async def create_habit(cls, tg_user: TgUser, habit_data: dict) -> dict | None:
+        async def operation(session, user):
+            habit = HabitCreate(**habit_data)
+            new_habit = await HabitCRUD(session).create_habit(
+                user_id=user.id,
+                name=habit.name,
+                description=habit.description,
+                target_days=habit.target_days,
+                streak_days=habit.streak_days,
+                start_date=habit.start_date,
+                last_streak_start=habit.last_streak_start,
+                current_streak=habit.current_streak,
+                total_completed=habit.total_completed,
+                is_tracked=habit.is_tracked
+            )
+            return habit_to_dict(new_habit)
+
+        return await cls._call(tg_user, operation)
+
+    @classmethod
+    async def register_user(cls, tg_user: TgUser) -> str | None:
+        try:
+            async with unit_of_work() as session:
+                user, _ = await cls._authenticate(session, tg_user)
+        except HTTPException as e:
+            logger.error(f"Registration failed: {e.detail}")
+            return None
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {e}")
+            return None
+        return user.username
+
+    @classmethod
+    async def authenticate_user(cls, tg_user: TgUser) -> dict | None:
+        try:
+            async with unit_of_work() as session:
+                user, created = await cls._authenticate(session, tg_user)
+        except HTTPException as e:
+            # В том числе 503 от перегруженного пула bcrypt при привязке прежнего пользователя с паролем
+            logger.error(f"Authentication failed: {e.detail}")
+            return None
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {e}")
+            return None
+        return {"username": user.username, "created": created}
@@ -1,88 +1,276 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from typing import Any, List, Dict
 
-from aiogram.client.session import aiohttp
-from aiohttp import ClientResponseError, ClientConnectorError
+import aiohttp
+from aiogram.types import User as TgUser
+from aiohttp import ClientResponseError, ClientConnectorError, ClientTimeout, TCPConnector, UnixConnector
+from jose import jwt, JWTError
 
+from api.auth import AuthService
 from config import config
 
 from loguru import logger
 
 
-class User:
+@dataclass
+class TokenEntry:
+    """
+    Токены одного пользователя Telegram и сроки их действия (unix time).
+    """
     access_token: str | None = None
     refresh_token: str | None = None
-    token_type: str | None = None
+    token_type: str = "bearer"
+    access_expires_at: float = 0.0
+    refresh_expires_at: float = 0.0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    def set_tokens(self, response: dict) -> None:
+        self.access_token = response.get("access_token")
+        self.token_type = response.get("token_type") or "bearer"
+        self.access_expires_at = token_expiry(self.access_token)
+        if response.get("refresh_token"):
+            self.refresh_token = response["refresh_token"]
+            self.refresh_expires_at = token_expiry(self.refresh_token)
+
+    @property
+    def header(self) -> dict[str, str]:
+        return {"Authorization": f"{self.token_type} {self.access_token}"}
+
+
+class TokenStore:
+    """
+    Ограниченный LRU-кэш токенов по ID пользователя Telegram.
+    """
+
+    def __init__(self, maxsize: int = config.BOT_TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[int, TokenEntry] = OrderedDict()
+
+    def get(self, tg_id: int) -> TokenEntry:
+        """
+        Возвращает запись пользователя, создавая пустую при отсутствии.
+        """
+        entry = self._entries.get(tg_id)
+        if entry is None:
+            entry = self._entries[tg_id] = TokenEntry()
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(tg_id)
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def parse_api_url(url: str) -> tuple[str, str | None]:
+    """
+    Разбирает адрес API: для `unix:///path/to/api.sock` возвращает базовый URL для
+    заголовка Host и путь к сокету, для обычного http(s) URL — сам URL и None.
+    """
+    if url.startswith("unix://"):
+        return "http://localhost", url[len("unix://"):]
+    return url.rstrip("/"), None
+
+
+def token_expiry(token: str | None) -> float:
+    """
+    Время истечения JWT по полю `exp`; подпись проверяет сервер, бот ее не проверяет.
+    """
+    if not token:
+        return 0.0
+    try:
+        return float(jwt.get_unverified_claims(token).get("exp", 0))
+    except JWTError:
+        return 0.0
+
+
+class HttpUser:
+    """
+    Клиент API от имени пользователя Telegram.
+
+    Токены хранятся отдельно для каждого пользователя в `tokens`. Access token
+    обновляется через /refresh-token заранее, за `config.BOT_TOKEN_REFRESH_MARGIN_SECONDS`
+    до истечения; полный вход через /token выполняется, только если истек и refresh token.
+    """
+    tokens = TokenStore()
+    session: aiohttp.ClientSession | None = None
+    base_url, socket_path = parse_api_url(config.URL)
+
+    idempotent_methods = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+    retry_statuses = frozenset({502, 503, 504})
+
+    @classmethod
+    async def startup(cls) -> None:
+        """
+        Создает общую для процесса сессию с пулом keep-alive соединений к API.
+
+        Если config.URL задан как unix://, соединения идут через Unix-сокет вместо TCP.
+        """
+        if cls.session is None or cls.session.closed:
+            if cls.socket_path:
+                connector = UnixConnector(
+                    path=cls.socket_path,
+                    limit=config.API_POOL_LIMIT,
+                    keepalive_timeout=config.API_KEEPALIVE_SECONDS,
+                )
+            else:
+                connector = TCPConnector(
+                    limit=config.API_POOL_LIMIT,
+                    keepalive_timeout=config.API_KEEPALIVE_SECONDS,
+                    ttl_dns_cache=config.API_DNS_CACHE_SECONDS,
+                )
+            timeout = ClientTimeout(total=config.API_TIMEOUT_SECONDS, connect=config.API_CONNECT_TIMEOUT_SECONDS)
+            cls.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        if cls.session is not None:
+            await cls.session.close()
+            cls.session = None
+
+    @classmethod
+    async def _send(cls, url: str, method: str = "POST", data: dict = None, json_data: dict = None,
+                    headers: dict = None, timeout: float = None) -> tuple[int | None, Any]:
+        """
+        Отправляет HTTP-запрос через общую сессию и возвращает код ответа и тело (None при ошибке).
+
+        Идемпотентные методы повторяются при сетевых ошибках и ответах 502/503/504
+        с экспоненциальной задержкой и случайным разбросом.
+        """
+        await cls.startup()
+        attempts = 1 + (config.API_RETRIES if method.upper() in cls.idempotent_methods else 0)
+        request_timeout = ClientTimeout(total=timeout) if timeout else None
+
+        status, body = None, None
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(random.uniform(0, config.API_RETRY_BACKOFF_SECONDS * 2 ** attempt))
+
+            status, body = await cls._send_once(url, method, data, json_data, headers, request_timeout)
+            if status is not None and status not in cls.retry_statuses:
+                break
+
+        return status, body
+
+    @classmethod
+    async def _send_once(cls, url: str, method: str, data: dict | None, json_data: dict | None,
+                         headers: dict | None, timeout: ClientTimeout | None) -> tuple[int | None, Any]:
+        try:
+            async with cls.session.request(method, url, data=data, json=json_data, headers=headers,
+                                           timeout=timeout) as response:
+                if response.status == 200:
+                    return response.status, await response.json()
+                else:
+                    logger.error(f"Failed request to {url}. Status code: {response.status}")
+                    return response.status, None
+        except ClientConnectorError:
+            logger.error(f"Connection error: Unable to connect to {url}.")
+            return None, None
+        except TimeoutError:
+            logger.error(f"Request to {url} timed out.")
+            return None, None
+        except ClientResponseError as e:
+            logger.error(f"Client response error: {e.status} - {e.message}")
+            return None, None
+        except Exception as e:
+            logger.error(f"An unexpected error occurred: {str(e)}")
+            return None, None
 
     @classmethod
     async def _make_request(cls, url: str, method: str = "POST", data: dict = None, json_data: dict = None,
-                            headers: dict = None) -> dict | None:
+                            headers: dict = None, timeout: float = None) -> dict | None:
         """
         Унифицированный метод для отправки HTTP-запросов.
         """
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.request(method, url, data=data, json=json_data, headers=headers) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    else:
-                        logger.error(f"Failed request to {url}. Status code: {response.status}")
-                        return None
-            except ClientConnectorError:
-                logger.error(f"Connection error: Unable to connect to {url}.")
-                return None
-            except TimeoutError:
-                logger.error(f"Request to {url} timed out.")
-                return None
-            except ClientResponseError as e:
-                logger.error(f"Client response error: {e.status} - {e.message}")
-                return None
-            except Exception as e:
-                logger.error(f"An unexpected error occurred: {str(e)}")
-                return None
-
-    @classmethod
-    def get_auth_header(cls) -> dict[str, str]:
-        """
-        Возвращает заголовок Authorization с токеном.
-        """
-        if cls.access_token and cls.token_type:
-            return {"Authorization": f"{cls.token_type} {cls.access_token}"}
+        _, body = await cls._send(url, method=method, data=data, json_data=json_data, headers=headers,
+                                  timeout=timeout)
+        return body
+
+    @classmethod
+    async def _authorized_request(cls, tg_user: TgUser, url: str, method: str = "GET",
+                                  json_data: dict | list = None, timeout: float = None) -> Any:
+        """
+        Отправляет запрос с токеном пользователя; при ответе 401 один раз получает новый токен и повторяет.
+        """
+        headers = await cls.get_auth_header(tg_user)
+        status, body = await cls._send(url, method=method, json_data=json_data, headers=headers, timeout=timeout)
+
+        if status == 401:
+            cls.tokens.get(tg_user.id).access_expires_at = 0.0
+            headers = await cls.get_auth_header(tg_user)
+            status, body = await cls._send(url, method=method, json_data=json_data, headers=headers,
+                                           timeout=timeout)
+
+        return body
+
+    @classmethod
+    async def get_auth_header(cls, tg_user: TgUser) -> dict[str, str]:
+        """
+        Возвращает заголовок Authorization с действующим токеном пользователя.
+        """
+        entry = cls.tokens.get(tg_user.id)
+
+        async with entry.lock:
+            now = time.time()
+            if entry.access_token and entry.access_expires_at - config.BOT_TOKEN_REFRESH_MARGIN_SECONDS > now:
+                return entry.header
+
+            if entry.refresh_token and entry.refresh_expires_at > now:
+                if await cls.refresh_token_tg(tg_user, entry.refresh_token):
+                    return entry.header
+
+            if await cls.authenticate_user(tg_user):
+                return entry.header
+
         return {}
 
     @classmethod
-    async def create_habit_log(cls, habit_id: int, log_data: Dict[str, Any]) -> dict | None:
+    async def create_habit_log(cls, tg_user: TgUser, habit_id: int, log_data: Dict[str, Any]) -> dict | None:
         """
         Отправляет запрос на создание записи о выполнении привычки.
 
+        :param tg_user: Пользователь Telegram, от имени которого выполняется запрос.
         :param habit_id: ID привычки.
         :param log_data: Данные для записи о выполнении привычки (например, {'completed': True}).
         :return: Ответ сервера или None, если ошибка.
         """
 
-        headers = cls.get_auth_header()
-
         # Отправляем запрос на создание записи о выполнении привычки
-        return await cls._make_request(f"{config.URL}/habits/{habit_id}/logs",
-                                       method="POST", json_data=log_data, headers=headers)
+        return await cls._authorized_request(tg_user, f"{cls.base_url}/habits/{habit_id}/logs",
+                                             method="POST", json_data=log_data)
 
     @classmethod
-    async def update_habit(cls, habit_id: int, habit_update: dict) -> dict | None:
+    async def create_habit_logs_batch(cls, tg_user: TgUser, logs: List[Dict[str, Any]]) -> list | None:
+        """
+        Отправляет одним запросом отметки о выполнении сразу для нескольких привычек.
+
+        :param tg_user: Пользователь Telegram, от имени которого выполняется запрос.
+        :param logs: Список отметок, например [{'habit_id': 1, 'completed': True}, ...].
+        :return: Список созданных записей или None, если ошибка.
+        """
+
+        return await cls._authorized_request(tg_user, f"{cls.base_url}/habits/logs/batch",
+                                             method="POST", json_data={"logs": logs})
+
+    @classmethod
+    async def update_habit(cls, tg_user: TgUser, habit_id: int, habit_update: dict) -> dict | None:
         """
         Метод для обновления привычки.
 
+        :param tg_user: Пользователь Telegram, от имени которого выполняется запрос.
         :param habit_id: Идентификатор привычки, которую нужно обновить.
         :param habit_update: Словарь с обновляемыми данными привычки.
         :return: Обновленная привычка в виде словаря, если запрос успешен, иначе None.
         """
 
-        headers = {
-            "Authorization": f"{cls.token_type} {cls.access_token}",
-            "Content-Type": "application/json"
-        }
-
         # Отправляем запрос на обновление привычки с обновленными данными в формате JSON
-        response = await cls._make_request(f"{config.URL}/habits/{habit_id}", method="PUT", json_data=habit_update,
-                                           headers=headers)
+        response = await cls._authorized_request(tg_user, f"{cls.base_url}/habits/{habit_id}", method="PUT",
+                                                 json_data=habit_update)
 
         if response:
             logger.info(f"Habit {habit_id} successfully updated.")
@@ -92,92 +280,117 @@ class User:
             return None
 
     @classmethod
-    async def get_unlogged_habits(cls) -> dict | None:
+    async def update_settings(cls, tg_user: TgUser, settings: dict) -> dict | None:
         """
-        Метод для получения всех привычек текущего пользователя.
+        Метод для обновления часового пояса и времени напоминания.
+
+        :param tg_user: Пользователь Telegram, от имени которого выполняется запрос.
+        :param settings: Словарь вида {'timezone': 'Europe/Moscow', 'reminder_time': '21:00'}.
+        :return: Сохраненные настройки, если запрос успешен, иначе None.
         """
 
-        headers = cls.get_auth_header()
-        response = await cls._make_request(f"{config.URL}/unlogged_habits", method="GET", headers=headers)
-        if response:
-            return response
-        return None
+        return await cls._authorized_request(tg_user, f"{cls.base_url}/users/me/settings", method="PUT",
+                                             json_data=settings)
 
     @classmethod
-    async def get_habits(cls) -> dict | None:
+    async def get_unlogged_habits(cls, tg_user: TgUser) -> list | None:
+        """
+        Метод для получения неотмеченных за сегодня привычек пользователя.
+        """
+
+        return await cls._authorized_request(tg_user, f"{cls.base_url}/unlogged_habits", method="GET")
+
+    @classmethod
+    async def get_habits(cls, tg_user: TgUser) -> list | None:
         """
         Метод для получения всех привычек текущего пользователя.
         """
 
-        headers = cls.get_auth_header()
-        response = await cls._make_request(f"{config.URL}/habits", method="GET", headers=headers)
-        if response:
-            return response
-        return None
+        return await cls._authorized_request(tg_user, f"{cls.base_url}/habits", method="GET")
 
     @classmethod
-    async def delete_habit(cls, habit_id: int) -> dict | None:
+    async def delete_habit(cls, tg_user: TgUser, habit_id: int) -> dict | None:
         """
         Метод для удаления привычки по идентификатору.
         """
 
-        headers = cls.get_auth_header()
-        return await cls._make_request(f"{config.URL}/habits/{habit_id}", method="DELETE", headers=headers)
+        return await cls._authorized_request(tg_user, f"{cls.base_url}/habits/{habit_id}", method="DELETE")
 
     @classmethod
-    async def create_habit(cls, habit_data: dict) -> dict | None:
+    async def create_habit(cls, tg_user: TgUser, habit_data: dict) -> dict | None:
         """
         Метод для создания новой привычки через запрос к API.
         """
 
-        headers = {
-            "Authorization": f"{cls.token_type} {cls.access_token}",
-            "Content-Type": "application/json"
-        }
-        return await cls._make_request(f"{config.URL}/habits", method="POST", json_data=habit_data, headers=headers)
+        return await cls._authorized_request(tg_user, f"{cls.base_url}/habits", method="POST", json_data=habit_data)
 
     @classmethod
-    async def register_user(cls, username: str, chat_id: int) -> str | None:
+    async def register_user(cls, tg_user: TgUser) -> str | None:
         """
-        Регистрирует пользователя и возвращает токен доступа.
+        Регистрирует пользователя и сохраняет его токены.
         """
-        payload = {"username": username, "password": str(chat_id)}
-        response = await cls._make_request(f"{config.URL}/register", json_data=payload)
+        payload = {"username": tg_user.username, "password": str(tg_user.id)}
+        response = await cls._make_request(f"{cls.base_url}/register", json_data=payload)
         if response:
-            cls.access_token = response.get("access_token")
-            cls.token_type = response.get("token_type")
-            cls.refresh_token = response.get("refresh_token")
-            return cls.access_token
+            entry = cls.tokens.get(tg_user.id)
+            entry.set_tokens(response)
+            return entry.access_token
         return None
 
     @classmethod
-    async def authenticate_user(cls, username: str, chat_id: int) -> dict | None:
+    async def authenticate_user(cls, tg_user: TgUser) -> dict | None:
         """
         Аутентифицирует пользователя и сохраняет токены.
+
+        При заданном BOT_SHARED_SECRET входит через /token/bot подписью вместо пароля;
+        такой вход создает пользователя, если его еще нет (в ответе `created`).
         """
+        if config.BOT_SHARED_SECRET:
+            return await cls.authenticate_bot(tg_user)
+
         data = {
-            'username': username,
-            'password': str(chat_id),
+            'username': tg_user.username,
+            'password': str(tg_user.id),
         }
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-        response = await cls._make_request(f"{config.URL}/token", data=data, headers=headers)
+        response = await cls._make_request(f"{cls.base_url}/token", data=data, headers=headers)
+        if response:
+            cls.tokens.get(tg_user.id).set_tokens(response)
+            return response
+        return None
+
+    @classmethod
+    async def authenticate_bot(cls, tg_user: TgUser) -> dict | None:
+        """
+        Получает токены через /token/bot по HMAC-подписи ID пользователя Telegram.
+        """
+        issued_at = int(time.time())
+        payload = {
+            "telegram_id": tg_user.id,
+            "username": tg_user.username,
+            "issued_at": issued_at,
+            "signature": AuthService.bot_assertion_signature(tg_user.id, tg_user.username, issued_at),
+        }
+        response = await cls._make_request(f"{cls.base_url}/token/bot", json_data=payload)
         if response:
-            cls.access_token = response.get("access_token")
-            cls.refresh_token = response.get("refresh_token")
-            cls.token_type = response.get("token_type")
+            cls.tokens.get(tg_user.id).set_tokens(response)
             return response
         return None
 
     @classmethod
-    async def refresh_token_tg(cls, refresh_token: str) -> dict | None:
+    async def refresh_token_tg(cls, tg_user: TgUser, refresh_token: str) -> dict | None:
         """
         Обновляет токен доступа и сохраняет новый.
         """
         payload = {"refresh_token": refresh_token}
-        response = await cls._make_request(f"{config.URL}/refresh-token", json_data=payload)
+        response = await cls._make_request(f"{cls.base_url}/refresh-token", json_data=payload)
         if response:
-            cls.access_token = response.get("access_token")
-            cls.refresh_token = response.get("refresh_token")
+            cls.tokens.get(tg_user.id).set_tokens(response)
             return response
         return None
 
+
+if config.BOT_TRANSPORT == "embedded":
+    from TG.embedded import EmbeddedUser as User
+else:
+    User = HttpUser
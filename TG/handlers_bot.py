@@ -18,7 +18,7 @@ from TG.keyboards.InlineKeyboard import (get_habit_choice_keyboard, useful_habit
                                          nutrition_habit_keyboard, update_habits_keyboard,
                                          create_habits_inline_keyboard, create_change_fields_keyboard,
                                          track_habit_keyboard, create_track_habits_inline_keyboard,
-                                         completion_marks_keyboard)
+                                         completion_marks_keyboard, create_batch_habits_inline_keyboard)
 from TG.keyboards.ReplyKeyboard import get_main_menu_keyboard
 
 router = Router()
@@ -32,31 +32,25 @@ user_messages = {}
 @router.message(CommandStart())
 async def command_start_handler(message: Message):
     user = message.from_user
-    username = user.username
-    chat_id = message.chat.id
 
-    auth_response = await User.authenticate_user(username, chat_id)
+    auth_response = await User.authenticate_user(user)
     logger.debug(f"Auth response: {auth_response}")
 
-    if auth_response:
-        # Сохранение токенов после успешной аутентификации
-        User.access_token = auth_response.get("access_token")
-        User.refresh_token = auth_response.get("refresh_token")
-        User.token_type = auth_response.get("token_type")
-
+    if auth_response and auth_response.get("created"):
+        # Вход через /token/bot сразу регистрирует нового пользователя
+        await message.answer(f"Вы успешно зарегистрированы!",
+                             reply_markup=get_main_menu_keyboard())
+        logger.info(f"User {user.full_name} registered by bot assertion.")
+    elif auth_response:
         await message.answer(f"Добро пожаловать обратно, {user.full_name}!",
                              reply_markup=get_main_menu_keyboard())
         logger.info(f"User {user.full_name} successfully authenticated.")
     else:
         # Если аутентификация не удалась, регистрируем нового пользователя
-        reg_response = await User.register_user(username, chat_id)
+        reg_response = await User.register_user(user)
         logger.debug(f"Registration response: {reg_response}")
 
         if reg_response:
-            # Сохранение токенов после успешной регистрации
-            User.access_token = reg_response
-            User.refresh_token = None
-            User.token_type = "Bearer"
             await message.answer(f"Вы успешно зарегистрированы!",
                                  reply_markup=get_main_menu_keyboard())
             logger.info(f"User {user.full_name} registered with token.")
@@ -95,9 +89,7 @@ async def handle_habit_choice(message: Message, state: FSMContext):
     await message.delete()
     await state.set_state(HabitStates.statistics)
 
-    if not (habits := await User.get_habits()):
-        await User.authenticate_user(message.from_user.username, message.chat.id)
-        habits = await User.get_habits()
+    habits = await User.get_habits(message.from_user)
 
     if habits:
         tracked_habits = [habit for habit in habits if habit.is_tracked == True]
@@ -119,6 +111,45 @@ async def handle_habit_choice(message: Message, state: FSMContext):
 
 
 
+"""
+Блок настройки оповещений.
+"""
+
+
+@router.message(lambda message: message.text == "🔔 Настройка оповещений")
+async def handle_notification_settings(message: Message, state: FSMContext):
+    await message.delete()
+    await state.set_state(HabitStates.notification_settings)
+
+    await bot.send_message(
+        chat_id=message.chat.id,
+        text="Введите часовой пояс и время напоминания, например: Europe/Moscow 21:00",
+        reply_markup=ForceReply()
+    )
+
+
+@router.message(StateFilter(HabitStates.notification_settings))
+async def process_notification_settings(message: Message, state: FSMContext):
+    try:
+        timezone, reminder_time = message.text.split()
+    except (AttributeError, ValueError):
+        await message.answer("Неверный формат. Пример: Europe/Moscow 21:00")
+        return
+
+    settings = {"timezone": timezone, "reminder_time": reminder_time}
+
+    response = await User.update_settings(message.from_user, settings)
+
+    if response:
+        await message.answer(
+            f"🔔 Напоминания будут приходить в {response['reminder_time'][:5]} ({response['timezone']}).",
+            reply_markup=get_main_menu_keyboard()
+        )
+        await state.clear()
+    else:
+        await message.answer("Не удалось сохранить настройки. Проверьте часовой пояс и время.")
+
+
 """
 Блок отметок о выполнении.
 """
@@ -139,48 +170,26 @@ async def handle_habit_choice(message: Message, state: FSMContext):
 
 @router.callback_query(F.data == "completed", StateFilter(HabitStates.execution))
 async def handle_completed_habit(callback: CallbackQuery, state: FSMContext):
-    habits = await User.get_unlogged_habits()
+    habits = await User.get_unlogged_habits(callback.from_user)
     await state.set_state(HabitStates.execution_habit)
-    if habits:
-        keyb = create_habits_inline_keyboard(habits)
-        await bot.send_message(
-            chat_id=callback.message.chat.id,
-            text="Выберите выполненную привычку:",
-            reply_markup=keyb
-        )
-    else:
-
-        await User.authenticate_user(callback.from_user.username, callback.message.chat.id)
-        habits = await User.get_unlogged_habits()
-        keyb = create_habits_inline_keyboard(habits)
-        await bot.send_message(
-            chat_id=callback.message.chat.id,
-            text="Выберите выполненную привычку:",
-            reply_markup=keyb
-        )
+    keyb = create_habits_inline_keyboard(habits)
+    await bot.send_message(
+        chat_id=callback.message.chat.id,
+        text="Выберите выполненную привычку:",
+        reply_markup=keyb
+    )
 
 
 @router.callback_query(F.data == "not_fulfill", StateFilter(HabitStates.execution))
 async def handle_completed_habit(callback: CallbackQuery, state: FSMContext):
-    habits = await User.get_unlogged_habits()
+    habits = await User.get_unlogged_habits(callback.from_user)
     await state.set_state(HabitStates.not_completed)
-    if habits:
-        keyb = create_habits_inline_keyboard(habits)
-        await bot.send_message(
-            chat_id=callback.message.chat.id,
-            text="Выберите не выполненную привычку:",
-            reply_markup=keyb
-        )
-    else:
-
-        await User.authenticate_user(callback.from_user.username, callback.message.chat.id)
-        habits = await User.get_unlogged_habits()
-        keyb = create_habits_inline_keyboard(habits)
-        await bot.send_message(
-            chat_id=callback.message.chat.id,
-            text="Выберите не выполненную привычку:",
-            reply_markup=keyb
-        )
+    keyb = create_habits_inline_keyboard(habits)
+    await bot.send_message(
+        chat_id=callback.message.chat.id,
+        text="Выберите не выполненную привычку:",
+        reply_markup=keyb
+    )
 
 
 @router.callback_query(F.data.startswith("habit_"), StateFilter(HabitStates.execution_habit, HabitStates.not_completed))
@@ -188,9 +197,10 @@ async def handle_delete_habit(callback: CallbackQuery, state: FSMContext):
 
     habit_id = int(callback.data.split("_")[-1])
 
-    if state == HabitStates.execution_habit:
+    current_state = await state.get_state()
+    if current_state == HabitStates.execution_habit.state:
         log_data = {'completed': True}
-    elif state == HabitStates.not_completed:
+    elif current_state == HabitStates.not_completed.state:
         log_data = {'completed': False}
     else:
         await callback.message.answer(
@@ -199,7 +209,7 @@ async def handle_delete_habit(callback: CallbackQuery, state: FSMContext):
         )
         return
 
-    result = await User.create_habit_log(habit_id, log_data)
+    result = await User.create_habit_log(callback.from_user, habit_id, log_data)
 
     if result:
 
@@ -213,29 +223,82 @@ async def handle_delete_habit(callback: CallbackQuery, state: FSMContext):
         await state.clear()
     else:
 
-        await User.authenticate_user(callback.from_user.username, callback.message.chat.id)
-        result = await User.create_habit_log(habit_id, log_data)
+        await callback.message.answer(
+            "❌ Не удалось отметить выполнение привычки. Пожалуйста, попробуйте снова позже.",
+            reply_markup=None
+        )
+
 
-        if result:
+@router.callback_query(F.data == "batch", StateFilter(HabitStates.execution))
+async def handle_batch_habits(callback: CallbackQuery, state: FSMContext):
+    habits = await User.get_unlogged_habits(callback.from_user)
 
-            await callback.message.answer(
-                "✅ Вы успешно отметили выполнение привычки!",
-                reply_markup=None
-            )
+    if not habits:
+        await callback.message.answer("Все привычки на сегодня уже отмечены.")
+        return
 
-            await callback.message.delete()
+    batch_habits = [{"id": habit["id"], "name": habit["name"]} for habit in habits]
+    await state.update_data(batch_habits=batch_habits, batch_selected=[])
+    await state.set_state(HabitStates.batch_execution)
 
-            await state.clear()
-        else:
+    await bot.send_message(
+        chat_id=callback.message.chat.id,
+        text="Отметьте выполненные привычки:",
+        reply_markup=create_batch_habits_inline_keyboard(batch_habits, [])
+    )
 
-            await callback.message.answer(
-                "❌ Не удалось отметить выполнение привычки. Пожалуйста, попробуйте снова позже.",
-                reply_markup=None
-            )
+
+@router.callback_query(F.data.startswith("batch_toggle_"), StateFilter(HabitStates.batch_execution))
+async def handle_batch_toggle(callback: CallbackQuery, state: FSMContext):
+    habit_id = int(callback.data.split("_")[-1])
+
+    user_data = await state.get_data()
+    selected = user_data.get("batch_selected", [])
+    if habit_id in selected:
+        selected.remove(habit_id)
+    else:
+        selected.append(habit_id)
+    await state.update_data(batch_selected=selected)
+
+    await callback.message.edit_reply_markup(
+        reply_markup=create_batch_habits_inline_keyboard(user_data.get("batch_habits", []), selected)
+    )
+
+
+@router.callback_query(F.data.in_({"batch_all", "batch_submit"}), StateFilter(HabitStates.batch_execution))
+async def handle_batch_submit(callback: CallbackQuery, state: FSMContext):
+    user_data = await state.get_data()
+
+    if callback.data == "batch_all":
+        habit_ids = [habit["id"] for habit in user_data.get("batch_habits", [])]
+    else:
+        habit_ids = user_data.get("batch_selected", [])
+
+    if not habit_ids:
+        await callback.answer("Не выбрано ни одной привычки.")
+        return
+
+    logs = [{"habit_id": habit_id, "completed": True} for habit_id in habit_ids]
+
+    result = await User.create_habit_logs_batch(callback.from_user, logs)
+
+    if result is not None:
+        await callback.message.answer(
+            f"✅ Отмечено привычек: {len(result)}",
+            reply_markup=None
+        )
+        await callback.message.delete()
+        await state.clear()
+    else:
+        await callback.message.answer(
+            "❌ Не удалось отметить выполнение привычек. Пожалуйста, попробуйте снова позже.",
+            reply_markup=None
+        )
 
 
 @router.callback_query(F.data == "back",
-                       StateFilter(HabitStates.execution_habit, HabitStates.not_completed
+                       StateFilter(HabitStates.execution_habit, HabitStates.not_completed,
+                                   HabitStates.batch_execution
                                    )
                        )
 async def handle_back(callback: CallbackQuery, state: FSMContext):
@@ -334,7 +397,7 @@ async def process_habit_days(message: Message, state: FSMContext):
 
     user_id = message.from_user.id
     # Пытаемся создать привычку через API
-    result = await User.create_habit(habit_data)
+    result = await User.create_habit(message.from_user, habit_data)
     if result:
 
         if user_id in user_messages:
@@ -358,30 +421,7 @@ async def process_habit_days(message: Message, state: FSMContext):
         else:
             user_messages[user_id] = [success_msg.message_id]
     else:
-
-        await User.authenticate_user(message.from_user.username, message.chat.id)
-        result = await User.create_habit(habit_data)
-        if result:
-
-            if user_id in user_messages:
-                for msg_id in user_messages[user_id]:
-                    await bot.delete_message(chat_id=message.chat.id, message_id=msg_id)
-
-                del user_messages[user_id]
-
-            success_msg = await bot.send_message(
-                chat_id=message.chat.id,
-                text=f"Привычка '{habit_name}' будет отслеживаться {days} дней.",
-                reply_markup=get_main_menu_keyboard()
-            )
-
-            if user_id in user_messages:
-                user_messages[user_id].append(success_msg.message_id)
-                user_messages[user_id].append(message.message_id)
-            else:
-                user_messages[user_id] = [success_msg.message_id]
-        else:
-            await bot.send_message(message.chat.id, f"Неизвестная ошибка")
+        await bot.send_message(message.chat.id, f"Неизвестная ошибка")
 
     await state.set_state(HabitStates.main_menu)
 
@@ -392,47 +432,26 @@ async def process_habit_days(message: Message, state: FSMContext):
 
 @router.callback_query(F.data == "delete", StateFilter(HabitStates.update_habits_menu))
 async def handle_update_habits(callback: CallbackQuery, state: FSMContext):
-    habits = await User.get_habits()
-    if habits:
+    habits = await User.get_habits(callback.from_user)
 
-        await switch_keyboard(callback, state, HabitStates.habits_menu, lambda: create_habits_inline_keyboard(habits))
-    else:
-
-        await User.authenticate_user(callback.from_user.username, callback.message.chat.id)
-        habits = await User.get_habits()
-
-        await switch_keyboard(callback, state, HabitStates.habits_menu, lambda: create_habits_inline_keyboard(habits))
+    await switch_keyboard(callback, state, HabitStates.habits_menu, lambda: create_habits_inline_keyboard(habits))
 
 
 @router.callback_query(F.data == "change", StateFilter(HabitStates.update_habits_menu))
 async def handle_update_habits(callback: CallbackQuery, state: FSMContext):
-    habits = await User.get_habits()
-    if habits:
+    habits = await User.get_habits(callback.from_user)
 
-        await switch_keyboard(callback, state, HabitStates.habits_change_menu, lambda: create_habits_inline_keyboard(habits))
-    else:
-
-        await User.authenticate_user(callback.from_user.username, callback.message.chat.id)
-        habits = await User.get_habits()
-
-        await switch_keyboard(callback, state, HabitStates.habits_change_menu, lambda: create_habits_inline_keyboard(habits))
+    await switch_keyboard(callback, state, HabitStates.habits_change_menu, lambda: create_habits_inline_keyboard(habits))
 
 
 @router.callback_query(F.data.startswith("habit_"), StateFilter(HabitStates.habits_menu))
 async def handle_delete_habit(callback: CallbackQuery, state: FSMContext):
     habit_id = int(callback.data.split("_")[-1])
 
-    result = await User.delete_habit(habit_id)
-
-    if result:
-
-        habits = await User.get_habits()
-        await switch_keyboard(callback, state, HabitStates.habits_menu, lambda: create_habits_inline_keyboard(habits))
-    else:
+    await User.delete_habit(callback.from_user, habit_id)
 
-        await User.authenticate_user(callback.from_user.username, callback.message.chat.id)
-        habits = await User.get_habits()
-        await switch_keyboard(callback, state, HabitStates.habits_menu, lambda: create_habits_inline_keyboard(habits))
+    habits = await User.get_habits(callback.from_user)
+    await switch_keyboard(callback, state, HabitStates.habits_menu, lambda: create_habits_inline_keyboard(habits))
 
 
 @router.callback_query(F.data.startswith("habit_"), StateFilter(HabitStates.habits_change_menu))
@@ -474,15 +493,10 @@ async def handle_new_value(message: Message, state: FSMContext):
 
     update_data = {field_to_change: new_value}
 
-    response = await User.update_habit(habit_id, update_data)
+    response = await User.update_habit(message.from_user, habit_id, update_data)
 
     if response:
         await message.answer(f"Поле {field_to_change} успешно обновлено!")
-    else:
-        await User.authenticate_user(message.from_user.username, message.chat.id)
-        response = await User.update_habit(habit_id, update_data)
-        if response:
-            await message.answer(f"Поле {field_to_change} успешно обновлено!")
 
 
 """
@@ -497,28 +511,16 @@ async def handle_track_habits(callback: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data == "begin", StateFilter(HabitStates.track_habit_menu))
 async def handle_begin_track_habits(callback: CallbackQuery, state: FSMContext):
-    habits = await User.get_habits()
-    if habits:
-        await switch_keyboard(callback, state, HabitStates.begin_track_habit,
-                              lambda: create_track_habits_inline_keyboard(habits, False))
-    else:
-        await User.authenticate_user(callback.from_user.username, callback.message.chat.id)
-        habits = await User.get_habits()
-        await switch_keyboard(callback, state, HabitStates.begin_track_habit,
-                              lambda: create_track_habits_inline_keyboard(habits, False))
+    habits = await User.get_habits(callback.from_user)
+    await switch_keyboard(callback, state, HabitStates.begin_track_habit,
+                          lambda: create_track_habits_inline_keyboard(habits, False))
 
 
 @router.callback_query(F.data == "cease", StateFilter(HabitStates.track_habit_menu))
 async def handle_cease_track_habits(callback: CallbackQuery, state: FSMContext):
-    habits = await User.get_habits()
-    if habits:
-        await switch_keyboard(callback, state, HabitStates.cease_track_habit,
-                              lambda: create_track_habits_inline_keyboard(habits, True))
-    else:
-        await User.authenticate_user(callback.from_user.username, callback.message.chat.id)
-        habits = await User.get_habits()
-        await switch_keyboard(callback, state, HabitStates.cease_track_habit,
-                              lambda: create_track_habits_inline_keyboard(habits, True))
+    habits = await User.get_habits(callback.from_user)
+    await switch_keyboard(callback, state, HabitStates.cease_track_habit,
+                          lambda: create_track_habits_inline_keyboard(habits, True))
 
 
 @router.callback_query(F.data.startswith("habit_"), StateFilter(HabitStates.begin_track_habit,
@@ -532,26 +534,16 @@ async def handle_back(callback: CallbackQuery, state: FSMContext):
             # Подготавливаем данные для обновления привычки
             update_data = {"is_tracked": True}
             # Логика обновления привычки в базе данных
-            response = await User.update_habit(habit_id, update_data)
-            if response:
-                await switch_keyboard(callback, state, HabitStates.main_menu, get_habit_choice_keyboard)
-            else:
-                await User.authenticate_user(callback.from_user.username, callback.message.chat.id)
-                response = await User.update_habit(habit_id, update_data)
-                await switch_keyboard(callback, state, HabitStates.main_menu, get_habit_choice_keyboard)
+            await User.update_habit(callback.from_user, habit_id, update_data)
+            await switch_keyboard(callback, state, HabitStates.main_menu, get_habit_choice_keyboard)
 
         case HabitStates.cease_track_habit.state:
             habit_id = int(callback.data.split("_")[-1])  # Извлекаем ID привычки из callback_data
             # Подготавливаем данные для обновления привычки
             update_data = {"is_tracked": False}
             # Логика обновления привычки в базе данных
-            response = await User.update_habit(habit_id, update_data)
-            if response:
-                await switch_keyboard(callback, state, HabitStates.main_menu, get_habit_choice_keyboard)
-            else:
-                await User.authenticate_user(callback.from_user.username, callback.message.chat.id)
-                response = await User.update_habit(habit_id, update_data)
-                await switch_keyboard(callback, state, HabitStates.main_menu, get_habit_choice_keyboard)
+            await User.update_habit(callback.from_user, habit_id, update_data)
+            await switch_keyboard(callback, state, HabitStates.main_menu, get_habit_choice_keyboard)
 
 
 @router.callback_query(F.data == "update_habits", StateFilter(HabitStates.main_menu))
@@ -672,7 +664,7 @@ async def handle_useful_habit(callback: CallbackQuery, state: FSMContext):
             "total_completed": 0
         }
         # Попытка создать привычку через метод User.create_habit
-        result = await User.create_habit(new_habit)
+        result = await User.create_habit(callback.from_user, new_habit)
 
         if result:
             # Уведомляем пользователя об успешном создании привычки
@@ -690,31 +682,9 @@ async def handle_useful_habit(callback: CallbackQuery, state: FSMContext):
             else:
                 user_messages[user_id] = [success_msg.message_id]
         else:
-            # Если токен неактуален, обновляем его
-            await User.authenticate_user(callback.from_user.username, callback.message.chat.id)
-            # Повторяем попытку создать привычку после обновления токена
-            result = await User.create_habit(new_habit)
-            if result:
-                # Уведомляем пользователя об успешном создании привычки
-                success_msg = await bot.send_message(
-                    chat_id=callback.message.chat.id,
-                    text=f"Привычка '{new_habit['name']}' создана и будет отслеживаться {new_habit['target_days']} дней.",
-                    reply_markup=get_main_menu_keyboard()  # Вернуть основное меню
-                )
-                if user_id in user_messages:
-                    del user_messages[user_id]
-                # Сохраняем ID сообщения в список для последующего удаления
-                if user_id in user_messages:
-                    user_messages[user_id].append(success_msg.message_id)
-                    user_messages[user_id].append(callback.message_id)
-                else:
-                    user_messages[user_id] = [success_msg.message_id]
-            else:
-                # Обработка неуспешного ответа от API
-                detail = result.get('detail', 'Неизвестная ошибка') if isinstance(result,
-                                                                                  dict) else "Неверный формат ответа от сервера."
-                await bot.send_message(
-                    chat_id=callback.message.chat.id,
-                    text=f"Не удалось создать привычку: {detail}."
-                )
+            # Обработка неуспешного ответа от API
+            await bot.send_message(
+                chat_id=callback.message.chat.id,
+                text="Не удалось создать привычку: неизвестная ошибка."
+            )
 
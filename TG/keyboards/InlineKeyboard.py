@@ -24,6 +24,8 @@ def completion_marks_keyboard() -> InlineKeyboardMarkup:
                               callback_data="completed")],
         [InlineKeyboardButton(text="❌ Я не выполнил!",
                               callback_data="not_fulfill")],
+        [InlineKeyboardButton(text="☑️ Отметить несколько",
+                              callback_data="batch")],
         [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")]
 
     ]
@@ -32,6 +34,28 @@ def completion_marks_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+def create_batch_habits_inline_keyboard(habits: list, selected: list) -> InlineKeyboardMarkup:
+    """
+    Создает инлайн-клавиатуру для отметки нескольких привычек за раз.
+
+    :param habits: Список неотмеченных привычек в формате словарей.
+    :param selected: Идентификаторы привычек, выбранных пользователем.
+    :return: Инлайн-клавиатура.
+    """
+    buttons = []
+
+    for habit in habits:
+        mark = "✅" if habit["id"] in selected else "⬜"
+        buttons.append([InlineKeyboardButton(text=f"{mark} {habit['name']}",
+                                             callback_data=f"batch_toggle_{habit['id']}")])
+
+    buttons.append([InlineKeyboardButton(text="✅ Выполнил все", callback_data="batch_all")])
+    buttons.append([InlineKeyboardButton(text="💾 Сохранить выбранные", callback_data="batch_submit")])
+    buttons.append([InlineKeyboardButton(text="🔄 Назад", callback_data="back")])
+
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
 def track_habit_keyboard() -> InlineKeyboardMarkup:
     kb = [
         [InlineKeyboardButton(text="➕ Начать отслеживать привычку",
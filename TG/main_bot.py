@@ -7,6 +7,7 @@ from TG.bot import dp, bot
 from loguru import logger
 
 
+from TG.funcs_tg import User
 from TG.handlers_bot import router
 from config import config
 
@@ -16,9 +17,11 @@ async def main() -> None:
     # Регистрация всех обработчиков
     logger.info("Бот запущен и готов к работе.")
     try:
+        await User.startup()
         dp.include_router(router)
         await dp.start_polling(bot)
     finally:
+        await User.shutdown()
         await bot.session.close()
         logger.info("Сессия бота закрыта.")
 
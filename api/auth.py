@@ -1,45 +1,299 @@
+import asyncio
+import hashlib
+import heapq
+import hmac
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Optional, TypeVar
 
 from fastapi import Depends, HTTPException
 from fastapi.logger import logger
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from pydantic import ValidationError
 from starlette import status
 
 from config import config
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+T = TypeVar("T")
+
+CREDENTIALS_EXCEPTION = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    Пользователь, извлеченный из проверенного access token без обращения к базе.
+    """
+    user_id: int
+    username: str
 
-class AuthService:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+@dataclass(frozen=True)
+class UserProfile:
+    """
+    Поля пользователя, нужные маршрутам помимо ID (часовой пояс для «сегодня»).
+    """
+    id: int
+    username: str
+    timezone: str
+    reminder_minute: int
+
+
+class UserCache:
+    """
+    Небольшой TTL-кэш профилей пользователей по ID в памяти процесса.
+
+    Смена настроек в этом процессе сбрасывает запись сразу, в других воркерах
+    она устаревает не дольше чем на `config.USER_CACHE_TTL_SECONDS`.
+    """
+    entries: OrderedDict[int, tuple[UserProfile, float]] = OrderedDict()
 
     @classmethod
-    async def get_current_user(cls, token: str = Depends(oauth2_scheme)):
-        try:
-            payload = jwt.decode(token, config.SECRET_KEY, algorithms=[config.ALGORITHM])
-            username: str = payload.get("sub")
-            if username is None:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Could not validate credentials",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-            return username
-        except (JWTError, ValidationError):
+    def get(cls, user_id: int) -> Optional[UserProfile]:
+        entry = cls.entries.get(user_id)
+        if entry is None:
+            return None
+        profile, expires_at = entry
+        if expires_at <= time.monotonic():
+            del cls.entries[user_id]
+            return None
+        cls.entries.move_to_end(user_id)
+        return profile
+
+    @classmethod
+    def put(cls, user) -> UserProfile:
+        profile = UserProfile(id=user.id, username=user.username, timezone=user.timezone,
+                              reminder_minute=user.reminder_minute)
+        if config.USER_CACHE_TTL_SECONDS > 0:
+            cls.entries[user.id] = (profile, time.monotonic() + config.USER_CACHE_TTL_SECONDS)
+            cls.entries.move_to_end(user.id)
+            if len(cls.entries) > config.USER_CACHE_SIZE:
+                cls.entries.popitem(last=False)
+        return profile
+
+    @classmethod
+    def invalidate(cls, user_id: int) -> None:
+        cls.entries.pop(user_id, None)
+
+
+class PasswordHasher:
+    """
+    Ограниченный пул потоков для bcrypt, чтобы хеширование не блокировало цикл событий.
+
+    bcrypt освобождает GIL, поэтому потоков достаточно. Если ожидающих операций больше
+    `config.PASSWORD_HASH_MAX_PENDING`, запрос сразу получает 503 вместо бесконечной очереди.
+    Счетчики меняются только в потоке цикла событий.
+    """
+    executor = ThreadPoolExecutor(max_workers=config.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    pending = 0  # Отправлено в пул и еще не завершено
+    completed = 0
+    rejected = 0
+    wait_seconds_total = 0.0  # Суммарное ожидание свободного потока
+    run_seconds_total = 0.0  # Суммарное время работы bcrypt
+    latencies: deque[float] = deque(maxlen=1000)  # Полное время последних операций
+
+    @classmethod
+    async def run(cls, func: Callable[..., T], *args) -> T:
+        if cls.pending >= config.PASSWORD_HASH_MAX_PENDING:
+            cls.rejected += 1
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, try again later",
+                headers={"Retry-After": "1"},
             )
 
+        def job() -> tuple[T, float, float]:
+            started_at = time.perf_counter()
+            return func(*args), started_at, time.perf_counter()
+
+        submitted_at = time.perf_counter()
+        cls.pending += 1
+        try:
+            result, started_at, finished_at = await asyncio.get_running_loop().run_in_executor(cls.executor, job)
+        finally:
+            cls.pending -= 1
+
+        cls.completed += 1
+        cls.wait_seconds_total += started_at - submitted_at
+        cls.run_seconds_total += finished_at - started_at
+        cls.latencies.append(finished_at - submitted_at)
+        return result
+
+    @classmethod
+    def metrics(cls) -> dict:
+        """
+        Глубина очереди, счетчики и задержки (в миллисекундах) bcrypt-операций.
+        """
+        latencies = sorted(cls.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+        return {
+            "workers": config.PASSWORD_HASH_WORKERS,
+            "in_flight": cls.pending,
+            "queue_depth": max(cls.pending - config.PASSWORD_HASH_WORKERS, 0),
+            "completed": cls.completed,
+            "rejected": cls.rejected,
+            "avg_wait_ms": round(cls.wait_seconds_total / cls.completed * 1000, 2) if cls.completed else 0.0,
+            "avg_run_ms": round(cls.run_seconds_total / cls.completed * 1000, 2) if cls.completed else 0.0,
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99),
+        }
+
+
+class TokenCache:
+    """
+    LRU-кэш проверенных access token: SHA-256 токена -> payload.
+
+    Запись живет до `exp` токена, поэтому кэш не продлевает срок действия; сам токен
+    в памяти не хранится. Повторный запрос с тем же токеном обходится без проверки подписи.
+    Истекшие записи снимаются при каждом get/put по куче сроков `expiry`, не дожидаясь вытеснения LRU.
+    """
+    entries: OrderedDict[bytes, tuple[dict, float]] = OrderedDict()
+    expiry: list[tuple[float, bytes]] = []
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    @classmethod
+    def evict_expired(cls, now: float) -> None:
+        """
+        Удаляет записи с истекшим `exp`. Элементы кучи от уже вытесненных записей пропускаются.
+        """
+        while cls.expiry and cls.expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(cls.expiry)
+            entry = cls.entries.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del cls.entries[key]
+
+    @classmethod
+    def get(cls, token: str) -> Optional[dict]:
+        cls.evict_expired(time.time())
+        key = cls.key(token)
+        entry = cls.entries.get(key)
+        if entry is None:
+            cls.misses += 1
+            return None
+        cls.entries.move_to_end(key)
+        cls.hits += 1
+        return entry[0]
+
+    @classmethod
+    def put(cls, token: str, payload: dict) -> None:
+        expires_at = payload.get("exp")
+        if config.JWT_CACHE_SIZE <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        now = time.time()
+        cls.evict_expired(now)
+        if expires_at <= now:
+            return
+        key = cls.key(token)
+        cls.entries[key] = (payload, float(expires_at))
+        cls.entries.move_to_end(key)
+        heapq.heappush(cls.expiry, (float(expires_at), key))
+        if len(cls.entries) > config.JWT_CACHE_SIZE:
+            cls.entries.popitem(last=False)
+        if len(cls.expiry) > 2 * config.JWT_CACHE_SIZE:
+            # Куча не растет за счет записей, вытесненных LRU раньше своего срока
+            cls.expiry = [(deadline, key) for key, (_, deadline) in cls.entries.items()]
+            heapq.heapify(cls.expiry)
+
+    @classmethod
+    def clear(cls) -> None:
+        cls.entries.clear()
+        cls.expiry.clear()
+        cls.hits = cls.misses = 0
+
+    @classmethod
+    def metrics(cls) -> dict:
+        lookups = cls.hits + cls.misses
+        return {
+            "size": len(cls.entries),
+            "max_size": config.JWT_CACHE_SIZE,
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "hit_rate": round(cls.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class AuthService:
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+    @classmethod
+    async def get_principal(cls, token: str = Depends(oauth2_scheme)) -> Principal:
+        """
+        Зависимость FastAPI: пользователь из claims `sub` и `user_id` access token, без запроса к базе.
+
+        Токены, выданные до появления `user_id`, отклоняются с 401 — клиент получает новый.
+        Подпись проверяется только при первом появлении токена, дальше payload берется из TokenCache.
+        """
+        payload = TokenCache.get(token)
+        if payload is None:
+            payload = cls.decode_access_token(token)
+            if payload is None:
+                raise CREDENTIALS_EXCEPTION
+            TokenCache.put(token, payload)
+        username = payload.get("sub")
+        user_id = payload.get("user_id")
+        if username is None or not isinstance(user_id, int):
+            raise CREDENTIALS_EXCEPTION
+        return Principal(user_id=user_id, username=username)
+
+    @classmethod
+    def token_claims(cls, user) -> dict:
+        """
+        Claims access и refresh token пользователя.
+        """
+        return {"sub": user.username, "user_id": user.id}
+
     @classmethod
     def verify_password(cls, plain_password: str, hashed_password: str) -> bool:
         return cls.pwd_context.verify(plain_password, hashed_password)
 
+    @classmethod
+    async def verify_password_async(cls, plain_password: str, hashed_password: str) -> bool:
+        return await PasswordHasher.run(cls.verify_password, plain_password, hashed_password)
+
+    @classmethod
+    async def get_password_hash_async(cls, password: str) -> str:
+        return await PasswordHasher.run(cls.get_password_hash, password)
+
+    @classmethod
+    def bot_assertion_signature(cls, telegram_id: int, username: Optional[str], issued_at: int) -> str:
+        """
+        HMAC-SHA256 от `telegram_id:username:issued_at` на общем секрете бота и API.
+        """
+        message = f"{telegram_id}:{username or ''}:{issued_at}".encode()
+        return hmac.new(config.BOT_SHARED_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+    @classmethod
+    def verify_bot_assertion(cls, telegram_id: int, username: Optional[str], issued_at: int, signature: str) -> bool:
+        """
+        Проверяет подпись бота и ее свежесть; без BOT_SHARED_SECRET вход через бота отключен.
+        """
+        if not config.BOT_SHARED_SECRET:
+            return False
+        if abs(time.time() - issued_at) > config.BOT_ASSERTION_TTL_SECONDS:
+            return False
+        expected = cls.bot_assertion_signature(telegram_id, username, issued_at)
+        return hmac.compare_digest(expected, signature)
+
     @classmethod
     def get_password_hash(cls, password: str) -> str:
         return cls.pwd_context.hash(password)
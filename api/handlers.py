@@ -1,5 +1,5 @@
 import sys
-from typing import List
+from typing import List, Optional
 
 from fastapi.params import Body
 from loguru import logger
@@ -7,16 +7,20 @@ from loguru import logger
 from sqlalchemy.exc import NoResultFound, SQLAlchemyError
 from starlette.responses import JSONResponse
 
-from database.db import AsyncSession, get_db
+from database.db import AsyncSession, get_db, get_shard_db, get_read_db, engine, replica_engines, pool_metrics, \
+    RecentWriters
+from database.writer import run_write, write_queue
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from datetime import timedelta, datetime
-from api.pydantic_models import User, HabitCreate, HabitResponse, HabitUpdate, HabitLogResponse, \
-    HabitLogCreate
-from database.func_db import UserCRUD, HabitCRUD, HabitLogCRUD
-from api.auth import AuthService, oauth2_scheme
+from datetime import date, timedelta, time
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from api.pydantic_models import User, BotAssertion, HabitCreate, HabitResponse, HabitUpdate, HabitLogResponse, \
+    HabitLogCreate, HabitLogBatchCreate, UserSettingsUpdate, UserSettingsResponse, HabitStatsResponse, PeriodStats, \
+    CalendarDay
+from database.models import UserInDB
+from database.func_db import UserCRUD, HabitCRUD, HabitLogCRUD, HabitBitmapCRUD, user_today, check_log_date
+from api.auth import AuthService, PasswordHasher, Principal, TokenCache, UserCache, UserProfile
 from config import config
-from database.models import HabitInDB
 
 logger.remove()
 logger.add(sys.stdout, level="INFO", format="{time} {level} {message}", backtrace=True, diagnose=True)
@@ -25,6 +29,40 @@ logger.add(sys.stdout, level="INFO", format="{time} {level} {message}", backtrac
 router = APIRouter()
 
 
+async def load_user_profile(user_id: int, db: AsyncSession) -> UserProfile:
+    """
+    Профиль пользователя для маршрутов, которым нужен его часовой пояс; берется из UserCache,
+    при промахе — одним запросом по первичному ключу в сессии маршрута `db`.
+    """
+    profile = UserCache.get(user_id)
+    if profile is None:
+        user = await db.get(UserInDB, user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        profile = UserCache.put(user)
+    return profile
+
+
+async def get_user_profile(
+        principal: Principal = Depends(AuthService.get_principal),
+        db: AsyncSession = Depends(get_shard_db)
+) -> UserProfile:
+    """
+    Профиль для маршрутов записи: читается в той же сессии шарда, что и запись.
+    """
+    return await load_user_profile(principal.user_id, db)
+
+
+async def get_read_user_profile(
+        principal: Principal = Depends(AuthService.get_principal),
+        db: AsyncSession = Depends(get_read_db)
+) -> UserProfile:
+    """
+    Профиль для маршрутов чтения: читается в их сессии чтения, без второй сессии и коммита.
+    """
+    return await load_user_profile(principal.user_id, db)
+
+
 @router.post("/register")
 async def register_user(user: User, db: AsyncSession = Depends(get_db)):
     """
@@ -43,6 +81,7 @@ async def register_user(user: User, db: AsyncSession = Depends(get_db)):
 
         **Возвращает**:
         - `access_token` (str): Токен доступа для зарегистрированного пользователя.
+        - `refresh_token` (str): Токен для обновления токена доступа.
         - `token_type` (str): Тип токена (bearer).
 
         **Ошибки**:
@@ -57,6 +96,7 @@ async def register_user(user: User, db: AsyncSession = Depends(get_db)):
         ```json
         {
             "access_token": "your_jwt_token",
+            "refresh_token": "your_refresh_token",
             "token_type": "bearer"
         }
         ```
@@ -65,9 +105,15 @@ async def register_user(user: User, db: AsyncSession = Depends(get_db)):
     db_user = await user_crud.get_user(user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="User already registered")
-    await user_crud.create_user(user)
-    access_token = AuthService.create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Проверка имени только читала: create_user начнет транзакцию записи заново (BEGIN IMMEDIATE)
+    await db.rollback()
+    db_user = await user_crud.create_user(user)
+    claims = AuthService.token_claims(db_user)
+    access_token_expires = timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = AuthService.create_access_token(data=claims, expires_delta=access_token_expires)
+    refresh_token_expires = timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS)
+    refresh_token = AuthService.create_refresh_token(data=claims, expires_delta=refresh_token_expires)
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.post("/token")
@@ -105,11 +151,12 @@ async def login(
         )
 
     access_token_expires = timedelta(minutes=30)
+    claims = AuthService.token_claims(user)
     access_token = AuthService.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=claims, expires_delta=access_token_expires
     )
     refresh_token_expires = timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS)
-    refresh_token = AuthService.create_refresh_token(data={"sub": user.username}, expires_delta=refresh_token_expires)
+    refresh_token = AuthService.create_refresh_token(data=claims, expires_delta=refresh_token_expires)
     return {
         "access_token": access_token,
         "refresh_token": refresh_token,
@@ -117,6 +164,46 @@ async def login(
     }
 
 
+@router.post("/token/bot")
+async def login_bot(assertion: BotAssertion, db: AsyncSession = Depends(get_db)):
+    """
+    Вход доверенного бота от имени пользователя Telegram без пароля.
+
+    **Параметры**:
+    - `assertion` (BotAssertion): ID и имя пользователя Telegram, время подписи (unix time)
+      и HMAC-SHA256 подпись на общем секрете `BOT_SHARED_SECRET`.
+
+    **Возвращает**:
+    - `access_token`, `refresh_token`, `token_type` — как у /token.
+    - `created` (bool): Пользователь был создан этим запросом.
+
+    **Ошибки**:
+    - 401: Подпись неверна, устарела или вход через бота отключен.
+    - 409: Имя пользователя занято другим пользователем.
+
+    **Описание**:
+    Проверка подписи занимает микросекунды, в отличие от bcrypt в /token. Пользователь, которого
+    еще нет, создается без пароля и может входить только через бота.
+    """
+    if not AuthService.verify_bot_assertion(assertion.telegram_id, assertion.username,
+                                            assertion.issued_at, assertion.signature):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid bot assertion")
+
+    user, created = await UserCRUD(db).get_or_create_bot_user(assertion.telegram_id, assertion.username)
+
+    claims = AuthService.token_claims(user)
+    access_token_expires = timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = AuthService.create_access_token(data=claims, expires_delta=access_token_expires)
+    refresh_token_expires = timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS)
+    refresh_token = AuthService.create_refresh_token(data=claims, expires_delta=refresh_token_expires)
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "created": created
+    }
+
+
 @router.post("/refresh-token")
 async def refresh_access_token(
         refresh_token: str = Body(..., embed=True),
@@ -138,11 +225,12 @@ async def refresh_access_token(
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
+    claims = AuthService.token_claims(user)
     access_token_expires = timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = AuthService.create_access_token(data={"sub": username}, expires_delta=access_token_expires)
+    access_token = AuthService.create_access_token(data=claims, expires_delta=access_token_expires)
 
     refresh_token_expires = timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS)
-    new_refresh_token = AuthService.create_refresh_token(data={"sub": username}, expires_delta=refresh_token_expires)
+    new_refresh_token = AuthService.create_refresh_token(data=claims, expires_delta=refresh_token_expires)
 
     return {
         "access_token": access_token,
@@ -154,19 +242,14 @@ async def refresh_access_token(
 @router.post("/habits", response_model=HabitResponse)
 async def create_habit(
     habit_data: HabitCreate,
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db)
+    principal: Principal = Depends(AuthService.get_principal),
+    db: AsyncSession = Depends(get_shard_db)
 ):
-    user_crud = UserCRUD(db)
-    logger.info(f"Received token: {token}")
-
     try:
-        current_user = await user_crud.get_current_user(token)
-        logger.info(f"Current user: {current_user.id}")
+        logger.info(f"Current user: {principal.user_id}")
 
-        habit_crud = HabitCRUD(db)
-        new_habit = await habit_crud.create_habit(
-            user_id=current_user.id,
+        new_habit = await run_write(db, principal.user_id, lambda session: HabitCRUD(session).create_habit(
+            user_id=principal.user_id,
             name=habit_data.name,
             description=habit_data.description,
             target_days=habit_data.target_days,
@@ -176,7 +259,7 @@ async def create_habit(
             current_streak=habit_data.current_streak,
             total_completed=habit_data.total_completed,
             is_tracked=habit_data.is_tracked
-        )
+        ))
 
         return new_habit
 
@@ -188,6 +271,7 @@ async def create_habit(
 
     except SQLAlchemyError as sql_exc:
         logger.error(f"Database error: {sql_exc}")
+        await db.rollback()
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"success": False, "detail": "Ошибка базы данных."}
@@ -195,6 +279,7 @@ async def create_habit(
 
     except Exception as exc:
         logger.error(f"Unexpected error: {exc}")
+        await db.rollback()
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"success": False, "detail": "Произошла непредвиденная ошибка."}
@@ -204,18 +289,13 @@ async def create_habit(
 @router.get("/habits/{habit_id}", response_model=HabitCreate)
 async def get_habit(
         habit_id: int,
-        token: str = Depends(oauth2_scheme),
-        db: AsyncSession = Depends(get_db)
+        principal: Principal = Depends(AuthService.get_principal),
+        db: AsyncSession = Depends(get_read_db)
 ):
-    user_crud = UserCRUD(db)
-    logger.info(f"Received token: {token}")
-
-    current_user = await user_crud.get_current_user(token)
-
     habit_crud = HabitCRUD(db)
     habit = await habit_crud.get_habit(habit_id)
 
-    if habit is None or habit.user_id != current_user.id:
+    if habit is None or habit.user_id != principal.user_id:
         raise HTTPException(status_code=404, detail="Habit not found or not accessible")
 
     return habit
@@ -223,17 +303,13 @@ async def get_habit(
 
 @router.get("/habits", response_model=List[HabitResponse])
 async def get_habits(
-        token: str = Depends(oauth2_scheme),
-        db: AsyncSession = Depends(get_db)
+        principal: Principal = Depends(AuthService.get_principal),
+        db: AsyncSession = Depends(get_read_db)
 ):
-    user_crud = UserCRUD(db)
-    logger.info(f"Received token: {token}")
-
-    current_user = await user_crud.get_current_user(token)
-    logger.info(f"Current user ID: {current_user.id}")
+    logger.info(f"Current user ID: {principal.user_id}")
 
     habit_crud = HabitCRUD(db)
-    habits = await habit_crud.get_habits_by_user(current_user.id)
+    habits = await habit_crud.get_habits_by_user(principal.user_id)
 
     return habits
 
@@ -242,44 +318,36 @@ async def get_habits(
 async def update_habit(
         habit_id: int,
         habit_update: HabitUpdate,
-        token: str = Depends(oauth2_scheme),
-        db: AsyncSession = Depends(get_db)
+        principal: Principal = Depends(AuthService.get_principal),
+        db: AsyncSession = Depends(get_shard_db)
 ):
-    habit_crud = HabitCRUD(db)
-
-    user_crud = UserCRUD(db)
-    current_user = await user_crud.get_current_user(token)
-
-    habit = await habit_crud.get_habit(habit_id)
-    if habit is None or habit.user_id != current_user.id:
+    try:
+        updated_habit = await run_write(db, principal.user_id, lambda session: HabitCRUD(session).update_habit(
+            habit_id=habit_id,
+            user_id=principal.user_id,
+            name=habit_update.name,
+            description=habit_update.description,
+            target_days=habit_update.target_days,
+            streak_days=habit_update.streak_days,
+            start_date=habit_update.start_date,
+            is_tracked=habit_update.is_tracked
+        ))
+    except NoResultFound:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Habit not found or access denied")
 
-    updated_habit = await habit_crud.update_habit(
-        habit_id=habit_id,
-        name=habit_update.name,
-        description=habit_update.description,
-        target_days=habit_update.target_days,
-        streak_days=habit_update.streak_days,
-        start_date=habit_update.start_date,
-        is_tracked=habit_update.is_tracked
-    )
-
     return updated_habit
 
 
 @router.delete("/habits/{habit_id}", response_model=None)
 async def delete_habit(
         habit_id: int,
-        token: str = Depends(oauth2_scheme),
-        db: AsyncSession = Depends(get_db)
+        principal: Principal = Depends(AuthService.get_principal),
+        db: AsyncSession = Depends(get_shard_db)
 ):
-    habit_crud = HabitCRUD(db)
-    user_crud = UserCRUD(db)
-
     try:
-        current_user = await user_crud.get_current_user(token)
-
-        await habit_crud.delete_habit(habit_id)
+        await run_write(
+            db, principal.user_id, lambda session: HabitCRUD(session).delete_habit(habit_id, principal.user_id)
+        )
         return {"detail": "Habit deleted successfully"}
 
     except NoResultFound:
@@ -290,19 +358,18 @@ async def delete_habit(
 async def create_habit_log(
     habit_id: int,
     log_data: HabitLogCreate,
-    db: AsyncSession = Depends(get_db),
+    current_user: UserProfile = Depends(get_user_profile),
+    db: AsyncSession = Depends(get_shard_db),
 ):
     """
-       Создает запись о выполнении привычки за текущий день.
+       Создает запись о выполнении привычки за текущий день в часовом поясе пользователя.
 
        - **habit_id** (int): Идентификатор привычки, для которой нужно добавить запись.
        - **completed** (bool): Флаг выполнения привычки (True — выполнено, False — не выполнено).
 
        Процесс:
-       1. Проверяет, существует ли привычка с переданным `habit_id`.
-       2. Проверяет, есть ли уже запись за текущий день.
-       3. Если запись отсутствует, создает новую запись о выполнении привычки.
-       4. Обновляет текущую серию дней выполнения привычки:
+       1. Добавляет запись за текущий день (INSERT ... ON CONFLICT DO NOTHING).
+       2. В той же транзакции обновляет текущую серию дней выполнения привычки:
            - Если привычка выполнена (completed=True), увеличивает серию и общее количество выполнений.
            - Если не выполнена, сбрасывает серию.
 
@@ -317,50 +384,207 @@ async def create_habit_log(
 
        Ответ:
        - **201 Created**: Успешно созданная запись.
-       - **404 Not Found**: Привычка с указанным `habit_id` не найдена.
+       - **404 Not Found**: Привычка с указанным `habit_id` не найдена или принадлежит другому пользователю.
        - **400 Bad Request**: Запись о выполнении привычки за текущий день уже существует.
        """
+    log_date = user_today(current_user)
 
-    habit_log_crud = HabitLogCRUD(db)
-
-    habit = await db.get(HabitInDB, habit_id)
-    if habit is None:
+    try:
+        new_log = await run_write(db, current_user.id, lambda session: HabitLogCRUD(session).create_habit_log(
+            current_user.id, habit_id, log_date, log_data
+        ))
+    except NoResultFound:
         raise HTTPException(status_code=404, detail="Habit not found")
 
-    log_date = datetime.utcnow().date()
+    return new_log
+
+
+@router.post("/habits/logs/batch", response_model=List[HabitLogResponse])
+async def create_habit_logs_batch(
+    batch: HabitLogBatchCreate,
+    current_user: UserProfile = Depends(get_user_profile),
+    db: AsyncSession = Depends(get_shard_db),
+):
+    """
+       Создает записи о выполнении сразу для нескольких привычек за один запрос.
+
+       - **log_date** (date, необязательно): Дата отметки, по умолчанию текущий день в часовом поясе пользователя;
+         не позже сегодняшнего дня и не раньше чем `LOG_BACKDATE_DAYS` дней назад.
+       - **logs** (list): Пары `habit_id` / `completed`, не больше `MAX_BATCH_LOGS` (100).
 
-    existing_logs = await habit_log_crud.get_habit_logs_by_date(habit_id, log_date)
-    if existing_logs:
-        raise HTTPException(status_code=400, detail="Log for today already exists")
+       Принадлежность привычек проверяется одним запросом, все записи и обновления серий
+       сохраняются в одной транзакции. Привычки, уже отмеченные за этот день, пропускаются.
+       Отметка задним числом не меняет текущую серию, если у привычки уже есть более поздняя запись.
 
-    new_log = await habit_log_crud.create_habit_log(habit_id, log_date, log_data)
+       Пример запроса:
+       ```json
+       {
+         "logs": [
+           {"habit_id": 1, "completed": true},
+           {"habit_id": 2, "completed": false}
+         ]
+       }
+       ```
 
-    if log_data.completed:
-        habit.current_streak += 1
-        habit.total_completed += 1
-    else:
-        habit.current_streak = 0
+       Ответ:
+       - **200 OK**: Список созданных записей.
+       - **400 Bad Request**: Дата отметки в будущем или слишком давно.
+       - **404 Not Found**: Одна из привычек не найдена или принадлежит другому пользователю.
+       - **422 Unprocessable Entity**: В пакете больше `MAX_BATCH_LOGS` записей.
+       """
+    today = user_today(current_user)
+    log_date = batch.log_date or today
+    check_log_date(log_date, today)
 
-    db.add(habit)
-    await db.commit()
+    try:
+        new_logs = await run_write(db, current_user.id, lambda session: HabitLogCRUD(session).create_habit_logs_batch(
+            current_user.id, log_date, batch.logs
+        ))
+    except NoResultFound:
+        raise HTTPException(status_code=404, detail="Habit not found or not accessible")
 
-    await db.refresh(habit)
+    return new_logs
 
-    return new_log
+
+@router.get("/habits/{habit_id}/logs", response_model=List[HabitLogResponse])
+async def get_habit_history(
+        habit_id: int,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        principal: Principal = Depends(AuthService.get_principal),
+        db: AsyncSession = Depends(get_read_db)
+):
+    """
+    История выполнения привычки за период (по умолчанию — вся), по возрастанию даты.
+
+    - **start**, **end** (date, необязательно): Границы периода включительно.
+
+    Записи старше горизонта архива читаются из архивной таблицы прозрачно для клиента.
+
+    Ответ:
+    - **404 Not Found**: Привычка не найдена или принадлежит другому пользователю.
+    """
+    try:
+        return await HabitLogCRUD(db).get_habit_history(habit_id, principal.user_id, start, end)
+    except NoResultFound:
+        raise HTTPException(status_code=404, detail="Habit not found or not accessible")
+
+
+@router.get("/habits/{habit_id}/stats", response_model=HabitStatsResponse)
+async def get_habit_stats(
+        habit_id: int,
+        month: Optional[date] = None,
+        current_user: UserProfile = Depends(get_read_user_profile),
+        db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Статистика привычки по битовым картам выполнения (без чтения habit_logs).
+
+    - **month** (date, необязательно): Любой день месяца для календаря, по умолчанию текущий месяц.
+
+    Возвращает текущую и самую длинную серии, общее число выполнений, выполнение за текущие
+    неделю и месяц (по сегодняшний день) и календарь месяца: `completed` true/false или null без отметки.
+
+    Ответ:
+    - **404 Not Found**: Привычка не найдена или принадлежит другому пользователю.
+    """
+    today = user_today(current_user)
+    try:
+        bitmap = await HabitBitmapCRUD(db).get_bitmap(habit_id, current_user.id, today)
+    except NoResultFound:
+        raise HTTPException(status_code=404, detail="Habit not found or not accessible")
+
+    week = bitmap.count(today - timedelta(days=today.weekday()), today)
+    month_to_date = bitmap.count(today.replace(day=1), today)
+    return HabitStatsResponse(
+        habit_id=habit_id,
+        current_streak=bitmap.current_streak(today),
+        longest_streak=bitmap.longest_streak(),
+        total_completed=bitmap.total_completed(),
+        week=PeriodStats(completed=week.completed, logged=week.logged, days=week.days, rate=week.rate),
+        month=PeriodStats(completed=month_to_date.completed, logged=month_to_date.logged,
+                          days=month_to_date.days, rate=month_to_date.rate),
+        calendar=[CalendarDay(date=day, completed=completed) for day, completed in bitmap.calendar(month or today)],
+    )
 
 
 @router.get("/unlogged_habits", response_model=List[HabitResponse])
 async def get_habits(
-        token: str = Depends(oauth2_scheme),
-        db: AsyncSession = Depends(get_db)
+        current_user: UserProfile = Depends(get_read_user_profile),
+        db: AsyncSession = Depends(get_read_db)
 ):
-    user_crud = UserCRUD(db)
-    logger.info(f"Received token: {token}")
-
-    current_user = await user_crud.get_current_user(token)
     logger.info(f"Current user ID: {current_user.id}")
 
     habit_crud = HabitCRUD(db)
-    habits = await habit_crud.get_unlogged_tracked_habits(current_user.id)
+    habits = await habit_crud.get_unlogged_tracked_habits(current_user.id, user_today(current_user))
 
     return habits
+
+
+@router.put("/users/me/settings", response_model=UserSettingsResponse)
+async def update_user_settings(
+        settings: UserSettingsUpdate,
+        principal: Principal = Depends(AuthService.get_principal),
+        db: AsyncSession = Depends(get_shard_db)
+):
+    """
+    Обновляет часовой пояс и время ежедневного напоминания пользователя.
+
+    **Параметры**:
+    - `timezone` (str, необязательно): Часовой пояс IANA, например `Europe/Moscow`.
+    - `reminder_time` (time, необязательно): Местное время напоминания, например `21:00`.
+
+    **Ошибки**:
+    - 400: Неизвестный часовой пояс.
+    """
+    user_crud = UserCRUD(db)
+    current_user = await user_crud.get_user_by_id(principal.user_id)
+    if current_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if settings.timezone is not None:
+        try:
+            ZoneInfo(settings.timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Unknown timezone {settings.timezone}")
+
+    user = await user_crud.update_settings(current_user, settings.timezone, settings.reminder_time)
+    UserCache.invalidate(user.id)
+    # Как run_write: чтения профиля с реплики до ее догоняния вернули бы старый часовой пояс
+    RecentWriters.mark(user.id)
+
+    return UserSettingsResponse(
+        timezone=user.timezone,
+        reminder_time=time(hour=user.reminder_minute // 60, minute=user.reminder_minute % 60)
+    )
+
+
+@router.get("/metrics/password-hashing")
+async def password_hashing_metrics():
+    """
+    Метрики пула bcrypt: число операций в работе и в очереди, отказы по переполнению,
+    среднее ожидание и время работы, p50/p99 полной задержки (мс) по последним операциям.
+    """
+    return PasswordHasher.metrics()
+
+
+@router.get("/metrics/token-cache")
+async def token_cache_metrics():
+    """
+    Метрики кэша проверенных access token: размер, попадания, промахи и доля попаданий.
+    """
+    return TokenCache.metrics()
+
+
+@router.get("/metrics/db-pool")
+async def db_pool_metrics():
+    """
+    Метрики пула соединений с базой: размер, занятые и свободные соединения, переполнение,
+    число выдач, таймауты, среднее и максимальное ожидание выдачи (мс), а также очередь писателя SQLite
+    и пулы реплик.
+    """
+    return {
+        **pool_metrics(engine),
+        "write_queue": write_queue.metrics(),
+        "replicas": [pool_metrics(replica) for replica in replica_engines],
+    }
@@ -1,3 +1,5 @@
+import os
+import socket
 from contextlib import asynccontextmanager
 
 import uvicorn
@@ -7,17 +9,28 @@ from fastapi.routing import APIRouter
 
 from handlers import router, logger
 
-from database.db import init_db
+from api.auth import PasswordHasher
+from config import config
+from database.db import init_db, engine, replica_engines, shard_engines
+from database.writer import write_queue, write_queue_enabled
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
 
-    init_db()
+    await init_db()
+    if write_queue_enabled():
+        await write_queue.start()
 
     logger.info("Приложение успешно запущено")
     yield
 
+    await write_queue.stop()
+    PasswordHasher.executor.shutdown(wait=False)
+    await engine.dispose()
+    for other_engine in replica_engines + shard_engines:
+        await other_engine.dispose()
+
 
 app = FastAPI(title="Chat-Bot", lifespan=lifespan)
 
@@ -28,5 +41,38 @@ main_api_router.include_router(router)
 
 app.include_router(main_api_router)
 
+
+def bind_sockets() -> list[socket.socket]:
+    """
+    Открывает TCP-порт (если API_PORT не 0) и Unix-сокет (если задан API_UDS).
+
+    Через Unix-сокет к API ходит бот на том же хосте: без TCP-рукопожатий,
+    Nagle и loopback-стека на каждый запрос.
+    """
+    sockets = []
+    if config.API_PORT:
+        # IPPROTO_TCP явно: по нему asyncio включает TCP_NODELAY на принятых соединениях,
+        # иначе ответы ждут Nagle и delayed ACK (~40 мс на запрос)
+        tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+        tcp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        tcp_sock.bind((config.API_HOST, config.API_PORT))
+        sockets.append(tcp_sock)
+        logger.info(f"API слушает {config.API_HOST}:{config.API_PORT}")
+
+    if config.API_UDS:
+        if os.path.exists(config.API_UDS):
+            os.unlink(config.API_UDS)
+        uds_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        uds_sock.bind(config.API_UDS)
+        os.chmod(config.API_UDS, 0o660)
+        sockets.append(uds_sock)
+        logger.info(f"API слушает unix://{config.API_UDS}")
+
+    if not sockets:
+        raise RuntimeError("Не задан ни API_PORT, ни API_UDS")
+    return sockets
+
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+    server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+    server.run(sockets=bind_sockets())
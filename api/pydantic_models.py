@@ -1,7 +1,9 @@
-from datetime import date, datetime
+from datetime import date, datetime, time
 
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Optional, List
+
+MAX_BATCH_LOGS = 100  # Записей в одной пакетной отметке: один INSERT и один UPDATE на пакет
 
 
 class TunedModel(BaseModel):
@@ -20,6 +22,13 @@ class User(TunedModel):
     password: str
 
 
+class BotAssertion(TunedModel):
+    telegram_id: int
+    username: Optional[str] = None
+    issued_at: int
+    signature: str
+
+
 class UserInDB(TunedModel):
     username: str
 
@@ -67,4 +76,46 @@ class HabitLogResponse(TunedModel):
 
 
 class HabitLogCreate(TunedModel):
-    completed: bool
\ No newline at end of file
+    completed: bool
+
+
+class HabitLogBatchItem(TunedModel):
+    habit_id: int
+    completed: bool
+
+
+class HabitLogBatchCreate(TunedModel):
+    log_date: Optional[date] = None
+    logs: List[HabitLogBatchItem] = Field(max_length=MAX_BATCH_LOGS)
+
+
+class UserSettingsUpdate(TunedModel):
+    timezone: Optional[str] = None
+    reminder_time: Optional[time] = None
+
+
+class UserSettingsResponse(TunedModel):
+    timezone: str
+    reminder_time: time
+
+
+class PeriodStats(TunedModel):
+    completed: int
+    logged: int
+    days: int
+    rate: float
+
+
+class CalendarDay(TunedModel):
+    date: date
+    completed: Optional[bool] = None  # None — за день нет записи
+
+
+class HabitStatsResponse(TunedModel):
+    habit_id: int
+    current_streak: int
+    longest_streak: int
+    total_completed: int
+    week: PeriodStats
+    month: PeriodStats
+    calendar: List[CalendarDay]
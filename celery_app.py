@@ -1,17 +1,30 @@
 from celery.app import Celery
 from celery.schedules import crontab
 
+from config import config
+
 celery_app = Celery(
     "habit_reminder",
-    broker="redis://localhost:6379/0",  # Настройте на ваш Redis URL
-    backend="redis://localhost:6379/0"  # Настройте на ваш Redis URL
+    broker=config.CELERY_BROKER_URL,
+    backend=config.CELERY_RESULT_BACKEND
 )
 
 celery_app.conf.beat_schedule = {
-    "send-habit-reminders-everyday": {
+    "send-habit-reminders": {
         "task": "tasks.send_habit_reminders",
-        "schedule": crontab("0", "20"),  # Выполнение каждый день в 20:00 UTC
+        # Каждое окно рассылки; пользователи выбираются по своему времени напоминания
+        "schedule": crontab(minute=f"*/{config.REMINDER_WINDOW_MINUTES}"),
+    },
+    "refresh-user-utc-offsets-hourly": {
+        "task": "tasks.refresh_user_utc_offsets",
+        # Перед началом часа, когда обычно переводят часы; смещения считаются на начало часа
+        "schedule": crontab(minute="55"),
+    },
+    "maintain-habit-log-partitions-daily": {
+        "task": "tasks.maintain_habit_log_partitions",
+        "schedule": crontab(minute="30", hour="3"),
     },
 }
 celery_app.conf.timezone = 'UTC'
 celery_app.conf.worker_pool = "threads"
+celery_app.conf.task_always_eager = config.CELERY_TASK_ALWAYS_EAGER
@@ -1,5 +1,6 @@
 
 import os
+from typing import Optional
 
 from pydantic.v1 import BaseSettings
 
@@ -10,8 +11,58 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
-    URL: str
+    URL: str  # Адрес API для бота: http://host:port или unix:///path/to/api.sock
     REFRESH_TOKEN_EXPIRE_DAYS: int
+    BOT_SHARED_SECRET: Optional[str] = None  # Общий секрет бота и API для входа через /token/bot
+    BOT_ASSERTION_TTL_SECONDS: int = 60  # Сколько секунд действительна подпись бота
+    PASSWORD_HASH_WORKERS: int = 4  # Потоков bcrypt (хеширование и проверка паролей)
+    PASSWORD_HASH_MAX_PENDING: int = 64  # Максимум ожидающих bcrypt-операций, сверх — ответ 503
+    USER_CACHE_TTL_SECONDS: float = 60  # Кэш профиля пользователя (часовой пояс) в API; 0 — без кэша
+    USER_CACHE_SIZE: int = 10000  # Пользователей в кэше профилей
+    JWT_CACHE_SIZE: int = 10000  # Проверенных access token в LRU-кэше API; 0 — без кэша
+    DB_POOL_SIZE: int = 10  # Постоянных соединений в пуле
+    DB_MAX_OVERFLOW: int = 20  # Дополнительных соединений сверх пула при пиковой нагрузке
+    DB_POOL_TIMEOUT_SECONDS: float = 30  # Сколько ждать свободного соединения
+    DB_POOL_RECYCLE_SECONDS: int = 1800  # Пересоздавать соединения старше этого возраста
+    DB_POOL_PRE_PING: bool = True  # Проверять соединение перед выдачей из пула
+    DB_STATEMENT_CACHE_SIZE: int = 500  # Кэш подготовленных запросов asyncpg на соединение
+    DB_ECHO: bool = False  # Логировать SQL-запросы
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # Сколько SQLite ждет блокировку записи
+    SQLITE_MMAP_SIZE: int = 268435456  # Размер отображения файла базы в память (байт)
+    SQLITE_CACHE_SIZE: int = -65536  # Кэш страниц SQLite; отрицательное значение — в КиБ
+    SQLITE_WRITE_QUEUE: bool = True  # Записи API через одного писателя с групповым коммитом (только SQLite)
+    SQLITE_WRITE_BATCH_SIZE: int = 200  # Максимум операций в одном коммите писателя
+    SQLITE_WRITE_BATCH_DELAY_SECONDS: float = 0.002  # Сколько писатель ждет добора пакета
+    DB_REPLICA_URLS: str = ""  # URL реплик для чтения через запятую; пусто — все чтения с основной базы
+    READ_YOUR_WRITES_SECONDS: float = 5  # Сколько после записи пользователя его чтения идут в основную базу
+    DB_SHARD_URLS: str = ""  # URL баз-шардов пользователей через запятую; пусто — единственный шард URL_DB
+    LOG_BACKDATE_DAYS: int = 7  # На сколько дней назад можно отметить привычку в пакетной отметке
+    HABIT_LOG_PARTITIONS_AHEAD: int = 3  # На сколько месяцев вперед создавать секции habit_logs (Postgres)
+    HABIT_LOG_ARCHIVE_AFTER_MONTHS: int = 12  # Секции старше стольких месяцев уходят в архив; 0 — не архивировать
+    API_HOST: str = "0.0.0.0"
+    API_PORT: int = 8000  # 0 отключает TCP-порт (имеет смысл вместе с API_UDS)
+    API_UDS: Optional[str] = None  # Путь к Unix-сокету API (вместе с TCP или вместо него)
+    BOT_TRANSPORT: str = "http"  # "http" — бот ходит в API по HTTP, "embedded" — напрямую в базу данных
+    API_TIMEOUT_SECONDS: float = 10  # Общий таймаут запроса бота к API
+    API_CONNECT_TIMEOUT_SECONDS: float = 3  # Таймаут установки соединения с API
+    API_POOL_LIMIT: int = 100  # Максимум соединений бота к API
+    API_KEEPALIVE_SECONDS: float = 30  # Сколько держать простаивающее соединение открытым
+    API_DNS_CACHE_SECONDS: int = 300  # Время жизни кэша DNS
+    API_RETRIES: int = 2  # Повторов идемпотентного запроса при сетевой ошибке или 502/503/504
+    API_RETRY_BACKOFF_SECONDS: float = 0.2  # Базовая задержка между повторами
+    BOT_TOKEN_CACHE_SIZE: int = 10000  # Пользователей Telegram в LRU-кэше токенов бота
+    BOT_TOKEN_REFRESH_MARGIN_SECONDS: int = 60  # За сколько секунд до истечения бот обновляет access token
+    REMINDER_CHUNK_SIZE: int = 1000  # Пользователей в одной порции выборки напоминаний
+    REMINDER_CONCURRENCY: int = 25  # Одновременных отправок сообщений
+    REMINDER_RATE_LIMIT: float = 30  # Сообщений в секунду (глобальный лимит Telegram)
+    REMINDER_WINDOW_MINUTES: int = 15  # Шаг окон рассылки; должен делить сутки нацело
+    REMINDER_SHARDS: int = 8  # Число шардов пользователей при рассылке напоминаний
+    REMINDER_EXECUTOR: str = "celery"  # "celery" — шарды как задачи Celery, "async" — очередь reminder_worker
+    REMINDER_QUEUE: str = "habit_reminder_jobs"  # Список Redis с заданиями для reminder_worker
+    REMINDER_WORKER_CONCURRENCY: int = 8  # Одновременно обрабатываемых заданий в reminder_worker
+    CELERY_BROKER_URL: str = "redis://localhost:6379/0"
+    CELERY_RESULT_BACKEND: str = "redis://localhost:6379/0"
+    CELERY_TASK_ALWAYS_EAGER: bool = False  # Выполнять задачи синхронно, без брокера (для тестов)
 
     class Config:
         env_file = os.path.join(os.path.dirname(__file__), '.env')
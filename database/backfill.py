@@ -0,0 +1,179 @@
+"""
+Разовое обновление схемы существующей базы и заполнение денормализованных полей.
+
+Добавляет недостающие колонки и индексы в таблицы users и habits каждого шарда, удаляет
+дубли (habit_id, log_date) из habit_logs и создает на этой паре уникальный индекс, заполняет
+habits.last_log_date / habits.last_log_completed по последней записи в habit_logs,
+пересчитывает смещения часовых поясов пользователей и вносит существующих
+пользователей в справочник user_directory основной базы, пересобирает битовые карты
+habit_bitmaps по habit_logs (database.bitmaps). В Postgres предварительно переводит
+habit_logs на помесячные секции (database.partitions).
+
+Запуск: python -m database.backfill
+"""
+import asyncio
+
+from loguru import logger
+from sqlalchemy import inspect, update, text, select, func, delete, insert, union_all
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.schema import CreateColumn
+
+from database.db import engine, init_db, shard_engines, shard_for_user, shard_sessions, unit_of_work
+from database.bitmaps import day_index, to_bytes
+from database.func_db import latest_log_values, UserCRUD, DIALECT_INSERTS
+from database.models import HabitInDB, HabitBitmapInDB, HabitLogInDB, UserInDB, UserDirectoryInDB
+from database.partitions import habit_logs_archive, migrate_to_partitioned
+
+BITMAP_CHUNK_SIZE = 1000
+
+
+async def add_missing_schema(conn: AsyncConnection) -> None:
+    for table in (UserInDB.__table__, HabitInDB.__table__):
+        existing = await conn.run_sync(
+            lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns(table.name)}
+        )
+
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_spec = CreateColumn(column).compile(dialect=conn.dialect)
+            await conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_spec}"))
+            logger.info(f"Добавлена колонка {table.name}.{column.name}")
+
+        for index in table.indexes:
+            await conn.run_sync(lambda sync_conn: index.create(sync_conn, checkfirst=True))
+
+    # Заменен покрывающим ix_users_reminder_utc_minute_id_offset
+    await conn.execute(text("DROP INDEX IF EXISTS ix_users_reminder_utc_minute_id"))
+    # Напоминания выбирают привычки по ix_habits_user_id_is_tracked, этот индекс только замедлял записи
+    await conn.execute(text("DROP INDEX IF EXISTS ix_habits_is_tracked_last_log_date"))
+
+    await add_habit_log_unique_index(conn)
+
+
+async def add_habit_log_unique_index(conn: AsyncConnection) -> None:
+    """
+    Уникальность (habit_id, log_date) в habit_logs, созданной до ограничения: без нее
+    INSERT ... ON CONFLICT (habit_id, log_date) отклоняется базой.
+
+    Дубли, которые успела создать прежняя проверка-и-вставка, удаляются (остается самая ранняя запись);
+    если ограничение уже есть, индекс с тем же именем не создается повторно.
+    """
+    first_logs = select(func.min(HabitLogInDB.id)).group_by(HabitLogInDB.habit_id, HabitLogInDB.log_date)
+    removed = (await conn.execute(delete(HabitLogInDB).where(HabitLogInDB.id.not_in(first_logs)))).rowcount
+    if removed:
+        logger.info(f"Удалено дублей habit_logs: {removed}")
+
+    await conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_habit_logs_habit_id_log_date ON habit_logs (habit_id, log_date)"
+    ))
+
+
+async def backfill_last_log(conn: AsyncConnection) -> int:
+    result = await conn.execute(update(HabitInDB).values(**latest_log_values()))
+    return result.rowcount
+
+
+async def backfill_user_directory(conn: AsyncConnection, shard_conn: AsyncConnection) -> int:
+    """
+    Вносит пользователей шарда в справочник основной базы; уже внесенные пропускаются.
+    """
+    users = (await shard_conn.execute(select(UserInDB.id, UserInDB.username, UserInDB.telegram_id))).all()
+    if not users:
+        return 0
+
+    insert = DIALECT_INSERTS[conn.dialect.name]
+    result = await conn.execute(
+        insert(UserDirectoryInDB)
+        .values([
+            {"user_id": user.id, "username": user.username, "telegram_id": user.telegram_id,
+             "shard": shard_for_user(user.id)}
+            for user in users
+        ])
+        .on_conflict_do_nothing(index_elements=["user_id"])
+    )
+
+    if conn.dialect.name == "postgresql":
+        # Явно вставленные ID не двигают последовательность; новые ID должны идти после них
+        max_id = (await conn.execute(select(func.max(UserDirectoryInDB.user_id)))).scalar()
+        await conn.execute(
+            text("SELECT setval(pg_get_serial_sequence('user_directory', 'user_id'), :max_id)"),
+            {"max_id": max_id},
+        )
+    return result.rowcount
+
+
+async def backfill_bitmaps(conn: AsyncConnection) -> int:
+    """
+    Пересобирает habit_bitmaps шарда по всем записям habit_logs (в Postgres — и архива).
+    Записи читаются потоком по возрастанию habit_id, карты вставляются пачками.
+    """
+    logs = HabitLogInDB.__table__
+    statement = select(logs.c.habit_id, logs.c.log_date, logs.c.completed)
+    if conn.dialect.name == "postgresql":
+        statement = union_all(
+            statement,
+            select(habit_logs_archive.c.habit_id, habit_logs_archive.c.log_date, habit_logs_archive.c.completed),
+        )
+    history = statement.subquery()
+
+    await conn.execute(delete(HabitBitmapInDB))
+
+    bitmaps: dict[tuple[int, int], list[int]] = {}
+    written = 0
+
+    async def flush() -> None:
+        nonlocal written
+        if not bitmaps:
+            return
+        await conn.execute(insert(HabitBitmapInDB), [
+            {"habit_id": habit_id, "year": year, "completed": to_bytes(completed), "logged": to_bytes(logged)}
+            for (habit_id, year), (completed, logged) in bitmaps.items()
+        ])
+        written += len(bitmaps)
+        bitmaps.clear()
+
+    last_habit_id = None
+    result = await conn.stream(select(history).order_by(history.c.habit_id))
+    async for habit_id, log_date, completed in result:
+        # Карты привычки целиком попадают в одну пачку: сбрасываем только на границе привычек
+        if habit_id != last_habit_id and len(bitmaps) >= BITMAP_CHUNK_SIZE:
+            await flush()
+        last_habit_id = habit_id
+
+        bits = bitmaps.setdefault((habit_id, log_date.year), [0, 0])
+        bit = 1 << day_index(log_date)
+        bits[1] |= bit
+        if completed:
+            bits[0] |= bit
+    await flush()
+    return written
+
+
+async def main() -> None:
+    for shard_engine in shard_engines:
+        async with shard_engine.begin() as conn:
+            await migrate_to_partitioned(conn)
+    await init_db()
+
+    for shard, shard_engine in enumerate(shard_engines):
+        async with shard_engine.begin() as conn:
+            await add_missing_schema(conn)
+            updated = await backfill_last_log(conn)
+            rebuilt = await backfill_bitmaps(conn)
+        logger.info(f"Шард {shard}: обновлено привычек: {updated}, битовых карт: {rebuilt}")
+
+        async with unit_of_work(shard_sessions[shard]) as session:
+            refreshed = await UserCRUD(session).refresh_utc_offsets()
+        logger.info(f"Шард {shard}: обновлены смещения часовых поясов: {refreshed} пользователей")
+
+        async with engine.begin() as conn, shard_engine.connect() as shard_conn:
+            added = await backfill_user_directory(conn, shard_conn)
+        logger.info(f"Шард {shard}: в справочник добавлено пользователей: {added}")
+
+    for shard_engine in {engine, *shard_engines}:
+        await shard_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
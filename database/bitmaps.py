@@ -0,0 +1,163 @@
+"""
+Битовые карты выполнения привычек: на каждую привычку и год две строки по 46 байт,
+бит на каждый день года (бит 0 — 1 января, порядок little-endian).
+
+`completed` — привычка выполнена в этот день, `logged` — за день есть запись о выполнении
+(выполнена или пропущена). Серии и доли выполнения считаются над целыми числами Python
+сдвигами, масками и popcount, без обхода записей habit_logs.
+"""
+from calendar import monthrange
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Iterable, Optional
+
+YEAR_BYTES = 46  # 366 дней -> 46 байт
+
+
+def day_index(day: date) -> int:
+    return day.timetuple().tm_yday - 1
+
+
+def to_int(data: Optional[bytes]) -> int:
+    return int.from_bytes(data or b"", "little")
+
+
+def to_bytes(bits: int) -> bytes:
+    return bits.to_bytes(YEAR_BYTES, "little")
+
+
+def get_bit(data: bytes, n: int) -> int:
+    """
+    Бит `n` карты, как get_bit(bytea, n) в Postgres: бит 0 — младший бит первого байта.
+    """
+    return (data[n // 8] >> (n % 8)) & 1
+
+
+def set_bit(data: bytes, n: int, value: int) -> bytes:
+    """
+    Карта с битом `n`, равным `value`, как set_bit(bytea, n, value) в Postgres.
+
+    В SQLite обе функции регистрируются на каждом соединении (database.db.apply_sqlite_profile),
+    поэтому путь записи меняет бит дня одним и тем же SQL в обеих базах.
+    """
+    bits = bytearray(data)
+    if value:
+        bits[n // 8] |= 1 << (n % 8)
+    else:
+        bits[n // 8] &= ~(1 << (n % 8))
+    return bytes(bits)
+
+
+def set_day(completed: bytes, logged: bytes, day: date, value: Optional[bool]) -> tuple[bytes, bytes]:
+    """
+    Возвращает карты года с днем `day`, отмеченным как выполненный (True), пропущенный (False)
+    или не отмеченный вовсе (None).
+    """
+    bit = 1 << day_index(day)
+    completed_bits, logged_bits = to_int(completed), to_int(logged)
+    if value is None:
+        completed_bits &= ~bit
+        logged_bits &= ~bit
+    else:
+        logged_bits |= bit
+        completed_bits = completed_bits | bit if value else completed_bits & ~bit
+    return to_bytes(completed_bits), to_bytes(logged_bits)
+
+
+@dataclass
+class PeriodCounts:
+    completed: int
+    logged: int
+    days: int
+
+    @property
+    def rate(self) -> float:
+        return round(self.completed / self.days, 4) if self.days else 0.0
+
+
+class HabitBitmap:
+    """
+    Карты всех лет привычки, склеенные в одно число: бит i — день origin + i.
+    """
+
+    def __init__(self, origin: date, completed: int = 0, logged: int = 0):
+        self.origin = origin
+        self.completed = completed
+        self.logged = logged
+
+    @classmethod
+    def from_rows(cls, rows: Iterable, default_year: int) -> "HabitBitmap":
+        """
+        Собирает карту из строк habit_bitmaps (year, completed, logged).
+        """
+        rows = sorted(rows, key=lambda row: row.year)
+        origin = date(rows[0].year if rows else default_year, 1, 1)
+        bitmap = cls(origin)
+        for row in rows:
+            offset = (date(row.year, 1, 1) - origin).days
+            bitmap.completed |= to_int(row.completed) << offset
+            bitmap.logged |= to_int(row.logged) << offset
+        return bitmap
+
+    def index(self, day: date) -> int:
+        return (day - self.origin).days
+
+    def mask(self, start: date, end: date) -> int:
+        """
+        Маска дней с `start` по `end` включительно (дни раньше origin отбрасываются).
+        """
+        first, last = max(self.index(start), 0), self.index(end)
+        if last < first:
+            return 0
+        return ((1 << (last - first + 1)) - 1) << first
+
+    def count(self, start: date, end: date) -> PeriodCounts:
+        mask = self.mask(start, end)
+        return PeriodCounts(
+            completed=(self.completed & mask).bit_count(),
+            logged=(self.logged & mask).bit_count(),
+            days=(end - start).days + 1,
+        )
+
+    def total_completed(self) -> int:
+        return self.completed.bit_count()
+
+    def current_streak(self, today: date) -> int:
+        """
+        Число подряд выполненных дней, заканчивающихся сегодня (или вчера, если сегодня еще не отмечено).
+        """
+        end = self.index(today)
+        if end >= 0 and not (self.logged >> end) & 1:
+            end -= 1
+        if end < 0:
+            return 0
+
+        window = (1 << (end + 1)) - 1
+        gaps = ~self.completed & window
+        # Старший невыполненный день в окне ограничивает серию сверху
+        return end + 1 - gaps.bit_length() if gaps else end + 1
+
+    def longest_streak(self) -> int:
+        """
+        Самая длинная серия: каждое x &= x >> 1 укорачивает все серии единиц на один день.
+        """
+        bits, length = self.completed, 0
+        while bits:
+            bits &= bits >> 1
+            length += 1
+        return length
+
+    def calendar(self, month: date) -> list[tuple[date, Optional[bool]]]:
+        """
+        Дни месяца `month` со статусом: True — выполнено, False — пропущено, None — нет отметки.
+        """
+        first = month.replace(day=1)
+        days = []
+        for offset in range(monthrange(first.year, first.month)[1]):
+            day = first + timedelta(days=offset)
+            index = self.index(day)
+            if index < 0 or not (self.logged >> index) & 1:
+                days.append((day, None))
+            else:
+                days.append((day, bool((self.completed >> index) & 1)))
+        return days
@@ -1,27 +1,158 @@
-from typing import AsyncGenerator
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator, Optional
 
-from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from database.models import UserInDB, Base
+from fastapi import Depends
+
+from sqlalchemy import event, exc, func, select
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from api.auth import AuthService, Principal
+from database.bitmaps import get_bit, set_bit
+from database.models import UserDirectoryInDB, UserInDB, Base
+from database.partitions import create_partitioned_tables
 from config import config
 
 
-# DATABASE_URL = config.URL
-#
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_database_url(url: str) -> URL:
+    """
+    URL базы с асинхронным драйвером: `postgresql://` -> asyncpg, `sqlite://` -> aiosqlite.
+
+    Для asyncpg включается кэш подготовленных запросов SQLAlchemy размером
+    `config.DB_STATEMENT_CACHE_SIZE`, если он не задан в самом URL.
+    """
+    database_url = make_url(url)
+    database_url = database_url.set(drivername=ASYNC_DRIVERS.get(database_url.drivername, database_url.drivername))
+    if database_url.drivername == "postgresql+asyncpg" and "prepared_statement_cache_size" not in database_url.query:
+        database_url = database_url.update_query_dict(
+            {"prepared_statement_cache_size": str(config.DB_STATEMENT_CACHE_SIZE)}
+        )
+    return database_url
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, считающий выдачи соединений, время ожидания свободного соединения и таймауты.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started_at
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+def build_engine(url: str) -> AsyncEngine:
+    """
+    Асинхронный движок с настройками пула из config; для SQLite дополнительно apply_sqlite_profile.
+    """
+    db_engine = create_async_engine(
+        async_database_url(url),
+        poolclass=InstrumentedPool,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=config.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+        echo=config.DB_ECHO,
+    )
+    if is_sqlite(db_engine):
+        apply_sqlite_profile(db_engine)
+    return db_engine
+
+
+def apply_sqlite_profile(db_engine: AsyncEngine) -> None:
+    """
+    Профиль SQLite: WAL, synchronous=NORMAL, busy_timeout, mmap и кэш страниц на каждом соединении.
+
+    Функции get_bit / set_bit (database.bitmaps) повторяют одноименные функции Postgres
+    для битовых карт habit_bitmaps.
+
+    Транзакции начинаются явным BEGIN (драйвер sqlite3 сам управляет ими неверно),
+    иначе SAVEPOINT писателя database.writer не работает. Сессии записи начинают
+    транзакцию с BEGIN IMMEDIATE (см. begin_write).
+    """
+    pragmas = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size={config.SQLITE_CACHE_SIZE}",
+    )
+
+    @event.listens_for(db_engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+        dbapi_connection.create_function("get_bit", 2, get_bit, deterministic=True)
+        dbapi_connection.create_function("set_bit", 3, set_bit, deterministic=True)
 
-# engine = create_async_engine(DATABASE_URL, future=True, echo=True)
-#
+    @event.listens_for(db_engine.sync_engine, "begin")
+    def on_begin(conn):
+        conn.exec_driver_sql(conn.get_execution_options().get("sqlite_begin", "BEGIN"))
 
-# async_session = async_sessionmaker(
-#     engine,
-#     class_=AsyncSession,
-#     expire_on_commit=False,
-#     autocommit=False,
-#     autoflush=True,
-# )
 
-DATABASE_URL = "sqlite+aiosqlite:///./test.database"
-engine = create_async_engine(DATABASE_URL)
+async def begin_write(session: AsyncSession) -> None:
+    """
+    В SQLite начинает транзакцию сессии записи с BEGIN IMMEDIATE.
+
+    Обычная транзакция берет блокировку записи только на первом изменении; если до него
+    было чтение, а другой запрос успел записать, WAL отказывает сразу ("database is locked")
+    без ожидания busy_timeout. IMMEDIATE ждет блокировку в начале транзакции.
+    """
+    if is_sqlite(session.bind):
+        await session.connection(execution_options={"sqlite_begin": "BEGIN IMMEDIATE"})
+
+
+def is_sqlite(db_engine: AsyncEngine) -> bool:
+    return db_engine.dialect.name == "sqlite"
+
+
+def pool_metrics(db_engine: AsyncEngine) -> dict:
+    """
+    Состояние пула движка: занятые и свободные соединения, переполнение, ожидание выдачи (мс).
+    """
+    pool = db_engine.pool
+    metrics = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+    if isinstance(pool, InstrumentedPool):
+        metrics.update({
+            "checkouts": pool.checkouts,
+            "timeouts": pool.timeouts,
+            "avg_wait_ms": round(pool.wait_seconds_total / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+            "max_wait_ms": round(pool.max_wait_seconds * 1000, 3),
+        })
+    return metrics
+
+
+DATABASE_URL = async_database_url(config.URL_DB)
+engine = build_engine(config.URL_DB)
 async_session = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -29,19 +160,175 @@ async_session = async_sessionmaker(
     autocommit=False,
     autoflush=True,
 )
-sync_engine = create_engine("sqlite:///./test.database")
 
+# Шарды пользователей: users, habits и habit_logs пользователя живут в шарде user_id % число шардов,
+# справочник user_directory (имя -> ID и шард) — в основной базе URL_DB. Без DB_SHARD_URLS
+# единственный шард — сама основная база. Перешардирование не поддерживается: init_db сверяет
+# записанные в справочнике шарды с текущим DB_SHARD_URLS (verify_shard_placement).
+SHARD_URLS = [async_database_url(url.strip()) for url in config.DB_SHARD_URLS.split(",") if url.strip()] \
+    or [DATABASE_URL]
+shard_engines = [engine if url == DATABASE_URL else build_engine(url) for url in SHARD_URLS]
+shard_sessions = [
+    async_session if shard_engine is engine
+    else async_sessionmaker(shard_engine, class_=AsyncSession, expire_on_commit=False, autoflush=True)
+    for shard_engine in shard_engines
+]
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    session: AsyncSession = async_session()
+
+def is_sharded() -> bool:
+    return len(shard_engines) > 1
+
+
+def shard_for_user(user_id: int) -> int:
+    return user_id % len(shard_engines)
+
+
+replica_engines = [build_engine(url.strip()) for url in config.DB_REPLICA_URLS.split(",") if url.strip()]
+replica_sessions = itertools.cycle([
+    async_sessionmaker(replica, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+    for replica in replica_engines
+])
+
+
+class RecentWriters:
+    """
+    Пользователи, писавшие в основную базу за последние `config.READ_YOUR_WRITES_SECONDS`.
+
+    Их чтения идут в основную базу, чтобы реплика с задержкой репликации не вернула
+    данные без только что сделанной записи. Хранится в памяти процесса API.
+    """
+    deadlines: dict[int, float] = {}
+
+    @classmethod
+    def mark(cls, user_id: int) -> None:
+        now = time.monotonic()
+        if len(cls.deadlines) > 10000:
+            cls.deadlines = {uid: deadline for uid, deadline in cls.deadlines.items() if deadline > now}
+        cls.deadlines[user_id] = now + config.READ_YOUR_WRITES_SECONDS
+
+    @classmethod
+    def is_recent(cls, user_id: Optional[int]) -> bool:
+        deadline = cls.deadlines.get(user_id)
+        return deadline is not None and deadline > time.monotonic()
+
+
+@asynccontextmanager
+async def unit_of_work(session_factory: async_sessionmaker[AsyncSession] = async_session) -> AsyncIterator[AsyncSession]:
+    """
+    Сессия с одной транзакцией: при успешном выходе один коммит, при исключении откат.
+
+    Соединение из пула берется только при первом запросе к базе, поэтому сессия,
+    в которой ничего не выполнялось, не занимает соединение и не делает коммит.
+    """
+    session: AsyncSession = session_factory()
     try:
         yield session
-    except Exception as e:
+        if session.in_transaction():
+            await session.commit()
+    except BaseException:
         await session.rollback()
         raise
     finally:
         await session.close()
 
 
-def init_db():
-    Base.metadata.create_all(bind=sync_engine)
+@asynccontextmanager
+async def shard_unit_of_work(user_id: int, db: Optional[AsyncSession] = None,
+                             write: bool = False) -> AsyncIterator[AsyncSession]:
+    """
+    Сессия шарда пользователя. Если `db` уже подключена к этому шарду, возвращается она сама
+    (одна транзакция), иначе открывается отдельная единица работы на шарде; при `write`
+    ее транзакция сразу берет блокировку записи SQLite (begin_write).
+    """
+    shard = shard_for_user(user_id)
+    if db is not None and db.bind is shard_engines[shard]:
+        yield db
+        return
+
+    async with unit_of_work(shard_sessions[shard]) as session:
+        if write:
+            await begin_write(session)
+        yield session
+
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Зависимость FastAPI: сессия-единица работы на запрос.
+
+    Коммит выполняется один раз после обработчика, любое исключение (в том числе
+    HTTPException) откатывает все изменения запроса. Запрос, отклоненный на проверке
+    токена, до базы не доходит.
+    """
+    async with unit_of_work() as session:
+        yield session
+
+
+async def get_shard_db(
+        principal: Principal = Depends(AuthService.get_principal)
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Зависимость FastAPI: единица работы на шарде пользователя из токена.
+
+    Записи в основную SQLite идут через писателя database.writer, поэтому сессия запроса
+    на ней не берет блокировку записи: иначе она ждала бы писателя, а писатель — ее.
+    """
+    write = not (shard_engines[shard_for_user(principal.user_id)] is engine and config.SQLITE_WRITE_QUEUE)
+    async with shard_unit_of_work(principal.user_id, write=write) as session:
+        yield session
+
+
+async def get_read_db(
+        principal: Principal = Depends(AuthService.get_principal)
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Зависимость FastAPI для маршрутов только на чтение: сессия реплики (по кругу).
+
+    Если реплики не настроены или пользователь недавно писал (RecentWriters),
+    выдается сессия основной базы; при шардировании — сессия шарда пользователя
+    (реплики относятся только к основной базе). Сессия ничего не фиксирует.
+    """
+    if is_sharded():
+        session_factory = shard_sessions[shard_for_user(principal.user_id)]
+    elif not replica_engines or RecentWriters.is_recent(principal.user_id):
+        session_factory = async_session
+    else:
+        session_factory = next(replica_sessions)
+
+    async with session_factory() as session:
+        yield session
+
+
+async def verify_shard_placement() -> None:
+    """
+    Проверяет, что пользователи справочника лежат в тех шардах, куда их направит shard_for_user.
+
+    Изменение числа или порядка DB_SHARD_URLS иначе молча направило бы пользователей в чужие шарды.
+    """
+    async with engine.connect() as conn:
+        misplaced = (await conn.execute(
+            select(func.count()).select_from(UserDirectoryInDB)
+            .where(UserDirectoryInDB.shard != UserDirectoryInDB.user_id % len(shard_engines))
+        )).scalar()
+    if misplaced:
+        raise RuntimeError(
+            f"{misplaced} пользователей справочника записаны в других шардах, чем user_id % {len(shard_engines)}: "
+            f"DB_SHARD_URLS изменился, перешардирование не поддерживается"
+        )
+
+
+async def init_db() -> None:
+    """
+    Создает недостающие таблицы в основной базе и во всех шардах и проверяет размещение пользователей.
+
+    В Postgres habit_logs и ее архив создаются секционированными (database.partitions)
+    после остальных таблиц, на которые она ссылается, и до общего create_all.
+    """
+    for db_engine in [engine] + [shard for shard in shard_engines if shard is not engine]:
+        async with db_engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                other_tables = [table for table in Base.metadata.sorted_tables if table.name != "habit_logs"]
+                await conn.run_sync(Base.metadata.create_all, tables=other_tables)
+                await create_partitioned_tables(conn)
+            await conn.run_sync(Base.metadata.create_all)
+
+    await verify_shard_placement()
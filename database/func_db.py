@@ -1,94 +1,272 @@
-from datetime import date, datetime
+from datetime import date, datetime, time, timedelta
 from typing import Optional, Sequence
+from zoneinfo import ZoneInfo
 
 from fastapi import HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import select, update, delete, case, and_, or_, literal, union_all, func
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from database.models import UserInDB, HabitInDB, HabitLogInDB
-from api.pydantic_models import User, HabitLogCreate
+from database.db import begin_write, shard_engines, shard_for_user, shard_unit_of_work
+from database.bitmaps import HabitBitmap, day_index, set_day, YEAR_BYTES
+from database.models import UserDirectoryInDB, UserInDB, HabitInDB, HabitLogInDB, HabitBitmapInDB
+from database.partitions import habit_logs_archive, archive_boundary
+from api.pydantic_models import User, HabitLogCreate, HabitLogBatchItem
 from api.auth import AuthService
+from config import config
+
+
+# INSERT ... ON CONFLICT есть только в диалектных вариантах insert()
+DIALECT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+# CRUD-классы только выполняют запросы и flush; транзакцию фиксирует или откатывает
+# владелец сессии — database.db.unit_of_work (для запросов API — get_db).
+
+
+class UserDirectory:
+    """
+    Справочник user_directory в основной базе: имя и ID Telegram -> ID пользователя и шард.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_by_username(self, username: str) -> Optional[UserDirectoryInDB]:
+        result = await self.db.execute(select(UserDirectoryInDB).where(UserDirectoryInDB.username == username))
+        return result.scalars().first()
+
+    async def get_by_telegram_id(self, telegram_id: int) -> Optional[UserDirectoryInDB]:
+        result = await self.db.execute(select(UserDirectoryInDB).where(UserDirectoryInDB.telegram_id == telegram_id))
+        return result.scalars().first()
+
+    async def remove(self, user_id: int) -> None:
+        await self.db.execute(delete(UserDirectoryInDB).where(UserDirectoryInDB.user_id == user_id))
+
+    async def add(self, username: str, telegram_id: Optional[int] = None) -> UserDirectoryInDB:
+        """
+        Выдает новому пользователю ID и шард; занятое имя — HTTPException 400.
+        """
+        entry = UserDirectoryInDB(username=username, telegram_id=telegram_id)
+        try:
+            self.db.add(entry)
+            await self.db.flush()
+        except IntegrityError:
+            raise HTTPException(status_code=400, detail="User already registered")
+
+        entry.shard = shard_for_user(entry.user_id)
+        await self.db.flush()
+        return entry
 
 
 class UserCRUD:
+    """
+    Пользователи в шардах. Поиск по имени и регистрация идут через справочник UserDirectory,
+    поэтому для них `db` должна быть сессией основной базы; остальные методы сами
+    переходят в шард пользователя (или используют `db`, если она и есть этот шард).
+
+    Новый пользователь записывается сначала в справочник, потом в шард (_create_in_shard):
+    строка справочника без пользователя в шарде означает прерванную регистрацию и
+    переиспользуется следующей, а пользователь шарда без строки справочника не появляется.
+    """
+
     def __init__(self, db: AsyncSession):
         self.db = db
 
     async def get_user(self, username: str) -> Optional[UserInDB]:
-        query = select(UserInDB).filter(UserInDB.username == username)
-        result = await self.db.execute(query)
-        return result.scalars().first()
+        entry = await UserDirectory(self.db).get_by_username(username)
+        if entry is None:
+            return None
+        return await self.get_user_by_id(entry.user_id)
+
+    async def get_user_by_id(self, user_id: int) -> Optional[UserInDB]:
+        async with shard_unit_of_work(user_id, self.db) as shard_db:
+            return await shard_db.get(UserInDB, user_id)
 
     async def create_user(self, user: User) -> UserInDB:
-        db_user = UserInDB(username=user.username, hashed_password=AuthService.get_password_hash(user.password))
+        hashed_password = await AuthService.get_password_hash_async(user.password)
+        # Блокировка записи SQLite берется после bcrypt, но до чтения справочника
+        await begin_write(self.db)
+        directory = UserDirectory(self.db)
+        entry = await directory.get_by_username(user.username)
+        if entry is None or await self.get_user_by_id(entry.user_id) is not None:
+            entry = await directory.add(user.username)
+
+        db_user = UserInDB(id=entry.user_id, username=user.username, hashed_password=hashed_password)
+        await self._create_in_shard(entry, db_user)
+        return db_user
 
-        async with self.db as session:
-            try:
-                session.add(db_user)
-                await session.commit()
-                await session.refresh(db_user)
-            except IntegrityError:
-                await session.rollback()
-                raise HTTPException(status_code=400, detail="User already registered")
+    async def _create_in_shard(self, entry: UserDirectoryInDB, user: UserInDB) -> None:
+        """
+        Записывает пользователя в его шард после строки справочника `entry` в сессии `db`.
 
-        return db_user
+        Если шард — та же база, обе записи попадают в транзакцию `db`. Иначе строка справочника
+        фиксируется первой; если запись в шард не удалась, она удаляется, и имя снова свободно.
+        """
+        user_id = entry.user_id
+        if shard_engines[shard_for_user(user_id)] is self.db.bind:
+            self.db.add(user)
+            await self.db.flush()
+            return
+
+        await self.db.commit()
+        try:
+            async with shard_unit_of_work(user_id) as shard_db:
+                shard_db.add(user)
+                await shard_db.flush()
+        except BaseException:
+            await self.db.rollback()
+            await UserDirectory(self.db).remove(user_id)
+            await self.db.commit()
+            raise
+
+    async def _link_telegram_id(self, entry: UserDirectoryInDB, telegram_id: int) -> None:
+        """
+        Привязывает ID Telegram к строке справочника `entry` и к пользователю в его шарде.
+
+        Порядок тот же, что в _create_in_shard: если шард — другая база, справочник фиксируется
+        первым, а при неудачной записи в шард привязка в справочнике снимается. Иначе справочник
+        указывал бы на пользователя, у которого в шарде нет ID Telegram и нет напоминаний.
+        """
+        user_id = entry.user_id
+        entry.telegram_id = telegram_id
+        await self.db.flush()
+        if shard_engines[shard_for_user(user_id)] is self.db.bind:
+            await self.db.execute(update(UserInDB).where(UserInDB.id == user_id).values(telegram_id=telegram_id))
+            return
+
+        await self.db.commit()
+        try:
+            async with shard_unit_of_work(user_id) as shard_db:
+                await shard_db.execute(update(UserInDB).where(UserInDB.id == user_id).values(telegram_id=telegram_id))
+        except BaseException:
+            await self.db.rollback()
+            await self.db.execute(
+                update(UserDirectoryInDB)
+                .where(UserDirectoryInDB.user_id == user_id, UserDirectoryInDB.telegram_id == telegram_id)
+                .values(telegram_id=None)
+            )
+            await self.db.commit()
+            raise
 
     async def authenticate_user(self, username: str, password: str) -> Optional[UserInDB]:
         user = await self.get_user(username)
-        if user is None or not AuthService.verify_password(password, user.hashed_password):
+        if user is None or user.hashed_password is None:
+            return None
+        if not await AuthService.verify_password_async(password, user.hashed_password):
             return None
         return user
 
-    async def get_current_user(self, token: str) -> UserInDB:
-        payload = AuthService.decode_access_token(token)
-        if payload is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        user = await self.get_user(username)
-        if user is None:
-            raise HTTPException(status_code=404, detail="User not found")
+    async def get_or_create_bot_user(self, telegram_id: int, username: Optional[str]) -> tuple[UserInDB, bool]:
+        """
+        Находит пользователя по ID Telegram для входа через бота; возвращает (пользователь, создан ли он).
+
+        Пользователь, зарегистрированный ботом раньше по паролю, привязывается к ID Telegram
+        один раз после проверки пароля; новый пользователь создается без пароля.
+        """
+        directory = UserDirectory(self.db)
+
+        entry = await directory.get_by_telegram_id(telegram_id)
+        if entry is not None:
+            user = await self.get_user_by_id(entry.user_id)
+            if user is None:
+                # Прерванная регистрация: строка справочника есть, пользователя в шарде нет
+                user = UserInDB(id=entry.user_id, username=entry.username, telegram_id=telegram_id,
+                                hashed_password=None)
+                await self._create_in_shard(entry, user)
+                return user, True
+            return user, False
+
+        username = username or f"tg_{telegram_id}"
+        entry = await directory.get_by_username(username)
+        if entry is not None:
+            user = await self.get_user_by_id(entry.user_id)
+            if entry.telegram_id is not None or user is None or user.hashed_password is None or \
+                    not await AuthService.verify_password_async(str(telegram_id), user.hashed_password):
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Username is already taken")
+            await self._link_telegram_id(entry, telegram_id)
+            user.telegram_id = telegram_id
+            return user, False
+
+        try:
+            entry = await directory.add(username, telegram_id)
+        except HTTPException:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User already registered")
+
+        user = UserInDB(id=entry.user_id, username=username, telegram_id=telegram_id, hashed_password=None)
+        await self._create_in_shard(entry, user)
+        return user, True
+
+    async def update_settings(self, user: UserInDB, timezone: Optional[str] = None,
+                              reminder_time: Optional[time] = None) -> UserInDB:
+        """
+        Обновляет часовой пояс и время напоминания пользователя.
+
+        Смещение от UTC и минута напоминания по UTC вычисляются здесь же, чтобы
+        рассылка выбирала пользователей индексированным условием без пересчета поясов.
+        """
+        if timezone is not None:
+            user.timezone = timezone
+        if reminder_time is not None:
+            user.reminder_minute = reminder_time.hour * 60 + reminder_time.minute
+
+        user.utc_offset_minutes = utc_offset_minutes(user.timezone)
+        user.reminder_utc_minute = (user.reminder_minute - user.utc_offset_minutes) % MINUTES_PER_DAY
+
+        self.db.add(user)
+        await self.db.flush()
         return user
 
+    async def refresh_utc_offsets(self, at: Optional[datetime] = None) -> int:
+        """
+        Пересчитывает смещения от UTC на момент `at` (по умолчанию сейчас) после перехода
+        на летнее/зимнее время.
+
+        Один UPDATE на каждый используемый часовой пояс; возвращает число обновленных пользователей.
+        """
+        timezones = (await self.db.scalars(select(UserInDB.timezone).distinct())).all()
+
+        updated = 0
+        for timezone in timezones:
+            offset = utc_offset_minutes(timezone, at)
+            result = await self.db.execute(
+                update(UserInDB)
+                .where(UserInDB.timezone == timezone, UserInDB.utc_offset_minutes != offset)
+                .values(
+                    utc_offset_minutes=offset,
+                    reminder_utc_minute=(UserInDB.reminder_minute - offset + MINUTES_PER_DAY) % MINUTES_PER_DAY,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            updated += result.rowcount
+
+        return updated
+
 
 class HabitCRUD:
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    async def get_unlogged_tracked_habits(self, user_id: int) -> list[HabitInDB]:
-        """
-        Возвращает список отслеживаемых привычек, которые не были отмечены сегодня.
+    async def get_unlogged_tracked_habits(self, user_id: int, today: date) -> Sequence[HabitInDB]:
         """
-        today = datetime.utcnow().date()
+        Возвращает список отслеживаемых привычек, которые не были отмечены за `today`
+        (текущий день в часовом поясе пользователя).
 
-        statement = select(HabitInDB).filter(
+        Проверка идет по денормализованному полю last_log_date, таблица habit_logs
+        не затрагивается, поэтому время ответа не зависит от длины истории привычки.
+        """
+        statement = select(HabitInDB).where(
             HabitInDB.user_id == user_id,
-            HabitInDB.is_tracked == True
-        ).options(selectinload(HabitInDB.logs))
+            HabitInDB.is_tracked == True,
+            or_(HabitInDB.last_log_date.is_(None), HabitInDB.last_log_date < today)
+        )
 
         result = await self.db.execute(statement)
-        habits = result.scalars().all()
-
-        unlogged_habits = []
-
-        for habit in habits:
-
-            today_log = next((log for log in habit.logs if log.log_date == today), None)
-            if not today_log:
-                unlogged_habits.append(habit)
-
-        return unlogged_habits
+        return result.scalars().all()
 
     async def create_habit(
             self,
@@ -116,8 +294,7 @@ class HabitCRUD:
             is_tracked=is_tracked
         )
         self.db.add(new_habit)
-        await self.db.commit()
-        await self.db.refresh(new_habit)
+        await self.db.flush()
         return new_habit
 
     async def get_habit(self, habit_id: int) -> Optional[HabitInDB]:
@@ -130,60 +307,211 @@ class HabitCRUD:
         result = await self.db.execute(query)
         return result.scalars().all()
 
-    async def update_habit(self, habit_id: int, name: Optional[str] = None, target_days: Optional[int] = None,
-                           streak_days: Optional[int] = None, start_date: Optional[str] = None,
-                           description: Optional[str] = None, is_tracked: Optional[bool] = None) -> Optional[HabitInDB]:
-        habit = await self.get_habit(habit_id)
-        if habit is None:
-            raise NoResultFound(f"Habit with id {habit_id} not found.")
+    async def update_habit(self, habit_id: int, user_id: int, name: Optional[str] = None,
+                           target_days: Optional[int] = None, streak_days: Optional[int] = None,
+                           start_date: Optional[str] = None, description: Optional[str] = None,
+                           is_tracked: Optional[bool] = None) -> HabitInDB:
+        """
+        Обновляет привычку пользователя одним запросом UPDATE ... WHERE id AND user_id RETURNING.
 
-        if name is not None:
-            habit.name = name
-        if target_days is not None:
-            habit.target_days = target_days
-        if streak_days is not None:
-            habit.streak_days = streak_days
-        if start_date is not None:
-            habit.start_date = start_date
-        if description is not None:
-            habit.description = description
-        if is_tracked is not None:
-            habit.is_tracked = is_tracked
-
-        self.db.add(habit)
-        await self.db.commit()
-        await self.db.refresh(habit)
-        return habit
+        Проверка владельца и изменение выполняются одним запросом; если строка не вернулась,
+        привычки нет или она чужая — NoResultFound.
+        """
+        values = {
+            key: value for key, value in {
+                "name": name,
+                "target_days": target_days,
+                "streak_days": streak_days,
+                "start_date": start_date,
+                "description": description,
+                "is_tracked": is_tracked,
+            }.items() if value is not None
+        }
+
+        if values:
+            statement = (
+                update(HabitInDB)
+                .where(HabitInDB.id == habit_id, HabitInDB.user_id == user_id)
+                .values(**values)
+                .returning(HabitInDB)
+                .execution_options(populate_existing=True)
+            )
+        else:
+            statement = select(HabitInDB).where(HabitInDB.id == habit_id, HabitInDB.user_id == user_id)
 
-    async def delete_habit(self, habit_id: int) -> None:
-        habit = await self.get_habit(habit_id)
+        habit = (await self.db.scalars(statement)).first()
         if habit is None:
             raise NoResultFound(f"Habit with id {habit_id} not found.")
+        return habit
 
-        await self.db.delete(habit)
-        await self.db.commit()
+    async def delete_habit(self, habit_id: int, user_id: int) -> None:
+        """
+        Удаляет привычку пользователя вместе с записями о выполнении без предварительного SELECT.
+
+        Оба DELETE ограничены владельцем; если привычка не вернулась из DELETE ... RETURNING,
+        ее нет или она чужая — NoResultFound, и транзакция запроса откатывается.
+        """
+        owned_habit = select(HabitInDB.id).where(HabitInDB.id == habit_id, HabitInDB.user_id == user_id)
+        await self.db.execute(
+            delete(HabitLogInDB)
+            .where(HabitLogInDB.habit_id.in_(owned_habit))
+            .execution_options(synchronize_session=False)
+        )
+        if self.db.bind.dialect.name == "postgresql":
+            await self.db.execute(
+                delete(habit_logs_archive).where(habit_logs_archive.c.habit_id.in_(owned_habit))
+            )
+        await self.db.execute(
+            delete(HabitBitmapInDB)
+            .where(HabitBitmapInDB.habit_id.in_(owned_habit))
+            .execution_options(synchronize_session=False)
+        )
+
+        deleted_id = (await self.db.execute(
+            delete(HabitInDB)
+            .where(HabitInDB.id == habit_id, HabitInDB.user_id == user_id)
+            .returning(HabitInDB.id)
+            .execution_options(synchronize_session=False)
+        )).scalar()
+        if deleted_id is None:
+            raise NoResultFound(f"Habit with id {habit_id} not found.")
 
 
 class HabitLogCRUD:
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    async def create_habit_log(self, habit_id: int, log_date: date, log_data: HabitLogCreate):
+    async def create_habit_log(self, user_id: int, habit_id: int, log_date: date,
+                               log_data: HabitLogCreate) -> HabitLogInDB:
+        """
+        Создает запись о выполнении и обновляет серию привычки в одной транзакции.
+
+        Запись вставляется через INSERT ... ON CONFLICT DO NOTHING RETURNING, серия
+        обновляется через UPDATE ... RETURNING: два запроса вместо проверки и вставки.
+        Повторная отметка за тот же день не проходит даже при одновременных запросах.
+        Чужая привычка не обновляется; исключение откатывает транзакцию запроса
+        так же, как для несуществующей. Для чужой привычки, уже отмеченной за этот день,
+        тоже NoResultFound, а не 400.
+        """
+        insert = DIALECT_INSERTS[self.db.bind.dialect.name]
 
-        new_log = HabitLogInDB(
-            habit_id=habit_id,
-            log_date=log_date,
-            completed=log_data.completed
+        insert_statement = (
+            insert(HabitLogInDB)
+            .values(habit_id=habit_id, log_date=log_date, completed=log_data.completed)
+            .on_conflict_do_nothing(index_elements=["habit_id", "log_date"])
+            .returning(HabitLogInDB)
         )
 
-        self.db.add(new_log)
+        update_statement = (
+            update(HabitInDB)
+            .where(HabitInDB.id == habit_id, HabitInDB.user_id == user_id)
+            .values(**log_update_values(literal(log_data.completed), log_date))
+            .returning(HabitInDB.id)
+        )
 
-        # Коммитим изменения
-        await self.db.commit()
+        try:
+            new_log = (await self.db.scalars(insert_statement)).first()
+            if new_log is None:
+                # Конфликт не должен выдавать существование чужой привычки: владелец проверяется
+                # только здесь, чтобы не добавлять запрос к обычной отметке
+                owned = await self.db.scalar(
+                    select(HabitInDB.id).where(HabitInDB.id == habit_id, HabitInDB.user_id == user_id)
+                )
+                if owned is None:
+                    raise NoResultFound(f"Habit with id {habit_id} not found.")
+                raise HTTPException(status_code=400, detail="Log for today already exists")
+
+            if (await self.db.execute(update_statement)).first() is None:
+                raise NoResultFound(f"Habit with id {habit_id} not found.")
+        except IntegrityError:
+            # Postgres отклоняет запись для несуществующей привычки по внешнему ключу
+            raise NoResultFound(f"Habit with id {habit_id} not found.")
 
-        await self.db.refresh(new_log)
+        await HabitBitmapCRUD(self.db).set_days([(habit_id, log_date, log_data.completed)])
         return new_log
 
+    async def create_habit_logs_batch(self, user_id: int, log_date: date,
+                                      logs: Sequence[HabitLogBatchItem]) -> Sequence[HabitLogInDB]:
+        """
+        Создает записи о выполнении сразу для нескольких привычек пользователя.
+
+        Принадлежность привычек проверяется одним запросом, все записи вставляются
+        одним INSERT ... ON CONFLICT DO NOTHING, серии обновляются одним UPDATE.
+        Всё выполняется в одной транзакции. Привычки, уже отмеченные за этот день,
+        пропускаются; возвращаются только созданные записи.
+        """
+        completed_by_habit = {log.habit_id: log.completed for log in logs}
+        if not completed_by_habit:
+            return []
+
+        owned_ids = set((await self.db.scalars(
+            select(HabitInDB.id).where(
+                HabitInDB.id.in_(completed_by_habit),
+                HabitInDB.user_id == user_id
+            )
+        )).all())
+        missing_ids = completed_by_habit.keys() - owned_ids
+        if missing_ids:
+            raise NoResultFound(f"Habits with ids {sorted(missing_ids)} not found.")
+
+        insert = DIALECT_INSERTS[self.db.bind.dialect.name]
+        new_logs = (await self.db.scalars(
+            insert(HabitLogInDB)
+            .values([
+                {"habit_id": habit_id, "log_date": log_date, "completed": completed}
+                for habit_id, completed in completed_by_habit.items()
+            ])
+            .on_conflict_do_nothing(index_elements=["habit_id", "log_date"])
+            .returning(HabitLogInDB)
+        )).all()
+
+        if new_logs:
+            completed_ids = [log.habit_id for log in new_logs if log.completed]
+            await self.db.execute(
+                update(HabitInDB)
+                .where(HabitInDB.id.in_([log.habit_id for log in new_logs]))
+                .values(**log_update_values(HabitInDB.id.in_(completed_ids), log_date))
+                .execution_options(synchronize_session=False)
+            )
+            await HabitBitmapCRUD(self.db).set_days([(log.habit_id, log_date, log.completed) for log in new_logs])
+
+        return new_logs
+
+    async def get_habit_history(self, habit_id: int, user_id: int, start: Optional[date] = None,
+                                end: Optional[date] = None) -> Sequence:
+        """
+        Записи о выполнении привычки пользователя за период, по возрастанию даты.
+
+        В Postgres старые месяцы могут лежать в habit_logs_archive: если период заходит
+        раньше границы архива, к живой таблице добавляется архив через UNION ALL.
+        Чужая или несуществующая привычка — NoResultFound.
+        """
+        owned = await self.db.scalar(
+            select(HabitInDB.id).where(HabitInDB.id == habit_id, HabitInDB.user_id == user_id)
+        )
+        if owned is None:
+            raise NoResultFound(f"Habit with id {habit_id} not found.")
+
+        def period(table):
+            statement = select(
+                table.c.id, table.c.habit_id, table.c.log_date, table.c.completed, table.c.created_at
+            ).where(table.c.habit_id == habit_id)
+            if start is not None:
+                statement = statement.where(table.c.log_date >= start)
+            if end is not None:
+                statement = statement.where(table.c.log_date <= end)
+            return statement
+
+        statement = period(HabitLogInDB.__table__)
+        boundary = archive_boundary()
+        if self.db.bind.dialect.name == "postgresql" and boundary is not None \
+                and (start is None or start < boundary):
+            statement = union_all(statement, period(habit_logs_archive))
+
+        history = statement.subquery()
+        result = await self.db.execute(select(history).order_by(history.c.log_date))
+        return result.all()
+
     async def get_habit_logs_by_date(self, habit_id: int, log_date: date) -> Sequence[HabitLogInDB]:
         result = await self.db.execute(
             select(HabitLogInDB).where(
@@ -194,10 +522,154 @@ class HabitLogCRUD:
         return result.scalars().all()
 
     async def delete_habit_log(self, log_id: int) -> None:
-        # Удаление записи о выполнении привычки
-        result = await self.db.execute(select(HabitLogInDB).where(HabitLogInDB.id == log_id))
-        log = result.scalars().first()
-        if log is None:
+        """
+        Удаляет запись о выполнении и пересчитывает last_log_* привычки в той же транзакции.
+        """
+        deleted = (await self.db.execute(
+            delete(HabitLogInDB)
+            .where(HabitLogInDB.id == log_id)
+            .returning(HabitLogInDB.habit_id, HabitLogInDB.log_date)
+        )).first()
+        if deleted is None:
             raise NoResultFound(f"Habit log with id {log_id} not found.")
-        await self.db.delete(log)
-        await self.db.commit()
+
+        await self.db.execute(
+            update(HabitInDB)
+            .where(HabitInDB.id == deleted.habit_id)
+            .values(**latest_log_values())
+            .execution_options(synchronize_session=False)
+        )
+        await HabitBitmapCRUD(self.db).set_days([(deleted.habit_id, deleted.log_date, None)])
+
+
+class HabitBitmapCRUD:
+    """
+    Битовые карты выполнения habit_bitmaps, которые путь записи habit_logs поддерживает в той же транзакции.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def set_days(self, days: Sequence[tuple[int, date, Optional[bool]]]) -> None:
+        """
+        Отмечает дни (habit_id, дата, выполнено) в картах: True/False — запись есть, None — записи нет.
+
+        Один INSERT ... ON CONFLICT DO UPDATE на каждую дату: карта нового года вставляется готовой,
+        в существующей set_bit меняет только бит этого дня, поэтому строки карт не читаются,
+        а параллельные записи других дней не теряют биты.
+        """
+        values_by_day: dict[date, dict[int, Optional[bool]]] = {}
+        for habit_id, day, completed in days:
+            values_by_day.setdefault(day, {})[habit_id] = completed
+
+        insert = DIALECT_INSERTS[self.db.bind.dialect.name]
+        empty = bytes(YEAR_BYTES)
+        for day, values in values_by_day.items():
+            rows = []
+            for habit_id, completed in values.items():
+                completed_map, logged_map = set_day(empty, empty, day, completed)
+                rows.append({"habit_id": habit_id, "year": day.year, "completed": completed_map, "logged": logged_map})
+
+            bit = day_index(day)
+            statement = insert(HabitBitmapInDB).values(rows)
+            # Вставленная карта несет нужное значение бита дня: его и переносим в существующую
+            await self.db.execute(statement.on_conflict_do_update(
+                index_elements=["habit_id", "year"],
+                set_={
+                    "completed": func.set_bit(HabitBitmapInDB.completed, bit,
+                                              func.get_bit(statement.excluded.completed, bit)),
+                    "logged": func.set_bit(HabitBitmapInDB.logged, bit, func.get_bit(statement.excluded.logged, bit)),
+                },
+            ))
+
+    async def get_bitmap(self, habit_id: int, user_id: int, today: date) -> HabitBitmap:
+        """
+        Все годы карт привычки пользователя одним запросом; чужая или несуществующая привычка — NoResultFound.
+        """
+        owned = await self.db.scalar(
+            select(HabitInDB.id).where(HabitInDB.id == habit_id, HabitInDB.user_id == user_id)
+        )
+        if owned is None:
+            raise NoResultFound(f"Habit with id {habit_id} not found.")
+
+        rows = (await self.db.execute(
+            select(HabitBitmapInDB.year, HabitBitmapInDB.completed, HabitBitmapInDB.logged)
+            .where(HabitBitmapInDB.habit_id == habit_id)
+        )).all()
+        return HabitBitmap.from_rows(rows, default_year=today.year)
+
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def utc_offset_minutes(timezone: str, at: Optional[datetime] = None) -> int:
+    """
+    Смещение часового пояса от UTC в минутах на момент `at` (по умолчанию сейчас).
+    """
+    moment = at or datetime.now(ZoneInfo("UTC"))
+    offset = moment.astimezone(ZoneInfo(timezone)).utcoffset()
+    return int(offset.total_seconds()) // 60
+
+
+def user_today(user) -> date:
+    """
+    Текущая дата в часовом поясе пользователя (UserInDB или api.auth.UserProfile).
+    """
+    return datetime.now(ZoneInfo(user.timezone)).date()
+
+
+def check_log_date(log_date: date, today: date) -> None:
+    """
+    Дата отметки из запроса: не позже сегодняшнего дня пользователя и не раньше чем
+    `config.LOG_BACKDATE_DAYS` дней назад; иначе HTTPException 400.
+
+    Отметка будущим днем сдвинула бы last_log_date вперед и скрыла привычку из
+    /unlogged_habits и напоминаний до этой даты.
+    """
+    if log_date > today:
+        raise HTTPException(status_code=400, detail="Log date is in the future")
+    if log_date < today - timedelta(days=config.LOG_BACKDATE_DAYS):
+        raise HTTPException(status_code=400, detail=f"Log date is more than {config.LOG_BACKDATE_DAYS} days ago")
+
+
+def log_update_values(completed, log_date: date) -> dict:
+    """
+    Значения для UPDATE habits после новой записи о выполнении за `log_date`.
+
+    `completed` — SQL-выражение: выполнена ли привычка в этой записи. Выполнение
+    продлевает серию, пропуск сбрасывает ее, но только если запись — самая поздняя:
+    отметка задним числом (до `config.LOG_BACKDATE_DAYS` дней) не меняет ни серию,
+    ни поля last_log_*, а лишь добавляется к total_completed.
+    """
+    is_latest = or_(HabitInDB.last_log_date.is_(None), HabitInDB.last_log_date < log_date)
+    return {
+        "current_streak": case(
+            (and_(is_latest, completed), HabitInDB.current_streak + 1),
+            (is_latest, 0),
+            else_=HabitInDB.current_streak,
+        ),
+        "total_completed": case((completed, HabitInDB.total_completed + 1), else_=HabitInDB.total_completed),
+        "last_log_date": case((is_latest, log_date), else_=HabitInDB.last_log_date),
+        "last_log_completed": case((is_latest, completed), else_=HabitInDB.last_log_completed),
+    }
+
+
+def latest_log_values() -> dict:
+    """
+    Значения last_log_date / last_log_completed, вычисленные по последней записи в habit_logs.
+
+    Используется в UPDATE habits: подзапросы коррелируют с обновляемой строкой.
+    """
+    def latest(column):
+        return (
+            select(column)
+            .where(HabitLogInDB.habit_id == HabitInDB.id)
+            .order_by(HabitLogInDB.log_date.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+
+    return {
+        "last_log_date": latest(HabitLogInDB.log_date),
+        "last_log_completed": latest(HabitLogInDB.completed),
+    }
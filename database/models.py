@@ -1,11 +1,12 @@
 from sqlalchemy import (
     Column,
+    BigInteger,
     Integer,
     ForeignKey,
     DateTime,
     Text,
     String,
-    UniqueConstraint, TIMESTAMP, Date, Boolean,
+    UniqueConstraint, TIMESTAMP, Date, Boolean, Index, LargeBinary,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -14,19 +15,50 @@ from sqlalchemy.sql import func
 Base = declarative_base()
 
 
+class UserDirectoryInDB(Base):
+    """
+    Справочник пользователей в основной базе: выдает ID пользователя и указывает его шард.
+    """
+    __tablename__ = "user_directory"
+
+    user_id = Column(Integer, primary_key=True)  # ID пользователя, одинаковый во всех шардах
+    username = Column(String, unique=True, index=True, nullable=False)  # Имя пользователя
+    telegram_id = Column(BigInteger, unique=True, index=True, nullable=True)  # ID пользователя Telegram
+    shard = Column(Integer, nullable=False, default=0)  # Номер шарда (user_id % число шардов)
+
+
 class UserInDB(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Выборка пользователей для напоминаний; смещение и ID Telegram в индексе делают его покрывающим,
+        # иначе SQLite без ANALYZE предпочитает обход users по первичному ключу
+        Index("ix_users_reminder_utc_minute_id_offset", "reminder_utc_minute", "id", "utc_offset_minutes",
+              "telegram_id"),
+    )
+    __mapper_args__ = {"eager_defaults": True}  # Серверные значения читаются при flush, без отдельного refresh
 
     id = Column(Integer, primary_key=True, index=True)  # Уникальный идентификатор пользователя
     username = Column(String, unique=True, index=True)  # Уникальное имя пользователя
-    hashed_password = Column(String)  # Хеш пароля
+    hashed_password = Column(String)  # Хеш пароля (None у пользователей, входящих только через бота)
+    telegram_id = Column(BigInteger, unique=True, index=True, nullable=True)  # ID пользователя Telegram
     created_at = Column(TIMESTAMP, server_default=func.now())  # Дата создания записи пользователя
+    timezone = Column(String, nullable=False, default="UTC", server_default="UTC")  # Часовой пояс (IANA)
+    reminder_minute = Column(Integer, nullable=False, default=1200,
+                             server_default="1200")  # Время напоминания: минута местных суток
+    utc_offset_minutes = Column(Integer, nullable=False, default=0,
+                                server_default="0")  # Текущее смещение часового пояса от UTC в минутах
+    reminder_utc_minute = Column(Integer, nullable=False, default=1200,
+                                 server_default="1200")  # Время напоминания: минута суток UTC
 
     habits = relationship("HabitInDB", back_populates="user")  # Связь с привычками
 
 
 class HabitInDB(Base):
     __tablename__ = "habits"
+    __table_args__ = (
+        Index("ix_habits_user_id_is_tracked", "user_id", "is_tracked"),  # Привычки пользователя по флагу отслеживания
+    )
+    __mapper_args__ = {"eager_defaults": True}  # created_at / updated_at читаются при flush, без отдельного refresh
 
     id = Column(Integer, primary_key=True, index=True)  # Уникальный идентификатор привычки
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)  # Ссылка на пользователя
@@ -42,6 +74,8 @@ class HabitInDB(Base):
     updated_at = Column(TIMESTAMP, server_default=func.now(),
                         onupdate=func.now())  # Дата последнего обновления записи привычки
     is_tracked = Column(Boolean, nullable=False, default=True)  # Новая колонка: отслеживается привычка или нет
+    last_log_date = Column(Date, nullable=True)  # Дата последней записи о выполнении (копия из habit_logs)
+    last_log_completed = Column(Boolean, nullable=True)  # Флаг выполнения в последней записи (копия из habit_logs)
 
     user = relationship("UserInDB", back_populates="habits")  # Связь с пользователем
     logs = relationship("HabitLogInDB", back_populates="habit")  # Связь с записями о выполнении привычек
@@ -49,6 +83,10 @@ class HabitInDB(Base):
 
 class HabitLogInDB(Base):
     __tablename__ = "habit_logs"
+    __table_args__ = (
+        # Одна запись на привычку за день; ограничение заодно служит составным индексом (habit_id, log_date)
+        UniqueConstraint("habit_id", "log_date", name="uq_habit_logs_habit_id_log_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)  # Уникальный идентификатор записи о выполнении привычки
     habit_id = Column(Integer, ForeignKey('habits.id'), nullable=False)  # Ссылка на привычку
@@ -57,3 +95,15 @@ class HabitLogInDB(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())  # Дата создания записи
 
     habit = relationship("HabitInDB", back_populates="logs")  # Связь с привычкой
+
+
+class HabitBitmapInDB(Base):
+    """
+    Компактная копия habit_logs: битовые карты выполнения привычки за год (см. database.bitmaps).
+    """
+    __tablename__ = "habit_bitmaps"
+
+    habit_id = Column(Integer, ForeignKey('habits.id'), primary_key=True)  # Ссылка на привычку
+    year = Column(Integer, primary_key=True)  # Год карты
+    completed = Column(LargeBinary, nullable=False)  # Бит на день года: привычка выполнена
+    logged = Column(LargeBinary, nullable=False)  # Бит на день года: за день есть запись
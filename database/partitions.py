@@ -0,0 +1,246 @@
+"""
+Помесячное секционирование habit_logs в Postgres и холодный архив.
+
+habit_logs создается сырым DDL как PARTITION BY RANGE (log_date) до create_all, поэтому
+create_all его пропускает. Секции вида habit_logs_y2024m01 создаются заранее на
+`config.HABIT_LOG_PARTITIONS_AHEAD` месяцев вперед; даты вне созданных секций попадают
+в habit_logs_default и переносятся из нее при создании секции их месяца. Секции старше
+`config.HABIT_LOG_ARCHIVE_AFTER_MONTHS` месяцев отсоединяются от habit_logs
+и присоединяются к секционированной таблице habit_logs_archive без копирования данных.
+
+В SQLite секционирования нет, все функции модуля для него ничего не делают.
+"""
+import re
+from datetime import date
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import Table, MetaData, Column, Integer, Date, Boolean, TIMESTAMP, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from config import config
+
+PARTITION_NAME = re.compile(r"^habit_logs_y(\d{4})m(\d{2})$")
+
+# Архив создается только DDL этого модуля, поэтому описан вне Base.metadata
+habit_logs_archive = Table(
+    "habit_logs_archive",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("habit_id", Integer, nullable=False),
+    Column("log_date", Date, primary_key=True),
+    Column("completed", Boolean, nullable=False),
+    Column("created_at", TIMESTAMP),
+)
+
+CREATE_HABIT_LOGS = """
+CREATE TABLE habit_logs (
+    id SERIAL,
+    habit_id INTEGER NOT NULL REFERENCES habits (id),
+    log_date DATE NOT NULL,
+    completed BOOLEAN NOT NULL,
+    created_at TIMESTAMP DEFAULT now(),
+    PRIMARY KEY (id, log_date),
+    CONSTRAINT uq_habit_logs_habit_id_log_date UNIQUE (habit_id, log_date)
+) PARTITION BY RANGE (log_date)
+"""
+
+CREATE_HABIT_LOGS_ARCHIVE = """
+CREATE TABLE IF NOT EXISTS habit_logs_archive (
+    id INTEGER NOT NULL,
+    habit_id INTEGER NOT NULL,
+    log_date DATE NOT NULL,
+    completed BOOLEAN NOT NULL,
+    created_at TIMESTAMP,
+    PRIMARY KEY (id, log_date),
+    CONSTRAINT uq_habit_logs_archive_habit_id_log_date UNIQUE (habit_id, log_date)
+) PARTITION BY RANGE (log_date)
+"""
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"habit_logs_y{month.year}m{month.month:02d}"
+
+
+def archive_boundary(today: Optional[date] = None) -> Optional[date]:
+    """
+    Первый день, который еще лежит в habit_logs; более ранние месяцы могут быть в архиве.
+    None, если архивирование выключено.
+    """
+    if config.HABIT_LOG_ARCHIVE_AFTER_MONTHS <= 0:
+        return None
+    return add_months((today or date.today()).replace(day=1), -config.HABIT_LOG_ARCHIVE_AFTER_MONTHS)
+
+
+async def table_exists(conn: AsyncConnection, name: str) -> bool:
+    return (await conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})).scalar()
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    return (await conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('habit_logs'))"
+    ))).scalar()
+
+
+async def constraint_exists(conn: AsyncConnection, table: str, name: str) -> bool:
+    return (await conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = to_regclass(:table) AND conname = :name)"
+    ), {"table": table, "name": name})).scalar()
+
+
+async def create_partitioned_tables(conn: AsyncConnection) -> None:
+    """
+    Создает секционированные habit_logs (если таблицы еще нет), архив и секции на ближайшие месяцы.
+    Таблица habits к этому моменту должна существовать.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+
+    await conn.execute(text(CREATE_HABIT_LOGS_ARCHIVE))
+
+    if not await table_exists(conn, "habit_logs"):
+        await conn.execute(text(CREATE_HABIT_LOGS))
+        await conn.execute(text("CREATE TABLE habit_logs_default PARTITION OF habit_logs DEFAULT"))
+        logger.info("Создана секционированная таблица habit_logs")
+    elif not await is_partitioned(conn):
+        logger.warning("habit_logs не секционирована, выполните python -m database.backfill")
+        return
+
+    await ensure_monthly_partitions(conn)
+
+
+async def ensure_monthly_partitions(conn: AsyncConnection, today: Optional[date] = None,
+                                    months_ahead: int = config.HABIT_LOG_PARTITIONS_AHEAD) -> None:
+    """
+    Создает секции с прошлого месяца (пользователи западнее UTC) до `months_ahead` месяцев вперед.
+    """
+    first_month = add_months((today or date.today()).replace(day=1), -1)
+    for offset in range(months_ahead + 2):
+        await create_month_partition(conn, add_months(first_month, offset))
+
+
+async def create_month_partition(conn: AsyncConnection, month: date) -> None:
+    """
+    Создает секцию habit_logs за месяц `month`, если ее еще нет.
+
+    Записи за этот месяц могли попасть в habit_logs_default, пока секции не было; с ними
+    CREATE TABLE ... PARTITION OF падает. Поэтому секция создается отдельной таблицей,
+    записи месяца переносятся в нее из habit_logs_default, и только затем она присоединяется.
+    """
+    name = partition_name(month)
+    if await table_exists(conn, name):
+        return
+
+    bounds = {"start": month, "end": add_months(month, 1)}
+    # Вставки за этот месяц до присоединения секции снова попали бы в default и сорвали ATTACH
+    await conn.execute(text("LOCK TABLE habit_logs_default IN SHARE ROW EXCLUSIVE MODE"))
+    await conn.execute(text(f"CREATE TABLE {name} (LIKE habit_logs INCLUDING DEFAULTS)"))
+    moved = (await conn.execute(text(
+        "WITH moved AS (DELETE FROM habit_logs_default WHERE log_date >= :start AND log_date < :end "
+        "RETURNING id, habit_id, log_date, completed, created_at) "
+        f"INSERT INTO {name} (id, habit_id, log_date, completed, created_at) SELECT * FROM moved"
+    ), bounds)).rowcount
+    await conn.execute(text(
+        f"ALTER TABLE habit_logs ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{bounds['start'].isoformat()}') TO ('{bounds['end'].isoformat()}')"
+    ))
+    if moved:
+        logger.info(f"Создана секция {name}, из habit_logs_default перенесено строк: {moved}")
+
+
+async def archive_old_partitions(conn: AsyncConnection, today: Optional[date] = None) -> list[str]:
+    """
+    Переносит секции, целиком лежащие раньше archive_boundary, из habit_logs в habit_logs_archive.
+    """
+    boundary = archive_boundary(today)
+    if conn.dialect.name != "postgresql" or boundary is None:
+        return []
+
+    partitions = (await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('habit_logs')"
+    ))).scalars().all()
+
+    archived = []
+    for name in sorted(partitions):
+        match = PARTITION_NAME.match(name)
+        if match is None:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if add_months(month, 1) > boundary:
+            continue
+
+        await conn.execute(text(f"ALTER TABLE habit_logs DETACH PARTITION {name}"))
+        await conn.execute(text(
+            f"ALTER TABLE habit_logs_archive ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+        archived.append(name)
+        logger.info(f"Секция {name} перенесена в архив")
+    return archived
+
+
+async def migrate_to_partitioned(conn: AsyncConnection) -> int:
+    """
+    Переводит существующую несекционированную habit_logs на секции: создает новую таблицу
+    с секциями на весь диапазон дат, переносит строки и удаляет старую. Возвращает число строк.
+    """
+    if conn.dialect.name != "postgresql" or not await table_exists(conn, "habit_logs") \
+            or await is_partitioned(conn):
+        return 0
+
+    await conn.execute(text("ALTER TABLE habit_logs RENAME TO habit_logs_unpartitioned"))
+    await conn.execute(text("ALTER INDEX IF EXISTS habit_logs_pkey RENAME TO habit_logs_unpartitioned_pkey"))
+    await conn.execute(text("ALTER INDEX IF EXISTS ix_habit_logs_id RENAME TO ix_habit_logs_unpartitioned_id"))
+    # Таблица, созданная до ограничения, может не иметь его вовсе или иметь только
+    # уникальный индекс из database.backfill с тем же именем
+    if await constraint_exists(conn, "habit_logs_unpartitioned", "uq_habit_logs_habit_id_log_date"):
+        await conn.execute(text(
+            "ALTER TABLE habit_logs_unpartitioned RENAME CONSTRAINT uq_habit_logs_habit_id_log_date "
+            "TO uq_habit_logs_unpartitioned_habit_id_log_date"
+        ))
+    else:
+        await conn.execute(text(
+            "ALTER INDEX IF EXISTS uq_habit_logs_habit_id_log_date "
+            "RENAME TO uq_habit_logs_unpartitioned_habit_id_log_date"
+        ))
+
+    await conn.execute(text(CREATE_HABIT_LOGS))
+    await conn.execute(text("CREATE TABLE habit_logs_default PARTITION OF habit_logs DEFAULT"))
+
+    first_date, last_date = (await conn.execute(text(
+        "SELECT min(log_date), max(log_date) FROM habit_logs_unpartitioned"
+    ))).one()
+    if first_date is not None:
+        month = first_date.replace(day=1)
+        while month <= last_date:
+            await create_month_partition(conn, month)
+            month = add_months(month, 1)
+    await ensure_monthly_partitions(conn)
+
+    # Дубли, которые создавала прежняя проверка-и-вставка, нарушили бы уникальность новой таблицы;
+    # остается самая ранняя запись, как в database.backfill
+    removed = (await conn.execute(text(
+        "DELETE FROM habit_logs_unpartitioned AS duplicate USING habit_logs_unpartitioned AS kept "
+        "WHERE duplicate.habit_id = kept.habit_id AND duplicate.log_date = kept.log_date "
+        "AND duplicate.id > kept.id"
+    ))).rowcount
+    if removed:
+        logger.info(f"Удалено дублей habit_logs: {removed}")
+
+    moved = (await conn.execute(text(
+        "INSERT INTO habit_logs (id, habit_id, log_date, completed, created_at) "
+        "SELECT id, habit_id, log_date, completed, created_at FROM habit_logs_unpartitioned"
+    ))).rowcount
+    await conn.execute(text(
+        "SELECT setval(pg_get_serial_sequence('habit_logs', 'id'), "
+        "COALESCE((SELECT max(id) FROM habit_logs), 0) + 1, false)"
+    ))
+    await conn.execute(text("DROP TABLE habit_logs_unpartitioned"))
+    logger.info(f"habit_logs переведена на секции, перенесено строк: {moved}")
+    return moved
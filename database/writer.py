@@ -0,0 +1,148 @@
+"""
+Единственный писатель для SQLite с групповым коммитом.
+
+SQLite допускает одну пишущую транзакцию за раз, и при конкурентных записях запросы
+получают "database is locked". Операции записи ставятся в очередь, один фоновый таск
+выполняет накопившиеся операции в одной транзакции (каждую в своем SAVEPOINT) и
+фиксирует их одним коммитом. Транзакция пакета начинается с BEGIN IMMEDIATE (begin_write). Ошибка операции откатывает только ее SAVEPOINT и
+возвращается вызывающему.
+"""
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config import config
+from database.db import async_session, begin_write, engine, is_sqlite, RecentWriters
+
+T = TypeVar("T")
+WriteOperation = Callable[[AsyncSession], Awaitable[T]]
+
+
+class WriteQueue:
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession],
+                 batch_size: int = config.SQLITE_WRITE_BATCH_SIZE,
+                 batch_delay: float = config.SQLITE_WRITE_BATCH_DELAY_SECONDS):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.queue: asyncio.Queue | None = None
+        self.task: asyncio.Task | None = None
+        self.batches = 0
+        self.writes = 0
+        self.failed_commits = 0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run(), name="sqlite-writer")
+        logger.info("Запущен писатель SQLite с групповым коммитом.")
+
+    async def stop(self) -> None:
+        """
+        Дожидается выполнения поставленных операций и останавливает писателя.
+        """
+        if not self.running:
+            return
+        await self.queue.join()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    async def submit(self, operation: WriteOperation) -> T:
+        """
+        Ставит `operation(session)` в очередь и ждет ее результата после коммита пакета.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((operation, future))
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self.queue.get()]
+            waited = False
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    if waited or self.batch_delay <= 0:
+                        break
+                    await asyncio.sleep(self.batch_delay)
+                    waited = True
+            try:
+                await self._write(batch)
+            except Exception as e:
+                logger.error(f"Writer batch failed: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _write(self, batch: list) -> None:
+        outcomes = []
+        async with self.session_factory() as session:
+            try:
+                # Операции пакета часто начинаются с чтения; без IMMEDIATE коммит другого соединения
+                # между чтением и записью дал бы SQLITE_BUSY сразу, и упали бы все остальные операции пакета
+                await begin_write(session)
+                for operation, future in batch:
+                    if future.done():
+                        # Запрос уже отменен, например клиент отключился
+                        continue
+                    try:
+                        async with session.begin_nested():
+                            outcomes.append((future, await operation(session), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+                await session.commit()
+            except Exception as e:
+                self.failed_commits += 1
+                await session.rollback()
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+        self.batches += 1
+        self.writes += len(outcomes)
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def metrics(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "batches": self.batches,
+            "writes": self.writes,
+            "avg_batch_size": round(self.writes / self.batches, 2) if self.batches else 0.0,
+            "failed_commits": self.failed_commits,
+        }
+
+
+write_queue = WriteQueue(async_session)
+
+
+def write_queue_enabled() -> bool:
+    return config.SQLITE_WRITE_QUEUE and is_sqlite(engine)
+
+
+async def run_write(db: AsyncSession, user_id: int, operation: WriteOperation) -> T:
+    """
+    Выполняет операцию записи пользователя `user_id` через писателя SQLite, если он запущен
+    и `db` подключена к основной базе, иначе в сессии запроса `db`. Чтения пользователя
+    после этого на время идут в основную базу.
+    """
+    RecentWriters.mark(user_id)
+    if write_queue.running and db.bind is engine:
+        return await write_queue.submit(operation)
+    return await operation(db)
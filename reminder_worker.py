@@ -0,0 +1,125 @@
+"""
+Асинхронный воркер рассылки напоминаний.
+
+В отличие от задач Celery, живет в одном постоянном event loop: сессия бота,
+пул соединений с базой и клиент Redis создаются один раз при запуске и
+переиспользуются всеми заданиями. Задания (шарды окна рассылки) берутся из
+списка Redis `config.REMINDER_QUEUE`, куда их кладет tasks.send_habit_reminders
+при REMINDER_EXECUTOR=async, и обрабатываются параллельно.
+
+Запуск: python reminder_worker.py
+"""
+import asyncio
+import json
+import signal
+import sys
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from loguru import logger
+from redis import asyncio as aioredis
+
+from config import config
+from database.db import shard_engines, shard_sessions
+from reminders import ReminderEngine, TokenBucket
+
+Hook = Callable[["ReminderWorker"], Awaitable[None]]
+
+
+class ReminderWorker:
+    poll_timeout = 1  # Секунд ожидания задания, после которых проверяется флаг остановки
+
+    def __init__(self, concurrency: int = config.REMINDER_WORKER_CONCURRENCY):
+        self.concurrency = concurrency
+        self.startup_hooks: list[Hook] = []
+        self.shutdown_hooks: list[Hook] = []
+
+        self.bot: Bot | None = None
+        self.redis: aioredis.Redis | None = None
+        self.bucket = TokenBucket(config.REMINDER_RATE_LIMIT)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.stopping = asyncio.Event()
+        self.jobs: set[asyncio.Task] = set()
+
+    def on_startup(self, hook: Hook) -> Hook:
+        self.startup_hooks.append(hook)
+        return hook
+
+    def on_shutdown(self, hook: Hook) -> Hook:
+        self.shutdown_hooks.append(hook)
+        return hook
+
+    async def startup(self) -> None:
+        self.bot = Bot(token=config.TOKEN, session=AiohttpSession(limit=config.REMINDER_CONCURRENCY))
+        self.redis = aioredis.from_url(config.CELERY_BROKER_URL)
+
+        for hook in self.startup_hooks:
+            await hook(self)
+        logger.info(f"Воркер напоминаний запущен, очередь {config.REMINDER_QUEUE}")
+
+    async def shutdown(self) -> None:
+        if self.jobs:
+            logger.info(f"Ожидание завершения заданий: {len(self.jobs)}")
+            await asyncio.gather(*self.jobs, return_exceptions=True)
+
+        for hook in self.shutdown_hooks:
+            await hook(self)
+
+        await self.bot.session.close()
+        await self.redis.aclose()
+        for shard_engine in shard_engines:
+            await shard_engine.dispose()
+        logger.info("Воркер напоминаний остановлен")
+
+    async def run(self) -> None:
+        await self.startup()
+        try:
+            while not self.stopping.is_set():
+                await self.semaphore.acquire()
+                item = await self.redis.blpop([config.REMINDER_QUEUE], timeout=self.poll_timeout)
+                if item is None:
+                    self.semaphore.release()
+                    continue
+
+                job = asyncio.create_task(self.process(json.loads(item[1])))
+                self.jobs.add(job)
+                job.add_done_callback(self.jobs.discard)
+        finally:
+            await self.shutdown()
+
+    async def process(self, job: dict) -> None:
+        try:
+            reminder_engine = ReminderEngine(self.bot, shard_sessions[job.get("db_shard", 0)], bucket=self.bucket)
+            stats = await reminder_engine.run(
+                window_start=datetime.fromisoformat(job["window_start"]),
+                shard_index=job["shard_index"],
+                shard_count=job["shard_count"],
+            )
+            logger.info(f"Задание {job} выполнено: пользователей {stats.users}, "
+                        f"отправлено {stats.sent}, ошибок {stats.failed}")
+        except Exception as e:
+            logger.error(f"Задание {job} завершилось ошибкой: {e}")
+        finally:
+            self.semaphore.release()
+
+    def stop(self) -> None:
+        self.stopping.set()
+
+
+async def main() -> None:
+    worker = ReminderWorker()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    await worker.run()
+
+
+if __name__ == "__main__":
+    logger.remove()
+    logger.add(sys.stdout, level="INFO", format="{time} - {level} - {message}")
+
+    asyncio.run(main())
@@ -0,0 +1,224 @@
+"""
+Рассылка напоминаний о неотмеченных привычках.
+
+За один запуск обрабатывается окно времени: выбираются только пользователи,
+чье местное время напоминания попадает в это окно. Пользователи выбираются
+порциями с keyset-пагинацией по (reminder_utc_minute, user_id), поэтому память не растет с числом
+пользователей. Каждый пользователь получает одно сообщение
+со всеми неотмеченными привычками. Отправка идет с ограниченной параллельностью
+через token bucket, который соблюдает глобальный лимит Telegram и паузы из
+TelegramRetryAfter.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from loguru import logger
+from sqlalchemy import select, or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config import config
+from database.db import SHARD_URLS
+from database.models import HabitInDB, UserInDB
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты: не более `rate` операций в секунду с запасом `capacity`.
+
+    Запас не меньше одной операции: при `rate` < 1 (лимит Telegram, поделенный между
+    многими шардами) иначе ни одна операция не набрала бы целый токен.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = max(1.0, capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Останавливает выдачу на `seconds` секунд (ответ Telegram с retry_after).
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+@dataclass
+class ReminderStats:
+    users: int = 0
+    sent: int = 0
+    failed: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def rate(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+
+class ReminderEngine:
+    max_attempts = 3
+
+    def __init__(
+            self,
+            bot: Bot,
+            session_factory: async_sessionmaker[AsyncSession],
+            chunk_size: int = config.REMINDER_CHUNK_SIZE,
+            concurrency: int = config.REMINDER_CONCURRENCY,
+            rate_limit: float = config.REMINDER_RATE_LIMIT,
+            bucket: Optional[TokenBucket] = None,
+    ):
+        self.bot = bot
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # Общий bucket позволяет нескольким рассылкам одного бота делить лимит Telegram
+        self.bucket = bucket or TokenBucket(rate_limit)
+
+    async def run(self, window_start: Optional[datetime] = None,
+                  window_minutes: int = config.REMINDER_WINDOW_MINUTES,
+                  shard_index: int = 0, shard_count: int = 1) -> ReminderStats:
+        """
+        Рассылает напоминания пользователям, чье время напоминания по UTC попадает
+        в окно [window_start, window_start + window_minutes).
+
+        Окно выбирается по предвычисленной колонке users.reminder_utc_minute, а
+        «сегодня» для каждого пользователя считается по его смещению от UTC.
+        При `shard_count` > 1 обрабатываются только пользователи
+        с (user_id // len(SHARD_URLS)) % shard_count == shard_index.
+        """
+        window_start = window_start or reminder_window_start(datetime.utcnow(), window_minutes)
+        stats = ReminderStats()
+        first_minute = window_start.hour * 60 + window_start.minute
+        position: Optional[tuple[int, int]] = (first_minute, 0)
+
+        while True:
+            async with self.session_factory() as session:
+                position, pending = await self.fetch_pending(
+                    session, window_start, window_minutes, position, shard_index, shard_count
+                )
+            if position is None:
+                break
+
+            stats.users += len(pending)
+            await asyncio.gather(*(
+                self.send_reminder(chat_id, habit_names, stats)
+                for chat_id, habit_names in pending.items()
+            ))
+            logger.info(f"Напоминания [шард {shard_index}/{shard_count}]: пользователей {stats.users}, "
+                        f"отправлено {stats.sent}, ошибок {stats.failed}, {stats.rate:.1f} сообщ./с")
+
+        logger.info(f"Рассылка [шард {shard_index}/{shard_count}] завершена за {stats.elapsed:.1f} с: "
+                    f"отправлено {stats.sent}, ошибок {stats.failed}, {stats.rate:.1f} сообщ./с")
+        return stats
+
+    async def fetch_pending(self, session: AsyncSession, window_start: datetime, window_minutes: int,
+                            after: tuple[int, int], shard_index: int = 0,
+                            shard_count: int = 1) -> tuple[Optional[tuple[int, int]], dict[int, list[str]]]:
+        """
+        Берет следующую порцию пользователей окна после позиции `after` = (reminder_utc_minute, user_id)
+        и их неотмеченные привычки.
+
+        Порядок совпадает с индексом ix_users_reminder_utc_minute_id_offset, поэтому порция читается
+        из индекса без сортировки и без обхода таблицы. Пользователи без ID Telegram (еще не входили
+        через бота после его появления) пропускаются: написать им некуда. Возвращает позицию
+        последнего пользователя (None, если пользователи закончились) и словарь
+        ID чата Telegram -> названия привычек.
+        """
+        first_minute = window_start.hour * 60 + window_start.minute
+        conditions = [
+            tuple_(UserInDB.reminder_utc_minute, UserInDB.id) > tuple_(*after),
+            UserInDB.reminder_utc_minute >= first_minute,
+            UserInDB.reminder_utc_minute < first_minute + window_minutes,
+            UserInDB.telegram_id.is_not(None),
+        ]
+        if shard_count > 1:
+            # Базы-шарды уже делят пользователей по user_id % len(SHARD_URLS): остаток внутри базы
+            # одинаков, поэтому части режутся по частному, иначе часть из них всегда пуста
+            conditions.append((UserInDB.id // len(SHARD_URLS)) % shard_count == shard_index)
+
+        users = (await session.execute(
+            select(UserInDB.id, UserInDB.reminder_utc_minute, UserInDB.utc_offset_minutes, UserInDB.telegram_id)
+            .where(*conditions)
+            .order_by(UserInDB.reminder_utc_minute, UserInDB.id)
+            .limit(self.chunk_size)
+        )).all()
+        if not users:
+            return None, {}
+
+        # Местная дата зависит только от смещения, поэтому пользователи порции группируются по дате
+        users_by_day: dict[date, list[int]] = {}
+        chat_ids: dict[int, int] = {}
+        for user_id, _, offset, telegram_id in users:
+            chat_ids[user_id] = telegram_id
+            local_day = (window_start + timedelta(minutes=offset)).date()
+            users_by_day.setdefault(local_day, []).append(user_id)
+
+        pending: dict[int, list[str]] = {}
+        for local_day, user_ids in users_by_day.items():
+            result = await session.execute(
+                select(HabitInDB.user_id, HabitInDB.name)
+                .where(
+                    HabitInDB.user_id.in_(user_ids),
+                    HabitInDB.is_tracked == True,
+                    or_(HabitInDB.last_log_date.is_(None), HabitInDB.last_log_date < local_day),
+                )
+                .order_by(HabitInDB.user_id, HabitInDB.id)
+            )
+            for user_id, name in result:
+                pending.setdefault(chat_ids[user_id], []).append(name)
+
+        return (users[-1].reminder_utc_minute, users[-1].id), pending
+
+    async def send_reminder(self, chat_id: int, habit_names: list[str], stats: ReminderStats) -> None:
+        text = "⏰ Не забудьте отметить привычки за сегодня:\n" + "\n".join(f"• {name}" for name in habit_names)
+
+        async with self.semaphore:
+            for attempt in range(1, self.max_attempts + 1):
+                await self.bucket.acquire()
+                try:
+                    await self.bot.send_message(chat_id, text)
+                    stats.sent += 1
+                    return
+                except TelegramRetryAfter as e:
+                    logger.warning(f"Лимит Telegram, пауза {e.retry_after} с (попытка {attempt})")
+                    self.bucket.pause(e.retry_after)
+                except TelegramAPIError as e:
+                    logger.error(f"Не удалось отправить напоминание в чат {chat_id}: {e}")
+                    break
+
+        stats.failed += 1
+
+
+def reminder_window_start(now: datetime, window_minutes: int) -> datetime:
+    """
+    Начало окна рассылки, в которое попадает момент `now` (UTC).
+    """
+    minute = now.hour * 60 + now.minute
+    return now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(minutes=minute - minute % window_minutes)
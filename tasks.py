@@ -1,28 +1,176 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional, AsyncIterator
+
+from aiogram import Bot
+from celery import chord
+from loguru import logger
+from redis import Redis
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import NullPool
+
 from celery_app import celery_app
-from database.db import get_db
-from database.models import HabitInDB, HabitLogInDB
-from sqlalchemy import select
-from datetime import datetime
-from TG.bot import bot
+from config import config
+from database.db import SHARD_URLS, unit_of_work
+from database.func_db import UserCRUD
+from database.partitions import ensure_monthly_partitions, archive_old_partitions
+from reminders import ReminderEngine, ReminderStats, reminder_window_start
+
+
+@celery_app.task
+def send_habit_reminders(shard_count: Optional[int] = None) -> str:
+    """
+    Координатор рассылки: делит пользователей текущего окна каждой базы-шарда (SHARD_URLS)
+    на shard_count частей по (user_id // len(SHARD_URLS)) % shard_count; все части обрабатываются параллельно.
+
+    При REMINDER_EXECUTOR=celery шарды запускаются группой задач, итоги собирает callback аккорда.
+    При REMINDER_EXECUTOR=async задания шардов уходят в очередь асинхронного reminder_worker.
+    """
+    shard_count = shard_count or config.REMINDER_SHARDS
+    # Окно фиксируется здесь, чтобы шарды, запущенные с задержкой, обработали то же окно
+    window_start = reminder_window_start(datetime.utcnow(), config.REMINDER_WINDOW_MINUTES).isoformat()
+
+    if config.REMINDER_EXECUTOR == "async":
+        enqueue_reminder_jobs(shard_count, window_start)
+        logger.info(f"Рассылка напоминаний за окно {window_start} передана reminder_worker: {shard_count} шардов")
+        return window_start
+
+    header = [send_habit_reminders_shard.s(shard_index, shard_count, window_start, db_shard)
+              for db_shard in range(len(SHARD_URLS))
+              for shard_index in range(shard_count)]
+    result = chord(header)(summarize_habit_reminders.s())
+    logger.info(f"Рассылка напоминаний за окно {window_start} запущена на {len(header)} шардах")
+    return result.id
+
+
+def enqueue_reminder_jobs(shard_count: int, window_start: str) -> None:
+    """
+    Кладет задания шардов в список Redis, который читает reminder_worker.
+    """
+    jobs = [
+        json.dumps({"shard_index": shard_index, "shard_count": shard_count, "window_start": window_start,
+                    "db_shard": db_shard})
+        for db_shard in range(len(SHARD_URLS))
+        for shard_index in range(shard_count)
+    ]
+    with Redis.from_url(config.CELERY_BROKER_URL) as redis:
+        redis.rpush(config.REMINDER_QUEUE, *jobs)
+
+
+@celery_app.task
+def send_habit_reminders_shard(shard_index: int, shard_count: int, window_start: str, db_shard: int = 0) -> dict:
+    stats = asyncio.run(run_reminder_shard(shard_index, shard_count, datetime.fromisoformat(window_start), db_shard))
+    return {"db_shard": db_shard, "shard": shard_index,
+            "users": stats.users, "sent": stats.sent, "failed": stats.failed}
+
+
+@celery_app.task
+def summarize_habit_reminders(results: list[dict]) -> dict:
+    totals = {key: sum(result[key] for result in results) for key in ("users", "sent", "failed")}
+    logger.info(f"Рассылка напоминаний завершена: {totals}")
+    return totals
 
 
 @celery_app.task
-async def send_habit_reminders():
+def refresh_user_utc_offsets() -> int:
+    """
+    Пересчитывает смещения пользователей от UTC (переходы на летнее/зимнее время) во всех шардах параллельно.
 
-    today = datetime.utcnow().date()
+    Запускается за несколько минут до начала часа и считает смещения на ближайшую границу часа,
+    когда переводят часы: окна рассылки начиная с этого часа выбираются уже по новым смещениям.
+    """
+    at = offsets_boundary(datetime.now(timezone.utc))
 
-    async with get_db() as session:
+    async def refresh_shard(db_shard: int) -> int:
+        async with task_session_factory(db_shard) as session_factory:
+            async with unit_of_work(session_factory) as session:
+                return await UserCRUD(session).refresh_utc_offsets(at)
 
-        result = await session.execute(
-            select(HabitInDB)
-            .where(HabitInDB.is_tracked == True)
-            .where(~session.query(HabitLogInDB)
-                .filter(HabitLogInDB.habit_id == HabitInDB.id, HabitLogInDB.log_date == today).exists())
+    async def refresh() -> int:
+        return sum(await asyncio.gather(*(refresh_shard(db_shard) for db_shard in range(len(SHARD_URLS)))))
+
+    updated = asyncio.run(refresh())
+    logger.info(f"Обновлены смещения часовых поясов: {updated} пользователей")
+    return updated
+
+
+def offsets_boundary(now: datetime) -> datetime:
+    """
+    Ближайшая к `now` граница часа: следующая при запуске в :55, текущая, если задача запоздала.
+    """
+    return (now + timedelta(minutes=30)).replace(minute=0, second=0, microsecond=0)
+
+
+@celery_app.task
+def maintain_habit_log_partitions() -> list[str]:
+    """
+    Создает секции habit_logs на ближайшие месяцы и переносит старые секции в архив во всех шардах.
+    В SQLite ничего не делает.
+
+    Шарды обслуживаются независимо: ошибка в одном шарде откатывает только его транзакцию
+    и не мешает остальным; после обработки всех шардов задача завершается ошибкой со списком
+    неудавшихся шардов.
+    """
+    async def maintain_shard(db_shard: int) -> list[str]:
+        async with task_session_factory(db_shard) as session_factory:
+            async with unit_of_work(session_factory) as session:
+                conn = await session.connection()
+                if conn.dialect.name != "postgresql":
+                    return []
+                await ensure_monthly_partitions(conn)
+                return await archive_old_partitions(conn)
+
+    async def maintain() -> list[str]:
+        results = await asyncio.gather(
+            *(maintain_shard(db_shard) for db_shard in range(len(SHARD_URLS))), return_exceptions=True
         )
-        habits = result.scalars().all()
+        archived, failed = [], []
+        for db_shard, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.opt(exception=result).error(f"Шард {db_shard}: не удалось обслужить секции habit_logs")
+                failed.append(db_shard)
+            else:
+                archived.extend(result)
+        if failed:
+            raise RuntimeError(f"Секции habit_logs не обслужены в шардах {failed}, в архив перенесено: {archived}")
+        return archived
+
+    archived = asyncio.run(maintain())
+    logger.info(f"Обслуживание секций habit_logs завершено, в архив перенесено: {archived}")
+    return archived
+
+
+@asynccontextmanager
+async def task_session_factory(db_shard: int = 0) -> AsyncIterator[async_sessionmaker[AsyncSession]]:
+    """
+    Фабрика сессий базы-шарда `db_shard` для одного запуска задачи в собственном event loop.
+
+    Пул соединений привязан к циклу событий, поэтому движок создается на каждый запуск.
+    """
+    engine = create_async_engine(SHARD_URLS[db_shard], poolclass=NullPool)
+    try:
+        yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    finally:
+        await engine.dispose()
+
+
+async def run_reminder_shard(shard_index: int, shard_count: int, window_start: datetime,
+                             db_shard: int = 0) -> ReminderStats:
+    """
+    Обрабатывает один шард базы-шарда `db_shard` в собственном event loop.
+
+    Сессия бота создается на каждый запуск по той же причине, что и пул соединений.
+    Глобальный лимит Telegram делится между всеми параллельными шардами поровну.
+    """
+    bot = Bot(token=config.TOKEN)
 
-        for habit in habits:
-            await bot.send_message(
-                habit.user_id,  # Отправляем сообщение пользователю с этим ID
-                f"⏰ Не забудьте отметить привычку '{habit.name}' за сегодня!"
-            )
\ No newline at end of file
+    try:
+        async with task_session_factory(db_shard) as session_factory:
+            reminder_engine = ReminderEngine(bot, session_factory,
+                                             rate_limit=config.REMINDER_RATE_LIMIT / (shard_count * len(SHARD_URLS)))
+            return await reminder_engine.run(window_start=window_start,
+                                             shard_index=shard_index, shard_count=shard_count)
+    finally:
+        await bot.session.close()
@@ -0,0 +1,136 @@
+"""
+Общие фикстуры тестов: основная база и два шарда — отдельные файлы SQLite во временном каталоге.
+
+Настройки читаются при импорте config, поэтому переменные окружения задаются до импорта модулей проекта.
+"""
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+from contextlib import asynccontextmanager, contextmanager
+
+DB_DIR = tempfile.mkdtemp(prefix="habit-tests-")
+os.environ.update({
+    "TOKEN": "123456:test-token",
+    "URL_DB": f"sqlite:///{DB_DIR}/primary.db",
+    "DB_SHARD_URLS": f"sqlite:///{DB_DIR}/shard0.db,sqlite:///{DB_DIR}/shard1.db",
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "URL": "http://testserver",
+    "REFRESH_TOKEN_EXPIRE_DAYS": "7",
+    "BOT_SHARED_SECRET": "test-bot-secret",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest_asyncio
+import uvicorn
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import delete, event
+
+from api.auth import AuthService, TokenCache, UserCache
+from api.handlers import router
+from database.db import engine, init_db, shard_engines, shard_for_user, unit_of_work, RecentWriters
+from database.func_db import UserCRUD
+from database.models import Base, UserInDB
+
+
+@pytest_asyncio.fixture
+async def database():
+    """
+    Пустые таблицы во всех базах. Пулы закрываются после каждого теста: соединения aiosqlite
+    привязаны к циклу событий теста.
+    """
+    await init_db()
+    yield
+    for db_engine in [engine, *shard_engines]:
+        async with db_engine.begin() as conn:
+            for table in reversed(Base.metadata.sorted_tables):
+                await conn.execute(delete(table))
+        await db_engine.dispose()
+    UserCache.entries.clear()
+    TokenCache.clear()
+    RecentWriters.deadlines.clear()
+
+
+def api_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+@pytest_asyncio.fixture
+async def client(database):
+    async with AsyncClient(transport=ASGITransport(app=api_app()), base_url="http://testserver") as http_client:
+        yield http_client
+
+
+@asynccontextmanager
+async def running_api(sock: socket.socket):
+    """
+    API на uvicorn в цикле событий теста, на уже открытом сокете (TCP или Unix), как api.main с bind_sockets.
+    """
+    server = uvicorn.Server(uvicorn.Config(api_app(), log_level="warning", lifespan="off"))
+    serving = asyncio.create_task(server.serve(sockets=[sock]))
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.01)
+    try:
+        yield server
+    finally:
+        server.should_exit = True
+        await serving
+
+
+def auth_headers(user) -> dict:
+    return {"Authorization": f"Bearer {AuthService.create_access_token(AuthService.token_claims(user))}"}
+
+
+@contextmanager
+def recorded_statements(db_engine):
+    """
+    Собирает SQL-запросы (текст и параметры), которые движок отправляет в базу.
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+async def create_user(username: str, telegram_id: int) -> UserInDB:
+    """
+    Пользователь бота без пароля (без bcrypt), внесенный в справочник и в свой шард.
+    """
+    async with unit_of_work() as session:
+        user, _ = await UserCRUD(session).get_or_create_bot_user(telegram_id, username)
+    return user
+
+
+def user_shard(user: UserInDB):
+    return shard_engines[shard_for_user(user.id)]
+
+
+@contextmanager
+def counted_commits(db_engine):
+    """
+    Считает коммиты транзакций движка; значение — в списке из одного элемента.
+    """
+    commits = [0]
+
+    def on_commit(conn):
+        commits[0] += 1
+
+    event.listen(db_engine.sync_engine, "commit", on_commit)
+    try:
+        yield commits
+    finally:
+        event.remove(db_engine.sync_engine, "commit", on_commit)
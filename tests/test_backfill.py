@@ -0,0 +1,87 @@
+"""
+Обновление схемы базы, созданной до ограничений и индексов (database.backfill).
+"""
+from datetime import date
+
+import pytest
+from sqlalchemy import select, text, func
+
+from database.backfill import add_missing_schema
+from database.db import build_engine
+from database.func_db import DIALECT_INSERTS
+from database.models import Base, HabitLogInDB
+from tests.conftest import DB_DIR
+
+pytestmark = pytest.mark.asyncio
+
+OLD_HABIT_LOGS = """
+CREATE TABLE habit_logs (
+    id INTEGER NOT NULL PRIMARY KEY,
+    habit_id INTEGER NOT NULL REFERENCES habits (id),
+    log_date DATE NOT NULL,
+    completed BOOLEAN NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+async def test_backfill_adds_habit_log_unique_index():
+    db_engine = build_engine(f"sqlite:///{DB_DIR}/old_schema.db")
+    try:
+        async with db_engine.begin() as conn:
+            tables = [table for table in Base.metadata.sorted_tables if table.name != "habit_logs"]
+            await conn.run_sync(Base.metadata.create_all, tables=tables)
+            await conn.execute(text(OLD_HABIT_LOGS))
+            await conn.execute(text(
+                "INSERT INTO users (id, username) VALUES (1, 'old_user')"
+            ))
+            await conn.execute(text(
+                "INSERT INTO habits (id, user_id, name, target_days, streak_days, start_date, is_tracked) "
+                "VALUES (1, 1, 'habit', 21, 21, '2024-01-01', 1)"
+            ))
+            # Дубли, которые создавала гонка проверки и вставки
+            await conn.execute(text(
+                "INSERT INTO habit_logs (id, habit_id, log_date, completed) VALUES "
+                "(1, 1, '2024-01-02', 1), (2, 1, '2024-01-02', 0), (3, 1, '2024-01-03', 1)"
+            ))
+
+        async with db_engine.begin() as conn:
+            await add_missing_schema(conn)
+
+        async with db_engine.begin() as conn:
+            remaining = (await conn.execute(select(HabitLogInDB.id).order_by(HabitLogInDB.id))).scalars().all()
+            assert remaining == [1, 3]
+
+            insert = DIALECT_INSERTS["sqlite"]
+            inserted = (await conn.execute(
+                insert(HabitLogInDB)
+                .values(habit_id=1, log_date=date(2024, 1, 3), completed=False)
+                .on_conflict_do_nothing(index_elements=["habit_id", "log_date"])
+                .returning(HabitLogInDB.id)
+            )).first()
+            assert inserted is None
+            assert (await conn.execute(select(func.count()).select_from(HabitLogInDB))).scalar() == 2
+    finally:
+        await db_engine.dispose()
+
+
+async def test_backfill_drops_unused_habit_index():
+    db_engine = build_engine(f"sqlite:///{DB_DIR}/old_indexes.db")
+    try:
+        async with db_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(text(
+                "CREATE INDEX ix_habits_is_tracked_last_log_date ON habits (is_tracked, last_log_date)"
+            ))
+
+        async with db_engine.begin() as conn:
+            await add_missing_schema(conn)
+
+        async with db_engine.begin() as conn:
+            indexes = (await conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'habits'"
+            ))).scalars().all()
+            assert "ix_habits_is_tracked_last_log_date" not in indexes
+            assert "ix_habits_user_id_is_tracked" in indexes
+    finally:
+        await db_engine.dispose()
@@ -0,0 +1,139 @@
+"""
+Статистика привычек по битовым картам (database.bitmaps) против прямого подсчета по записям
+и поддержка карт путем записи habit_logs (HabitBitmapCRUD.set_days).
+"""
+import random
+from collections import namedtuple
+from datetime import date, timedelta
+
+import pytest
+
+from api.pydantic_models import HabitLogCreate
+from database.bitmaps import HabitBitmap, YEAR_BYTES, get_bit, set_bit, set_day, to_int
+from database.db import shard_for_user, shard_sessions, unit_of_work
+from database.func_db import HabitCRUD, HabitLogCRUD, HabitBitmapCRUD
+from tests.conftest import auth_headers, create_user
+
+TODAY = date(2026, 3, 10)
+BitmapRow = namedtuple("BitmapRow", "year completed logged")
+
+
+def random_logs(seed: int, first_day: date, last_day: date) -> dict[date, bool]:
+    rng = random.Random(seed)
+    logs = {}
+    day = first_day
+    while day <= last_day:
+        if rng.random() < 0.8:
+            logs[day] = rng.random() < 0.75
+        day += timedelta(days=1)
+    return logs
+
+
+def bitmap_of(logs: dict[date, bool]) -> HabitBitmap:
+    years = {}
+    for day, completed in logs.items():
+        maps = years.setdefault(day.year, (bytes(YEAR_BYTES), bytes(YEAR_BYTES)))
+        years[day.year] = set_day(*maps, day, completed)
+    return HabitBitmap.from_rows([BitmapRow(year, *maps) for year, maps in years.items()], default_year=TODAY.year)
+
+
+def expected_current_streak(logs: dict[date, bool], today: date) -> int:
+    day = today if today in logs else today - timedelta(days=1)
+    streak = 0
+    while logs.get(day):
+        streak += 1
+        day -= timedelta(days=1)
+    return streak
+
+
+def expected_longest_streak(logs: dict[date, bool]) -> int:
+    longest = streak = 0
+    for day in sorted(logs):
+        streak = streak + 1 if logs[day] and logs.get(day - timedelta(days=1)) else int(logs[day])
+        longest = max(longest, streak)
+    return longest
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_bitmap_stats_match_logs(seed):
+    logs = random_logs(seed, date(2024, 11, 20), TODAY)
+    bitmap = bitmap_of(logs)
+
+    assert bitmap.current_streak(TODAY) == expected_current_streak(logs, TODAY)
+    assert bitmap.longest_streak() == expected_longest_streak(logs)
+    assert bitmap.total_completed() == sum(logs.values())
+
+    for start, end in [(date(2024, 12, 25), date(2025, 1, 7)), (date(2026, 3, 1), TODAY), (date(2024, 1, 1), TODAY)]:
+        period = [day for day in logs if start <= day <= end]
+        counts = bitmap.count(start, end)
+        assert (counts.completed, counts.logged) == (sum(logs[day] for day in period), len(period))
+        assert counts.days == (end - start).days + 1
+        assert counts.rate == round(counts.completed / counts.days, 4)
+
+    assert bitmap.calendar(date(2025, 2, 14)) == [
+        (date(2025, 2, day), logs.get(date(2025, 2, day))) for day in range(1, 29)
+    ]
+
+
+@pytest.mark.parametrize("today_log, expected", [(None, 2), (True, 3), (False, 0)])
+def test_current_streak_counts_from_yesterday_until_today_is_logged(today_log, expected):
+    logs = {TODAY - timedelta(days=3): False, TODAY - timedelta(days=2): True, TODAY - timedelta(days=1): True}
+    if today_log is not None:
+        logs[TODAY] = today_log
+
+    assert bitmap_of(logs).current_streak(TODAY) == expected
+
+
+def test_streaks_cross_year_boundary():
+    logs = {date(2025, 12, 30) + timedelta(days=offset): True for offset in range(5)}
+
+    bitmap = bitmap_of(logs)
+
+    assert bitmap.current_streak(date(2026, 1, 3)) == 5
+    assert bitmap.longest_streak() == 5
+
+
+def test_sql_bit_functions_match_set_day():
+    completed, logged = bytes(YEAR_BYTES), bytes(YEAR_BYTES)
+    for day, value in [(date(2026, 1, 1), True), (date(2026, 12, 31), False), (date(2026, 7, 4), True)]:
+        completed, logged = set_day(completed, logged, day, value)
+
+    index = date(2026, 7, 4).timetuple().tm_yday - 1
+    assert get_bit(completed, index) == 1
+    assert set_bit(completed, index, 0) == set_day(completed, logged, date(2026, 7, 4), False)[0]
+    assert to_int(set_bit(bytes(YEAR_BYTES), 365, 1)) == 1 << 365
+
+
+@pytest.mark.asyncio
+async def test_log_writes_keep_bitmap_in_sync(client):
+    user = await create_user("bitmap_writer", 9101)
+    logs = {
+        date(2025, 12, 30): True, date(2025, 12, 31): True, date(2026, 1, 1): False,
+        TODAY - timedelta(days=2): True, TODAY - timedelta(days=1): True, TODAY: True,
+    }
+    async with unit_of_work(shard_sessions[shard_for_user(user.id)]) as session:
+        habit = await HabitCRUD(session).create_habit(user.id, "read", None, 21, 21, date(2025, 12, 1),
+                                                      None, 0, 0, True)
+    for day, completed in logs.items():
+        async with unit_of_work(shard_sessions[shard_for_user(user.id)]) as session:
+            log = await HabitLogCRUD(session).create_habit_log(user.id, habit.id, day, HabitLogCreate(completed=completed))
+    async with unit_of_work(shard_sessions[shard_for_user(user.id)]) as session:
+        # Последняя запись (за сегодня) удаляется: бит дня снимается в обеих картах
+        await HabitLogCRUD(session).delete_habit_log(log.id)
+    del logs[TODAY]
+
+    async with shard_sessions[shard_for_user(user.id)]() as session:
+        bitmap = await HabitBitmapCRUD(session).get_bitmap(habit.id, user.id, TODAY)
+    assert bitmap.calendar(date(2026, 1, 1))[0] == (date(2026, 1, 1), False)
+    assert [day for day in logs if (bitmap.logged >> bitmap.index(day)) & 1] == list(logs)
+    assert bitmap.logged.bit_count() == len(logs)
+    assert bitmap.current_streak(TODAY) == 2
+    assert bitmap.longest_streak() == 2
+
+    response = await client.get(f"/habits/{habit.id}/stats", params={"month": "2025-12-01"},
+                                headers=auth_headers(user))
+    assert response.status_code == 200, response.text
+    stats = response.json()
+    assert stats["total_completed"] == 4
+    assert stats["longest_streak"] == 2
+    assert [day["completed"] for day in stats["calendar"][-3:]] == [None, True, True]
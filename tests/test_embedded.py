@@ -0,0 +1,48 @@
+"""
+Встроенный режим бота: ошибки базы и перегрузка bcrypt возвращают None, как у HTTP-клиента.
+"""
+import pytest
+from aiogram.types import User as TgUser
+from fastapi import HTTPException
+from sqlalchemy.exc import OperationalError
+
+from database.func_db import UserCRUD
+from TG.embedded import EmbeddedUser
+from tests.conftest import create_user
+
+pytestmark = pytest.mark.asyncio
+
+TG_USER = TgUser(id=424242, is_bot=False, first_name="Test", username="embedded_user")
+
+
+@pytest.mark.parametrize("error", [
+    OperationalError("SELECT 1", {}, Exception("database is locked")),
+    HTTPException(status_code=503, detail="Password hashing is overloaded"),
+])
+@pytest.mark.parametrize("method", ["authenticate_user", "register_user"])
+async def test_login_errors_return_none(database, monkeypatch, error, method):
+    async def failing(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(UserCRUD, "get_or_create_bot_user", failing)
+    EmbeddedUser.user_ids.clear()
+
+    assert await getattr(EmbeddedUser, method)(TG_USER) is None
+
+
+async def test_bot_user_without_password_logs_in(database):
+    # Пользователь, созданный входом через /token/bot: hashed_password = None
+    user = await create_user(TG_USER.username, TG_USER.id)
+    EmbeddedUser.user_ids.clear()
+
+    assert await EmbeddedUser.authenticate_user(TG_USER) == {"username": TG_USER.username, "created": False}
+    assert await EmbeddedUser.register_user(TG_USER) == TG_USER.username
+    assert await EmbeddedUser.get_habits(TG_USER) == []
+    assert EmbeddedUser.user_ids[TG_USER.id] == user.id
+
+
+async def test_new_user_is_created_on_first_login(database):
+    EmbeddedUser.user_ids.clear()
+
+    assert await EmbeddedUser.authenticate_user(TG_USER) == {"username": TG_USER.username, "created": True}
+    assert await EmbeddedUser.authenticate_user(TG_USER) == {"username": TG_USER.username, "created": False}
@@ -0,0 +1,68 @@
+"""
+Бенчмарк задержки вызовов обработчиков бота: встроенный режим (TG.embedded.EmbeddedUser) против
+HTTP-клиента (TG.funcs_tg.HttpUser) к API на uvicorn через локальный TCP.
+"""
+import socket
+import statistics
+import time
+
+import pytest
+from aiogram.types import User as TgUser
+
+from TG.embedded import EmbeddedUser
+from TG.funcs_tg import HttpUser, TokenStore
+from tests.conftest import running_api
+
+pytestmark = pytest.mark.asyncio
+
+TG_USER = TgUser(id=616161, is_bot=False, first_name="Bench", username="transport_bench")
+CALLS = 200
+
+
+async def latencies(call) -> list[float]:
+    results = []
+    for index in range(CALLS):
+        started_at = time.perf_counter()
+        assert await call(index) is not None
+        results.append(time.perf_counter() - started_at)
+    return results
+
+
+def summary(values: list[float]) -> str:
+    quantiles = statistics.quantiles(values, n=100)
+    return f"p50 {quantiles[49] * 1000:5.2f} мс, p99 {quantiles[98] * 1000:5.2f} мс"
+
+
+async def test_embedded_against_http_handler_latency(database, monkeypatch):
+    EmbeddedUser.user_ids.clear()
+    for index in range(10):
+        await EmbeddedUser.create_habit(TG_USER, {"name": f"habit {index}", "start_date": "2026-01-01"})
+
+    # IPPROTO_TCP явно: иначе asyncio не включает TCP_NODELAY на принятых соединениях
+    tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    tcp_sock.bind(("127.0.0.1", 0))
+    monkeypatch.setattr(HttpUser, "base_url", f"http://127.0.0.1:{tcp_sock.getsockname()[1]}")
+    monkeypatch.setattr(HttpUser, "socket_path", None)
+    monkeypatch.setattr(HttpUser, "tokens", TokenStore())
+
+    results = {}
+    async with running_api(tcp_sock):
+        await HttpUser.shutdown()
+        try:
+            transports = {"встроенный": EmbeddedUser, "HTTP": HttpUser}
+            for transport in transports.values():
+                await transport.get_habits(TG_USER)  # вход и прогрев соединений
+            # Чтения обоих режимов — до записей, чтобы список привычек был одинаковым
+            for name, transport in transports.items():
+                results[name, "get_habits"] = await latencies(lambda index: transport.get_habits(TG_USER))
+            for name, transport in transports.items():
+                results[name, "create_habit"] = await latencies(lambda index: transport.create_habit(
+                    TG_USER, {"name": f"{name} {index}", "start_date": "2026-01-01"}
+                ))
+        finally:
+            await HttpUser.shutdown()
+
+    print("\n" + "\n".join(f"{name:>10} {operation:>12}: {summary(values)}"
+                           for (name, operation), values in results.items()))
+    for operation in ("get_habits", "create_habit"):
+        assert statistics.median(results["встроенный", operation]) < statistics.median(results["HTTP", operation])
@@ -0,0 +1,120 @@
+"""
+Отметки выполнения привычек через API: атомарная вставка и обновление серии.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, func
+
+from api.pydantic_models import MAX_BATCH_LOGS
+from database.db import shard_for_user, shard_sessions
+from database.models import HabitInDB, HabitLogInDB
+from tests.conftest import auth_headers, create_user
+
+pytestmark = pytest.mark.asyncio
+
+
+async def create_habit(client, headers, name: str = "habit") -> int:
+    response = await client.post("/habits", json={"name": name, "start_date": "2026-01-01"}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+async def test_parallel_marks_create_one_log(client):
+    user = await create_user("double_tap", 2001)
+    headers = auth_headers(user)
+    habit_id = await create_habit(client, headers)
+
+    responses = await asyncio.gather(*(
+        client.post(f"/habits/{habit_id}/logs", json={"completed": True}, headers=headers)
+        for _ in range(10)
+    ))
+
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [200] + [400] * 9, [response.text for response in responses]
+
+    async with shard_sessions[shard_for_user(user.id)]() as session:
+        logs = (await session.execute(
+            select(func.count()).select_from(HabitLogInDB).where(HabitLogInDB.habit_id == habit_id)
+        )).scalar()
+        habit = await session.get(HabitInDB, habit_id)
+    assert logs == 1
+    assert habit.current_streak == 1
+    assert habit.total_completed == 1
+
+
+async def test_mark_foreign_habit_is_not_found(client):
+    owner = await create_user("owner", 2002)
+    other = await create_user("other", 2003)
+    habit_id = await create_habit(client, auth_headers(owner))
+
+    response = await client.post(f"/habits/{habit_id}/logs", json={"completed": True}, headers=auth_headers(other))
+
+    assert response.status_code == 404
+
+
+async def test_mark_foreign_logged_habit_is_not_found(client):
+    owner = await create_user("logged_owner", 2007)
+    # Чужая привычка видна только из того же шарда
+    other = await create_user("logged_other", 2008)
+    while shard_for_user(other.id) != shard_for_user(owner.id):
+        other = await create_user(f"logged_other_{other.id}", other.telegram_id + 1)
+    habit_id = await create_habit(client, auth_headers(owner))
+    response = await client.post(f"/habits/{habit_id}/logs", json={"completed": True}, headers=auth_headers(owner))
+    assert response.status_code == 200, response.text
+
+    response = await client.post(f"/habits/{habit_id}/logs", json={"completed": True}, headers=auth_headers(other))
+
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("days_from_today, expected_status", [(1, 400), (0, 200), (-1, 200), (-30, 400)])
+async def test_batch_log_date_bounds(client, days_from_today, expected_status):
+    user = await create_user("batch_dates", 2004)
+    headers = auth_headers(user)
+    habit_id = await create_habit(client, headers)
+    log_date = datetime.now(timezone.utc).date() + timedelta(days=days_from_today)
+
+    response = await client.post("/habits/logs/batch", headers=headers, json={
+        "log_date": log_date.isoformat(), "logs": [{"habit_id": habit_id, "completed": True}],
+    })
+
+    assert response.status_code == expected_status, response.text
+    async with shard_sessions[shard_for_user(user.id)]() as session:
+        habit = await session.get(HabitInDB, habit_id)
+    assert habit.last_log_date == (log_date if expected_status == 200 else None)
+
+
+async def test_backdated_log_keeps_current_streak(client):
+    user = await create_user("backdating", 2005)
+    headers = auth_headers(user)
+    habit_id = await create_habit(client, headers)
+    today = datetime.now(timezone.utc).date()
+
+    response = await client.post(f"/habits/{habit_id}/logs", json={"completed": True}, headers=headers)
+    assert response.status_code == 200, response.text
+    for days_ago, completed, total_completed in ((1, False, 1), (2, True, 2)):
+        response = await client.post("/habits/logs/batch", headers=headers, json={
+            "log_date": (today - timedelta(days=days_ago)).isoformat(),
+            "logs": [{"habit_id": habit_id, "completed": completed}],
+        })
+        assert response.status_code == 200, response.text
+
+        async with shard_sessions[shard_for_user(user.id)]() as session:
+            habit = await session.get(HabitInDB, habit_id)
+        assert habit.current_streak == 1
+        assert habit.total_completed == total_completed
+        assert (habit.last_log_date, habit.last_log_completed) == (today, True)
+
+
+async def test_batch_size_is_limited(client):
+    user = await create_user("big_batch", 2006)
+    headers = auth_headers(user)
+    habit_id = await create_habit(client, headers)
+
+    response = await client.post("/habits/logs/batch", headers=headers, json={
+        "logs": [{"habit_id": habit_id, "completed": True}] * (MAX_BATCH_LOGS + 1),
+    })
+
+    assert response.status_code == 422
@@ -0,0 +1,89 @@
+"""
+Бенчмарк HTTP-клиента бота (TG.funcs_tg.HttpUser) против локального API-заглушки на aiohttp:
+общая сессия с пулом keep-alive соединений против новой сессии на каждый запрос, как было раньше.
+"""
+import asyncio
+import time
+from datetime import timedelta
+
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiogram.types import User as TgUser
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from api.auth import AuthService
+from config import config
+from TG.funcs_tg import HttpUser
+
+pytestmark = pytest.mark.asyncio
+
+TG_USER = TgUser(id=515151, is_bot=False, first_name="Bench", username="bench_user")
+REQUESTS = 1000
+CONCURRENCY = 20
+
+
+@pytest_asyncio.fixture
+async def stub_api(monkeypatch):
+    """
+    Заглушка API: GET /habits отвечает пустым списком и запоминает соединения, по которым пришли запросы.
+    """
+    connections = set()
+
+    async def habits(request: web.Request) -> web.Response:
+        connections.add(request.transport)
+        return web.json_response([])
+
+    app = web.Application()
+    app.router.add_get("/habits", habits)
+    server = TestServer(app)
+    await server.start_server()
+
+    await HttpUser.shutdown()
+    monkeypatch.setattr(HttpUser, "base_url", str(server.make_url("")).rstrip("/"))
+    monkeypatch.setattr(HttpUser, "socket_path", None)
+    access_token = AuthService.create_access_token({"sub": TG_USER.username, "user_id": 1}, timedelta(minutes=30))
+    HttpUser.tokens.get(TG_USER.id).set_tokens({"access_token": access_token, "token_type": "bearer"})
+
+    yield connections
+    await HttpUser.shutdown()
+    await server.close()
+
+
+async def send_once_with_new_session(url, method, data, json_data, headers, timeout):
+    """
+    Прежний HttpUser._send_once: своя ClientSession и новое TCP-соединение на каждый запрос.
+    """
+    async with aiohttp.ClientSession() as session:
+        async with session.request(method, url, data=data, json=json_data, headers=headers,
+                                   timeout=timeout) as response:
+            return response.status, await response.json()
+
+
+async def requests_per_second() -> float:
+    remaining = iter(range(REQUESTS))
+
+    async def client():
+        for _ in remaining:
+            assert await HttpUser.get_habits(TG_USER) == []
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(CONCURRENCY)))
+    return REQUESTS / (time.perf_counter() - started_at)
+
+
+async def test_pooled_session_against_session_per_request(stub_api, monkeypatch):
+    pooled = await requests_per_second()
+    pooled_connections = len(stub_api)
+
+    stub_api.clear()
+    monkeypatch.setattr(HttpUser, "_send_once", send_once_with_new_session)
+    per_request = await requests_per_second()
+
+    print(f"\nGET /habits, {REQUESTS} запросов по {CONCURRENCY} одновременно: общая сессия {pooled:.0f} запр./с "
+          f"({pooled_connections} соединений), сессия на запрос {per_request:.0f} запр./с ({len(stub_api)} соединений)")
+
+    assert pooled_connections <= min(CONCURRENCY, config.API_POOL_LIMIT)
+    assert len(stub_api) == REQUESTS
+    assert pooled > per_request
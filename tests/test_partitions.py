@@ -0,0 +1,100 @@
+"""
+Обслуживание секций habit_logs по шардам (tasks.maintain_habit_log_partitions), арифметика
+месяцев секций и выбор секций для архива (database.partitions) без Postgres.
+"""
+from contextlib import asynccontextmanager
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+import tasks
+from config import config
+from database.partitions import add_months, archive_boundary, archive_old_partitions
+
+
+def test_failed_shard_does_not_stop_others(monkeypatch):
+    original_factory = tasks.task_session_factory
+    opened = []
+
+    @asynccontextmanager
+    async def task_session_factory(db_shard: int = 0):
+        opened.append(db_shard)
+        if db_shard == 0:
+            raise ConnectionError("шард недоступен")
+        async with original_factory(db_shard) as session_factory:
+            yield session_factory
+
+    monkeypatch.setattr(tasks, "task_session_factory", task_session_factory)
+
+    with pytest.raises(RuntimeError, match=r"шардах \[0\]"):
+        tasks.maintain_habit_log_partitions()
+
+    assert sorted(opened) == list(range(len(tasks.SHARD_URLS)))
+
+
+@pytest.mark.parametrize("month, months, expected", [
+    (date(2026, 3, 1), 0, date(2026, 3, 1)),
+    (date(2026, 1, 1), -1, date(2025, 12, 1)),
+    (date(2025, 12, 1), 1, date(2026, 1, 1)),
+    (date(2024, 3, 1), -14, date(2023, 1, 1)),
+    (date(2024, 11, 1), 26, date(2027, 1, 1)),
+])
+def test_add_months(month, months, expected):
+    assert add_months(month, months) == expected
+
+
+@pytest.mark.parametrize("today, archive_after, expected", [
+    (date(2026, 3, 15), 12, date(2025, 3, 1)),
+    (date(2026, 3, 1), 12, date(2025, 3, 1)),
+    (date(2026, 1, 31), 1, date(2025, 12, 1)),
+    (date(2026, 3, 15), 0, None),
+])
+def test_archive_boundary(monkeypatch, today, archive_after, expected):
+    monkeypatch.setattr(config, "HABIT_LOG_ARCHIVE_AFTER_MONTHS", archive_after)
+
+    assert archive_boundary(today) == expected
+
+
+class FakePostgresConnection:
+    """
+    Соединение Postgres, которое возвращает заданные секции habit_logs и запоминает выполненный SQL.
+    """
+    dialect = SimpleNamespace(name="postgresql")
+
+    def __init__(self, partitions: list[str]):
+        self.partitions = partitions
+        self.statements = []
+
+    async def execute(self, statement, parameters=None):
+        self.statements.append(str(statement))
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: self.partitions))
+
+
+@pytest.mark.asyncio
+async def test_archive_detaches_only_months_before_boundary(monkeypatch):
+    monkeypatch.setattr(config, "HABIT_LOG_ARCHIVE_AFTER_MONTHS", 12)
+    conn = FakePostgresConnection([
+        "habit_logs_y2025m03", "habit_logs_default", "habit_logs_y2024m12", "habit_logs_y2025m02",
+        "habit_logs_y2026m04", "habit_logs_y2025m01", "habit_logs_backup",
+    ])
+
+    archived = await archive_old_partitions(conn, today=date(2026, 3, 15))
+
+    # Март 2025 лежит на границе и остается; default и чужие таблицы не трогаются
+    assert archived == ["habit_logs_y2024m12", "habit_logs_y2025m01", "habit_logs_y2025m02"]
+    detached = [statement for statement in conn.statements if "DETACH" in statement]
+    assert detached == [f"ALTER TABLE habit_logs DETACH PARTITION {name}" for name in archived]
+    assert "ALTER TABLE habit_logs_archive ATTACH PARTITION habit_logs_y2024m12 " \
+           "FOR VALUES FROM ('2024-12-01') TO ('2025-01-01')" in conn.statements
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("dialect, archive_after", [("postgresql", 0), ("sqlite", 12)])
+async def test_archive_does_nothing_when_disabled_or_not_postgres(monkeypatch, dialect, archive_after):
+    monkeypatch.setattr(config, "HABIT_LOG_ARCHIVE_AFTER_MONTHS", archive_after)
+    conn = FakePostgresConnection(["habit_logs_y2020m01"])
+    conn.dialect = SimpleNamespace(name=dialect)
+
+    assert await archive_old_partitions(conn, today=date(2026, 3, 15)) == []
+    assert conn.statements == []
@@ -0,0 +1,97 @@
+"""
+Нагрузка на bcrypt (api.auth.PasswordHasher) в процессе, через httpx ASGITransport: p99 задержки
+GET /habits во время всплеска регистраций и ответ 503, когда очередь bcrypt заполнена.
+"""
+import asyncio
+import statistics
+import time
+
+import pytest
+
+from api.auth import PasswordHasher
+from config import config
+from tests.conftest import auth_headers, create_user
+
+pytestmark = pytest.mark.asyncio
+
+REGISTRATIONS = 16
+
+
+def p99(latencies: list[float]) -> float:
+    return statistics.quantiles(latencies, n=100)[98]
+
+
+async def habits_p99_during_burst(client, user, prefix: str) -> tuple[float, list[int]]:
+    """
+    Пока идут REGISTRATIONS одновременных регистраций, один клиент без перерыва читает GET /habits.
+    """
+    headers = auth_headers(user)
+    burst_done = asyncio.Event()
+    latencies = []
+
+    async def reader():
+        while not burst_done.is_set():
+            started_at = time.perf_counter()
+            response = await client.get("/habits", headers=headers)
+            latencies.append(time.perf_counter() - started_at)
+            assert response.status_code == 200, response.text
+
+    async def burst():
+        try:
+            return await asyncio.gather(*(
+                client.post("/register", json={"username": f"{prefix}_{index}", "password": "secret"})
+                for index in range(REGISTRATIONS)
+            ))
+        finally:
+            burst_done.set()
+
+    responses, _ = await asyncio.gather(burst(), reader())
+    return p99(latencies), [response.status_code for response in responses]
+
+
+async def test_habits_latency_during_registration_burst(client, monkeypatch):
+    user = await create_user("reader", 5150)
+    await client.get("/habits", headers=auth_headers(user))  # прогрев соединений и кэшей
+
+    pooled, pooled_statuses = await habits_p99_during_burst(client, user, "pooled")
+
+    async def run_on_loop(func, *args):
+        return func(*args)
+
+    # Для сравнения: bcrypt прямо в цикле событий, как до появления PasswordHasher
+    monkeypatch.setattr(PasswordHasher, "run", run_on_loop)
+    inline, inline_statuses = await habits_p99_during_burst(client, user, "inline")
+
+    print(f"\nGET /habits p99 во время {REGISTRATIONS} регистраций: пул bcrypt {pooled * 1000:.1f} мс, "
+          f"bcrypt в цикле событий {inline * 1000:.1f} мс")
+    assert pooled_statuses == inline_statuses == [200] * REGISTRATIONS
+    assert pooled < inline
+
+
+async def test_register_returns_503_when_hash_queue_is_full(client, monkeypatch):
+    monkeypatch.setattr(PasswordHasher, "pending", config.PASSWORD_HASH_MAX_PENDING)
+    rejected = PasswordHasher.rejected
+
+    response = await client.post("/register", json={"username": "overflow", "password": "secret"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert PasswordHasher.rejected == rejected + 1
+
+
+async def test_burst_over_max_pending_is_partly_rejected(client, monkeypatch):
+    monkeypatch.setattr(config, "PASSWORD_HASH_MAX_PENDING", 2)
+    rejected = PasswordHasher.rejected
+
+    responses = await asyncio.gather(*(
+        client.post("/register", json={"username": f"burst_{index}", "password": "secret"}) for index in range(8)
+    ))
+
+    statuses = [response.status_code for response in responses]
+    assert set(statuses) == {200, 503}
+    assert PasswordHasher.rejected - rejected == statuses.count(503)
+    assert PasswordHasher.pending == 0
+
+    metrics = (await client.get("/metrics/password-hashing")).json()
+    assert metrics["in_flight"] == 0
+    assert metrics["rejected"] == PasswordHasher.rejected
@@ -0,0 +1,113 @@
+"""
+Планы запросов HabitCRUD, HabitLogCRUD и выборки напоминаний: ни один запрос не должен читать
+habits, habit_logs или users полным просмотром таблицы (EXPLAIN QUERY PLAN в SQLite).
+"""
+import re
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from api.pydantic_models import HabitLogCreate, HabitLogBatchItem
+from database.db import shard_for_user, shard_sessions, unit_of_work
+from database.func_db import HabitCRUD, HabitLogCRUD, latest_log_values
+from database.models import HabitInDB
+from reminders import ReminderEngine
+from sqlalchemy import update
+from tests.conftest import create_user, recorded_statements, user_shard
+
+pytestmark = pytest.mark.asyncio
+
+TODAY = date(2026, 3, 10)
+PLANNED_STATEMENTS = ("SELECT", "UPDATE", "DELETE")
+# Диапазон по первичному ключу без других условий (id > последнего) — тот же обход таблицы
+FULL_KEY_RANGE = re.compile(r"PRIMARY KEY \(rowid[<>]=?\?\)")
+
+
+async def assert_no_full_scans(db_engine, statements) -> None:
+    """
+    Выполняет EXPLAIN QUERY PLAN для каждого SELECT/UPDATE/DELETE и падает на полном просмотре
+    таблицы или индекса (SCAN) и на обходе по диапазону первичного ключа.
+    """
+    checked = 0
+    async with db_engine.connect() as conn:
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith(PLANNED_STATEMENTS):
+                continue
+            plan = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)).all()
+            details = [row[-1] for row in plan]
+            scans = [detail for detail in details if detail.startswith("SCAN") or FULL_KEY_RANGE.search(detail)]
+            assert not scans, f"Полный просмотр таблицы в запросе:\n{statement}\nплан: {details}"
+            checked += 1
+    assert checked, "Не выполнено ни одного запроса для проверки"
+
+
+async def seed_habits(user_id: int) -> list[int]:
+    async with unit_of_work(shard_sessions[shard_for_user(user_id)]) as session:
+        crud = HabitCRUD(session)
+        habits = [
+            await crud.create_habit(user_id, f"habit {index}", None, 21, 21, TODAY - timedelta(days=30),
+                                    None, 0, 0, True)
+            for index in range(3)
+        ]
+        for offset in range(1, 10):
+            await HabitLogCRUD(session).create_habit_log(
+                user_id, habits[0].id, TODAY - timedelta(days=offset), HabitLogCreate(completed=offset % 2 == 0)
+            )
+    return [habit.id for habit in habits]
+
+
+async def test_habit_crud_queries_use_indexes(database):
+    user = await create_user("plans_habits", 1001)
+    habit_ids = await seed_habits(user.id)
+
+    db_engine = user_shard(user)
+    with recorded_statements(db_engine) as statements:
+        async with unit_of_work(shard_sessions[shard_for_user(user.id)]) as session:
+            crud = HabitCRUD(session)
+            await crud.get_unlogged_tracked_habits(user.id, TODAY)
+            await crud.get_habits_by_user(user.id)
+            await crud.get_habit(habit_ids[0])
+            await crud.update_habit(habit_ids[1], user.id, name="renamed")
+            await crud.delete_habit(habit_ids[0], user.id)
+
+    await assert_no_full_scans(db_engine, statements)
+
+
+async def test_habit_log_crud_queries_use_indexes(database):
+    user = await create_user("plans_logs", 1002)
+    habit_ids = await seed_habits(user.id)
+
+    db_engine = user_shard(user)
+    with recorded_statements(db_engine) as statements:
+        async with unit_of_work(shard_sessions[shard_for_user(user.id)]) as session:
+            crud = HabitLogCRUD(session)
+            log = await crud.create_habit_log(user.id, habit_ids[0], TODAY, HabitLogCreate(completed=True))
+            await crud.create_habit_logs_batch(user.id, TODAY, [
+                HabitLogBatchItem(habit_id=habit_ids[1], completed=True),
+                HabitLogBatchItem(habit_id=habit_ids[2], completed=False),
+            ])
+            await crud.get_habit_history(habit_ids[0], user.id, TODAY - timedelta(days=7), TODAY)
+            await crud.get_habit_logs_by_date(habit_ids[0], TODAY)
+            await crud.delete_habit_log(log.id)
+            await session.execute(
+                update(HabitInDB).where(HabitInDB.id == habit_ids[0]).values(**latest_log_values())
+            )
+
+    await assert_no_full_scans(db_engine, statements)
+
+
+async def test_reminder_queries_use_indexes(database):
+    user = await create_user("plans_reminders", 1003)
+    await seed_habits(user.id)
+
+    db_engine = user_shard(user)
+    reminder_engine = ReminderEngine(bot=None, session_factory=shard_sessions[shard_for_user(user.id)])
+    window_start = datetime(2026, 3, 10, 20, 0)
+    with recorded_statements(db_engine) as statements:
+        async with shard_sessions[shard_for_user(user.id)]() as session:
+            position, pending = await reminder_engine.fetch_pending(session, window_start, 15, (1200, 0))
+            await reminder_engine.fetch_pending(session, window_start, 15, (1200, 0), shard_index=1, shard_count=8)
+
+    assert position == (1200, user.id)
+    assert pending == {user.telegram_id: ["habit 0", "habit 1", "habit 2"]}
+    await assert_no_full_scans(db_engine, statements)
@@ -0,0 +1,85 @@
+"""
+Чтения с реплики (get_read_db) и read-your-writes на двух локальных файлах SQLite:
+основная база тестов без шардов и отдельный файл реплики, который не получает записей
+(реплика с задержкой репликации).
+"""
+import itertools
+from datetime import date
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import database.db
+from database.db import async_session, build_engine, engine, unit_of_work, RecentWriters
+from database.models import Base, HabitInDB, UserInDB
+from tests.conftest import DB_DIR, auth_headers
+
+pytestmark = pytest.mark.asyncio
+
+USER_ID = 1
+
+
+@pytest_asyncio.fixture
+async def replica(client, monkeypatch):
+    """
+    Одна база без шардов с репликой replica.db; пользователь есть в обеих, привычка «stale» — только в реплике.
+    """
+    replica_engine = build_engine(f"sqlite:///{DB_DIR}/replica.db")
+    monkeypatch.setattr(database.db, "shard_engines", [engine])
+    monkeypatch.setattr(database.db, "shard_sessions", [async_session])
+    monkeypatch.setattr(database.db, "replica_engines", [replica_engine])
+    monkeypatch.setattr(database.db, "replica_sessions", itertools.cycle([
+        async_sessionmaker(replica_engine, class_=AsyncSession, expire_on_commit=False)
+    ]))
+
+    user = UserInDB(id=USER_ID, username="replicated", telegram_id=777)
+    async with replica_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for table in reversed(Base.metadata.sorted_tables):
+            await conn.execute(table.delete())
+        await conn.execute(insert(UserInDB).values(id=USER_ID, username="replicated", telegram_id=777))
+        await conn.execute(insert(HabitInDB).values(user_id=USER_ID, name="stale", start_date=date(2026, 1, 1)))
+    async with unit_of_work(async_session) as session:
+        session.add(UserInDB(id=USER_ID, username="replicated", telegram_id=777))
+
+    yield user
+    await replica_engine.dispose()
+
+
+async def habit_names(client, user) -> list[str]:
+    response = await client.get("/habits", headers=auth_headers(user))
+    assert response.status_code == 200, response.text
+    return [habit["name"] for habit in response.json()]
+
+
+async def test_reads_go_to_replica(client, replica):
+    assert await habit_names(client, replica) == ["stale"]
+    assert not RecentWriters.is_recent(USER_ID)
+
+
+async def test_reads_stick_to_primary_after_habit_write(client, replica):
+    response = await client.post("/habits", json={"name": "fresh", "start_date": "2026-01-01"},
+                                 headers=auth_headers(replica))
+    assert response.status_code == 200, response.text
+
+    assert await habit_names(client, replica) == ["fresh"]
+
+
+async def test_reads_stick_to_primary_after_settings_change(client, replica):
+    response = await client.put("/users/me/settings", json={"timezone": "Asia/Tokyo"}, headers=auth_headers(replica))
+    assert response.status_code == 200, response.text
+
+    assert RecentWriters.is_recent(USER_ID)
+    assert await habit_names(client, replica) == []
+
+
+async def test_reads_return_to_replica_after_window(client, replica, monkeypatch):
+    response = await client.put("/users/me/settings", json={"timezone": "Asia/Tokyo"}, headers=auth_headers(replica))
+    assert response.status_code == 200, response.text
+
+    monkeypatch.setattr(database.db.config, "READ_YOUR_WRITES_SECONDS", 0)
+    RecentWriters.mark(USER_ID)
+
+    assert await habit_names(client, replica) == ["stale"]
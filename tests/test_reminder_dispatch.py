@@ -0,0 +1,77 @@
+"""
+Координатор рассылки tasks.send_habit_reminders в режиме eager Celery: аккорд задач шардов
+по всем базам-шардам и сводка summarize_habit_reminders, с подставным ботом вместо Telegram.
+"""
+import asyncio
+from datetime import date, datetime
+
+import pytest
+
+import tasks
+from celery_app import celery_app
+from database.db import shard_for_user, shard_sessions, unit_of_work
+from database.func_db import HabitCRUD
+from tests.conftest import create_user
+
+pytestmark = pytest.mark.asyncio
+
+NOW = datetime(2026, 3, 10, 20, 3)  # окно 20:00 — время напоминания пользователей по умолчанию
+
+
+class FixedDatetime(datetime):
+    @classmethod
+    def utcnow(cls):
+        return NOW
+
+
+class FakeBot:
+    messages: list[tuple[int, str]] = []
+
+    def __init__(self, token: str):
+        self.session = self
+
+    async def send_message(self, chat_id, text):
+        self.messages.append((chat_id, text))
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def eager_celery(monkeypatch):
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    monkeypatch.setattr(celery_app.conf, "task_eager_propagates", True)
+    monkeypatch.setattr(tasks, "datetime", FixedDatetime)
+    monkeypatch.setattr(tasks, "Bot", FakeBot)
+    monkeypatch.setattr(FakeBot, "messages", [])
+
+
+async def test_coordinator_fans_out_and_summarizes(database, eager_celery, monkeypatch):
+    users = [await create_user(f"dispatch_{index}", 70_000 + index) for index in range(10)]
+    for user in users:
+        async with unit_of_work(shard_sessions[shard_for_user(user.id)]) as session:
+            await HabitCRUD(session).create_habit(user.id, "read", None, 21, 21, date(2026, 1, 1), None, 0, 0, True)
+
+    shard_results, summaries = [], []
+    run_shard, summarize = tasks.send_habit_reminders_shard.run, tasks.summarize_habit_reminders.run
+
+    def record_shard(*args, **kwargs):
+        shard_results.append(run_shard(*args, **kwargs))
+        return shard_results[-1]
+
+    def record_summary(results):
+        summaries.append(summarize(results))
+        return summaries[-1]
+
+    monkeypatch.setattr(tasks.send_habit_reminders_shard, "run", record_shard)
+    monkeypatch.setattr(tasks.summarize_habit_reminders, "run", record_summary)
+
+    # Задачи сами запускают asyncio.run, поэтому координатор выполняется вне цикла событий теста
+    await asyncio.to_thread(tasks.send_habit_reminders, 3)
+
+    assert sorted((result["db_shard"], result["shard"]) for result in shard_results) == [
+        (db_shard, shard) for db_shard in range(len(tasks.SHARD_URLS)) for shard in range(3)
+    ]
+    assert all(result["users"] for result in shard_results)
+    assert summaries == [{"users": len(users), "sent": len(users), "failed": 0}]
+    assert sorted(chat_id for chat_id, _ in FakeBot.messages) == sorted(user.telegram_id for user in users)
@@ -0,0 +1,143 @@
+"""
+Бенчмарк рассылки напоминаний: постоянный асинхронный reminder_worker против выполнения шардов
+в пуле потоков (задача Celery send_habit_reminders_shard, у каждой свой event loop, движок и бот).
+Бот подставной: первая отправка через новую сессию ждет установку соединения с Telegram
+(TCP и TLS), каждая отправка — задержку сети.
+"""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import insert
+
+import reminder_worker
+import tasks
+from config import config
+from database.db import shard_sessions, unit_of_work
+from database.models import HabitInDB, UserInDB
+
+pytestmark = pytest.mark.asyncio
+
+WINDOW_START = datetime(2026, 3, 10, 20, 0)
+SHARD_COUNT = config.REMINDER_SHARDS
+WORKERS = config.REMINDER_WORKER_CONCURRENCY
+CONNECT_LATENCY = 0.1
+SEND_LATENCY = 0.005
+
+
+class FakeBot:
+    def __init__(self, token: str, session=None):
+        self.session = self
+        self.sent = 0
+        self.connected = None
+
+    async def send_message(self, chat_id, text):
+        if self.connected is None:
+            self.connected = asyncio.ensure_future(asyncio.sleep(CONNECT_LATENCY))
+        await self.connected
+        await asyncio.sleep(SEND_LATENCY)
+        self.sent += 1
+
+    async def close(self):
+        pass
+
+
+class FakeRedis:
+    """
+    Очередь заданий в памяти; когда она пуста, воркер получает сигнал остановки.
+    """
+
+    def __init__(self, worker_ref: list, jobs: list[str]):
+        self.worker_ref = worker_ref
+        self.jobs = list(jobs)
+
+    async def blpop(self, keys, timeout):
+        if not self.jobs:
+            self.worker_ref[0].stop()
+            return None
+        return config.REMINDER_QUEUE, self.jobs.pop(0)
+
+    async def aclose(self):
+        pass
+
+
+async def seed_users(users_per_db_shard: int) -> int:
+    total = 0
+    for db_shard, session_factory in enumerate(shard_sessions):
+        user_ids = [index * len(shard_sessions) + db_shard for index in range(1, users_per_db_shard + 1)]
+        async with unit_of_work(session_factory) as session:
+            await session.execute(insert(UserInDB), [
+                {"id": user_id, "username": f"bench_{user_id}", "telegram_id": 2_000_000 + user_id}
+                for user_id in user_ids
+            ])
+            await session.execute(insert(HabitInDB), [
+                {"user_id": user_id, "name": "read", "start_date": date(2026, 1, 1), "is_tracked": True}
+                for user_id in user_ids
+            ])
+        total += len(user_ids)
+    return total
+
+
+def shard_jobs() -> list[dict]:
+    return [
+        {"shard_index": shard_index, "shard_count": SHARD_COUNT, "window_start": WINDOW_START.isoformat(),
+         "db_shard": db_shard}
+        for db_shard in range(len(shard_sessions))
+        for shard_index in range(SHARD_COUNT)
+    ]
+
+
+async def run_async_worker(monkeypatch) -> tuple[float, int]:
+    worker_ref = []
+    monkeypatch.setattr(reminder_worker, "Bot", FakeBot)
+    monkeypatch.setattr(reminder_worker, "aioredis", SimpleNamespace(
+        from_url=lambda url: FakeRedis(worker_ref, [json.dumps(job) for job in shard_jobs()])
+    ))
+    worker = reminder_worker.ReminderWorker(concurrency=WORKERS)
+    worker_ref.append(worker)
+
+    started_at = time.perf_counter()
+    await worker.run()
+    return time.perf_counter() - started_at, worker.bot.sent
+
+
+async def run_thread_pool(monkeypatch) -> tuple[float, int]:
+    bots = []
+
+    def make_bot(token: str):
+        bots.append(FakeBot(token))
+        return bots[-1]
+
+    monkeypatch.setattr(tasks, "Bot", make_bot)
+    loop = asyncio.get_running_loop()
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        await asyncio.gather(*(
+            loop.run_in_executor(pool, lambda job=job: tasks.send_habit_reminders_shard.run(**job))
+            for job in shard_jobs()
+        ))
+    return time.perf_counter() - started_at, sum(bot.sent for bot in bots)
+
+
+@pytest.mark.parametrize("users_per_db_shard", [50, 2000])
+async def test_async_worker_against_thread_pool(database, monkeypatch, users_per_db_shard):
+    monkeypatch.setattr(config, "REMINDER_RATE_LIMIT", 1_000_000)
+    users = await seed_users(users_per_db_shard)
+
+    results = {
+        "reminder_worker": await run_async_worker(monkeypatch),
+        "пул потоков": await run_thread_pool(monkeypatch),
+    }
+
+    print(f"\n{len(shard_jobs())} заданий, {users} сообщений:")
+    for mode, (elapsed, sent) in results.items():
+        print(f"{mode:>16}: {elapsed:6.2f} с, {sent / elapsed:7.0f} сообщ./с")
+
+    assert [sent for _, sent in results.values()] == [users, users]
+    if users_per_db_shard <= 50:
+        # В небольшом окне время задания — в основном установка соединений, которую воркер делает один раз
+        assert results["reminder_worker"][0] < results["пул потоков"][0]
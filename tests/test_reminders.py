@@ -0,0 +1,204 @@
+"""
+Рассылка напоминаний: ограничитель частоты, адресаты сообщений, повторы после TelegramRetryAfter,
+память при выборке порциями и пропускная способность под лимитом.
+"""
+import asyncio
+import tracemalloc
+from datetime import date, datetime
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import SendMessage
+from sqlalchemy import insert
+
+from database.db import shard_engines, shard_for_user, shard_sessions, unit_of_work
+from database.func_db import HabitCRUD
+from database.models import HabitInDB, UserInDB
+from reminders import ReminderEngine, TokenBucket
+from tests.conftest import create_user
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.mark.parametrize("rate", [30 / 32, 0.25])
+async def test_fractional_rate_bucket_issues_tokens(rate):
+    bucket = TokenBucket(rate)
+
+    await asyncio.wait_for(bucket.acquire(), timeout=0.5)
+
+    # Следующий токен накопится только через 1 / rate секунд
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(bucket.acquire(), timeout=0.2)
+
+
+async def test_fractional_rate_bucket_refills():
+    bucket = TokenBucket(5, capacity=0.5)
+
+    await asyncio.wait_for(bucket.acquire(), timeout=0.5)
+    await asyncio.wait_for(bucket.acquire(), timeout=0.5)
+
+
+class RecordingBot:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, chat_id, text):
+        self.messages.append((chat_id, text))
+
+
+async def test_reminders_go_to_telegram_chat(database):
+    user = await create_user("with_telegram", 987654321)
+    shard_session = shard_sessions[shard_for_user(user.id)]
+    async with unit_of_work(shard_session) as session:
+        # Пользователь, зарегистрированный паролем до входа через бота: ID Telegram неизвестен
+        session.add(UserInDB(id=user.id + len(shard_engines), username="password_only", hashed_password="x"))
+        for user_id in (user.id, user.id + len(shard_engines)):
+            await HabitCRUD(session).create_habit(user_id, "read", None, 21, 21, date(2026, 1, 1), None, 0, 0, True)
+
+    bot = RecordingBot()
+    stats = await ReminderEngine(bot, shard_session).run(window_start=datetime(2026, 3, 10, 20, 0))
+
+    assert [chat_id for chat_id, _ in bot.messages] == [987654321]
+    assert (stats.users, stats.sent, stats.failed) == (1, 1, 0)
+
+
+async def test_every_reminder_slice_gets_users(database):
+    shard_count = 4
+    users = [await create_user(f"slice_{index}", 40_000 + index)
+             for index in range(shard_count * len(shard_engines))]
+    for user in users:
+        async with unit_of_work(shard_sessions[shard_for_user(user.id)]) as session:
+            await HabitCRUD(session).create_habit(user.id, "read", None, 21, 21, date(2026, 1, 1), None, 0, 0, True)
+
+    window_start = datetime(2026, 3, 10, 20, 0)
+    reached = []
+    for shard_session in shard_sessions:
+        for shard_index in range(shard_count):
+            async with shard_session() as session:
+                _, pending = await ReminderEngine(RecordingBot(), shard_session).fetch_pending(
+                    session, window_start, 15, (0, 0), shard_index, shard_count
+                )
+            assert pending, f"Пустая часть {shard_index} из {shard_count}"
+            reached.extend(pending)
+
+    assert sorted(reached) == sorted(user.telegram_id for user in users)
+
+
+WINDOW_START = datetime(2026, 3, 10, 20, 0)
+
+
+async def seed_reminder_users(count: int) -> None:
+    """
+    `count` пользователей с одной неотмеченной привычкой в первом шарде, без справочника и bcrypt.
+    """
+    async with unit_of_work(shard_sessions[0]) as session:
+        await session.execute(insert(UserInDB), [
+            {"id": user_id, "username": f"bulk_{user_id}", "telegram_id": 1_000_000 + user_id}
+            for user_id in range(1, count + 1)
+        ])
+        await session.execute(insert(HabitInDB), [
+            {"user_id": user_id, "name": "read", "start_date": date(2026, 1, 1), "is_tracked": True}
+            for user_id in range(1, count + 1)
+        ])
+
+
+class FlakyBot(RecordingBot):
+    """
+    Бот, который отвечает TelegramRetryAfter на первые `retry_after_calls` отправок
+    и TelegramBadRequest — в чаты из `bad_chats`.
+    """
+
+    def __init__(self, retry_after_calls: int = 0, retry_after: int = 0, bad_chats: frozenset = frozenset()):
+        super().__init__()
+        self.retry_after_calls = retry_after_calls
+        self.retry_after = retry_after
+        self.bad_chats = bad_chats
+        self.calls = 0
+
+    async def send_message(self, chat_id, text):
+        self.calls += 1
+        method = SendMessage(chat_id=chat_id, text=text)
+        if self.calls <= self.retry_after_calls:
+            raise TelegramRetryAfter(method, "Too Many Requests", self.retry_after)
+        if chat_id in self.bad_chats:
+            raise TelegramBadRequest(method, "chat not found")
+        await super().send_message(chat_id, text)
+
+
+async def test_retry_after_pauses_bucket_and_resends(database, monkeypatch):
+    await seed_reminder_users(3)
+    bot = FlakyBot(retry_after_calls=1, retry_after=1)
+    engine = ReminderEngine(bot, shard_sessions[0], concurrency=1, rate_limit=1000)
+    pauses = []
+    pause = engine.bucket.pause
+    monkeypatch.setattr(engine.bucket, "pause", lambda seconds: (pauses.append(seconds), pause(seconds)))
+
+    stats = await engine.run(window_start=WINDOW_START)
+
+    assert pauses == [1]
+    assert bot.calls == 4
+    assert sorted(chat_id for chat_id, _ in bot.messages) == [1_000_001, 1_000_002, 1_000_003]
+    assert (stats.users, stats.sent, stats.failed) == (3, 3, 0)
+    assert stats.elapsed >= 1  # повторная отправка ждала паузу Telegram
+
+
+async def test_failures_are_counted_once_per_user(database):
+    await seed_reminder_users(4)
+    # Первый пользователь исчерпывает попытки на TelegramRetryAfter, второй недоступен
+    bot = FlakyBot(retry_after_calls=ReminderEngine.max_attempts, bad_chats=frozenset({1_000_002}))
+
+    stats = await ReminderEngine(bot, shard_sessions[0], concurrency=1, rate_limit=1000).run(window_start=WINDOW_START)
+
+    assert bot.calls == ReminderEngine.max_attempts + 3
+    assert sorted(chat_id for chat_id, _ in bot.messages) == [1_000_003, 1_000_004]
+    assert (stats.users, stats.sent, stats.failed) == (4, 2, 2)
+
+
+async def test_chunks_bound_pending_users_and_memory(database):
+    await seed_reminder_users(2000)
+
+    async def run(chunk_size: int) -> tuple[list[int], int]:
+        engine = ReminderEngine(RecordingBot(), shard_sessions[0], chunk_size=chunk_size, concurrency=50,
+                                rate_limit=1_000_000)
+        chunks = []
+        fetch_pending = engine.fetch_pending
+
+        async def recording_fetch(*args, **kwargs):
+            position, pending = await fetch_pending(*args, **kwargs)
+            chunks.append(len(pending))
+            return position, pending
+
+        engine.fetch_pending = recording_fetch
+        tracemalloc.start()
+        try:
+            stats = await engine.run(window_start=WINDOW_START)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert (stats.users, stats.sent) == (2000, 2000)
+        return chunks, peak
+
+    await run(100)  # прогрев кэшей SQLAlchemy, чтобы они не попали в пик
+    small_chunks, small_peak = await run(100)
+    whole_chunks, whole_peak = await run(2000)
+    print(f"\nПик памяти рассылки 2000 пользователей: порции по 100 — {small_peak / 1024:.0f} КиБ, "
+          f"одна порция — {whole_peak / 1024:.0f} КиБ")
+
+    assert small_chunks == [100] * 20 + [0]
+    assert whole_chunks == [2000, 0]
+    assert small_peak < whole_peak / 2
+
+
+async def test_throughput_follows_rate_limit(database):
+    await seed_reminder_users(300)
+    rate = 300
+    bot = RecordingBot()
+
+    # Запас в один токен: без начального всплеска скорость определяет только лимит
+    stats = await ReminderEngine(bot, shard_sessions[0], bucket=TokenBucket(rate, capacity=1)).run(
+        window_start=WINDOW_START
+    )
+    print(f"\nРассылка 300 сообщений при лимите {rate}/с: {stats.rate:.0f} сообщ./с за {stats.elapsed:.2f} с")
+
+    assert stats.sent == len(bot.messages) == 300
+    assert rate * 0.7 <= stats.rate <= rate * 1.05
@@ -0,0 +1,127 @@
+"""
+Шардирование пользователей по нескольким файлам SQLite: справочник в основной базе,
+пользователи и их привычки — только в своем шарде.
+"""
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from api.pydantic_models import User
+from database.db import engine, init_db, shard_engines, shard_for_user, shard_sessions, unit_of_work, async_session
+from database.func_db import UserCRUD, UserDirectory
+from database.models import HabitInDB, UserDirectoryInDB, UserInDB
+from tests.conftest import auth_headers, create_user
+
+pytestmark = pytest.mark.asyncio
+
+
+async def rows(db_engine, statement) -> list:
+    async with db_engine.connect() as conn:
+        return (await conn.execute(statement)).all()
+
+
+async def test_users_and_habits_live_in_their_shard(client):
+    users = [await create_user(f"sharded_{index}", 5000 + index) for index in range(4)]
+    assert {shard_for_user(user.id) for user in users} == {0, 1}
+
+    for user in users:
+        response = await client.post("/habits", json={"name": f"habit of {user.username}", "start_date": "2026-01-01"},
+                                     headers=auth_headers(user))
+        assert response.status_code == 200, response.text
+
+    directory = dict(await rows(engine, select(UserDirectoryInDB.user_id, UserDirectoryInDB.shard)))
+    assert directory == {user.id: shard_for_user(user.id) for user in users}
+
+    for shard, shard_engine in enumerate(shard_engines):
+        expected = {user.id for user in users if shard_for_user(user.id) == shard}
+        assert {user_id for user_id, in await rows(shard_engine, select(UserInDB.id))} == expected
+        assert {user_id for user_id, in await rows(shard_engine, select(HabitInDB.user_id))} == expected
+
+    for user in users:
+        response = await client.get("/habits", headers=auth_headers(user))
+        assert [habit["name"] for habit in response.json()] == [f"habit of {user.username}"]
+
+
+async def test_password_login_routes_through_directory(client):
+    for username in ("first", "second"):
+        response = await client.post("/register", json={"username": username, "password": "secret"})
+        assert response.status_code == 200, response.text
+
+    response = await client.post("/register", json={"username": "second", "password": "other"})
+    assert response.status_code == 400
+
+    async with unit_of_work() as session:
+        users = [await UserCRUD(session).authenticate_user(username, "secret") for username in ("first", "second")]
+    assert {shard_for_user(user.id) for user in users} == {0, 1}
+
+    response = await client.post("/token", data={"username": "second", "password": "secret"})
+    assert response.status_code == 200, response.text
+
+
+async def test_failed_shard_write_releases_username(database):
+    user = await create_user("taken", 6001)
+    next_shard = shard_engines[shard_for_user(user.id + 1)]
+    # Имя уже занято в шарде следующего пользователя: запись в шард упадет после коммита справочника
+    async with next_shard.begin() as conn:
+        await conn.execute(UserInDB.__table__.insert().values(id=10_000, username="conflict"))
+
+    with pytest.raises(IntegrityError):
+        async with unit_of_work() as session:
+            await UserCRUD(session).get_or_create_bot_user(6002, "conflict")
+
+    assert await rows(engine, select(UserDirectoryInDB).where(UserDirectoryInDB.username == "conflict")) == []
+
+    async with next_shard.begin() as conn:
+        await conn.execute(UserInDB.__table__.delete().where(UserInDB.id == 10_000))
+    async with unit_of_work() as session:
+        created, is_new = await UserCRUD(session).get_or_create_bot_user(6002, "conflict")
+    assert is_new
+    assert await rows(shard_engines[shard_for_user(created.id)], select(UserInDB.id).where(UserInDB.id == created.id))
+
+
+async def test_interrupted_registration_is_completed(database):
+    # Строка справочника без пользователя в шарде: процесс упал между двумя базами
+    async with unit_of_work() as session:
+        await UserDirectory(session).add("orphan", 7001)
+
+    async with unit_of_work() as session:
+        user, created = await UserCRUD(session).get_or_create_bot_user(7001, "orphan")
+
+    assert created
+    async with shard_sessions[shard_for_user(user.id)]() as session:
+        assert (await session.get(UserInDB, user.id)).username == "orphan"
+
+
+async def test_changed_shard_count_is_rejected(database):
+    user = await create_user("placed", 8001)
+    async with unit_of_work(async_session) as session:
+        await session.execute(
+            update(UserDirectoryInDB).where(UserDirectoryInDB.user_id == user.id)
+            .values(shard=(shard_for_user(user.id) + 1) % len(shard_engines))
+        )
+
+    with pytest.raises(RuntimeError, match="DB_SHARD_URLS"):
+        await init_db()
+
+
+async def test_failed_shard_link_releases_telegram_id(database):
+    async with unit_of_work() as session:
+        user = await UserCRUD(session).create_user(User(username="linked", password="9001"))
+    user_engine = shard_engines[shard_for_user(user.id)]
+    # ID Telegram уже занят в шарде пользователя: UPDATE шарда упадет после коммита справочника
+    async with user_engine.begin() as conn:
+        await conn.execute(UserInDB.__table__.insert().values(id=10_000, username="holder", telegram_id=9001))
+
+    with pytest.raises(IntegrityError):
+        async with unit_of_work() as session:
+            await UserCRUD(session).get_or_create_bot_user(9001, "linked")
+
+    assert await rows(engine, select(UserDirectoryInDB.telegram_id).where(UserDirectoryInDB.user_id == user.id)) \
+        == [(None,)]
+
+    async with user_engine.begin() as conn:
+        await conn.execute(UserInDB.__table__.delete().where(UserInDB.id == 10_000))
+    async with unit_of_work() as session:
+        linked, created = await UserCRUD(session).get_or_create_bot_user(9001, "linked")
+    assert (linked.id, created) == (user.id, False)
+    assert await rows(user_engine, select(UserInDB.telegram_id).where(UserInDB.id == user.id)) == [(9001,)]
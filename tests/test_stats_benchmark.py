@@ -0,0 +1,84 @@
+"""
+Бенчмарк статистики привычки по битовым картам: время HabitBitmapCRUD.get_bitmap и расчета
+серий не должно расти с длиной истории (1, 100 и 3000 дней), а карты должны занимать
+на порядок меньше места, чем те же записи в habit_logs.
+"""
+import statistics
+import time
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from database.backfill import backfill_bitmaps
+from database.db import shard_engines, shard_for_user, shard_sessions, unit_of_work
+from database.func_db import HabitCRUD, HabitBitmapCRUD
+from database.models import HabitLogInDB
+from tests.conftest import create_user
+
+pytestmark = pytest.mark.asyncio
+
+TODAY = date(2026, 3, 10)
+RUNS = 40
+
+
+async def seed_history(user_id: int, days: int) -> int:
+    async with unit_of_work(shard_sessions[shard_for_user(user_id)]) as session:
+        habit = await HabitCRUD(session).create_habit(
+            user_id, "habit", None, 21, 21, TODAY - timedelta(days=days), None, 0, 0, True
+        )
+        await session.execute(insert(HabitLogInDB), [
+            {"habit_id": habit.id, "log_date": TODAY - timedelta(days=offset), "completed": offset % 5 != 0}
+            for offset in range(days)
+        ])
+    async with shard_engines[shard_for_user(user_id)].begin() as conn:
+        await backfill_bitmaps(conn)
+    return habit.id
+
+
+async def median_stats_latency(user_id: int, habit_id: int) -> float:
+    timings = []
+    for _ in range(RUNS):
+        async with shard_sessions[shard_for_user(user_id)]() as session:
+            started_at = time.perf_counter()
+            bitmap = await HabitBitmapCRUD(session).get_bitmap(habit_id, user_id, TODAY)
+            bitmap.current_streak(TODAY)
+            bitmap.longest_streak()
+            bitmap.count(TODAY.replace(day=1), TODAY)
+            bitmap.calendar(TODAY)
+            timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings)
+
+
+async def table_bytes(db_engine) -> dict[str, int]:
+    async with db_engine.connect() as conn:
+        # Страницы таблицы вместе с ее индексами
+        return dict((await conn.exec_driver_sql(
+            "SELECT s.tbl_name, sum(d.pgsize) FROM dbstat AS d JOIN sqlite_schema AS s ON s.name = d.name "
+            "GROUP BY s.tbl_name"
+        )).all())
+
+
+async def test_stats_latency_is_flat(database):
+    latencies = {}
+    for days in (1, 100, 3000):
+        user = await create_user(f"stats_{days}", 9200 + days)
+        habit_id = await seed_history(user.id, days)
+        await median_stats_latency(user.id, habit_id)  # прогрев пула и кэша запросов
+        latencies[days] = await median_stats_latency(user.id, habit_id)
+
+    print("\n" + "\n".join(f"{days:>5} дней истории: {latency * 1000:.3f} мс" for days, latency in latencies.items()))
+    # Карта за 3000 дней — девять строк по году; рост в разы означал бы чтение habit_logs
+    assert latencies[3000] < latencies[1] * 2 + 0.002
+
+
+async def test_bitmaps_are_smaller_than_logs(database):
+    user = await create_user("stats_storage", 9300)
+    for _ in range(5):
+        await seed_history(user.id, 3000)
+
+    sizes = await table_bytes(shard_engines[shard_for_user(user.id)])
+    logs, bitmaps = sizes["habit_logs"], sizes["habit_bitmaps"]
+
+    print(f"\nhabit_logs: {logs} байт, habit_bitmaps: {bitmaps} байт (5 привычек по 3000 дней)")
+    assert bitmaps * 10 < logs
@@ -0,0 +1,132 @@
+"""
+Кэш проверенных access token (api.auth.TokenCache): попадания и промахи, вытеснение LRU,
+снятие записей по `exp` и накладные расходы аутентификации с кэшем и без него.
+"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import api.auth
+from api.auth import AuthService, TokenCache
+from config import config
+
+NOW = 1_800_000_000.0
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """
+    Пустой кэш на три записи с подменяемыми часами: clock.now — текущее время в секундах.
+    """
+    clock = SimpleNamespace(now=NOW)
+    monkeypatch.setattr(api.auth, "time", SimpleNamespace(time=lambda: clock.now))
+    monkeypatch.setattr(config, "JWT_CACHE_SIZE", 3)
+    TokenCache.clear()
+    yield clock
+    TokenCache.clear()
+
+
+def payload(user_id: int, ttl: float = 60) -> dict:
+    return {"sub": f"user_{user_id}", "user_id": user_id, "exp": NOW + ttl}
+
+
+def test_hits_and_misses(cache):
+    TokenCache.put("token-1", payload(1))
+
+    assert TokenCache.get("token-1") == payload(1)
+    assert TokenCache.get("token-2") is None
+    assert TokenCache.metrics() == {"size": 1, "max_size": 3, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_token_itself_is_not_stored(cache):
+    TokenCache.put("secret-token", payload(1))
+
+    assert "secret-token" not in TokenCache.entries
+    assert list(TokenCache.entries) == [TokenCache.key("secret-token")]
+
+
+def test_lru_evicts_least_recently_used(cache):
+    for user_id in range(1, 4):
+        TokenCache.put(f"token-{user_id}", payload(user_id))
+    TokenCache.get("token-1")  # token-2 становится самым старым
+
+    TokenCache.put("token-4", payload(4))
+
+    assert TokenCache.get("token-2") is None
+    assert [TokenCache.get(f"token-{user_id}") for user_id in (1, 3, 4)] == [payload(1), payload(3), payload(4)]
+
+
+def test_expired_entry_is_a_miss(cache):
+    TokenCache.put("token-1", payload(1, ttl=60))
+
+    cache.now = NOW + 60
+
+    assert TokenCache.get("token-1") is None
+    assert TokenCache.metrics()["size"] == 0
+
+
+def test_expired_entries_are_evicted_without_lru_pressure(cache):
+    TokenCache.put("short-1", payload(1, ttl=10))
+    TokenCache.put("short-2", payload(2, ttl=20))
+    TokenCache.put("long", payload(3, ttl=600))
+
+    cache.now = NOW + 30
+    TokenCache.put("fresh", payload(4, ttl=600))
+
+    # Истекшие записи сняты при put, а не вытеснением самой старой: место хватило всем живым
+    assert TokenCache.metrics()["size"] == 2
+    assert TokenCache.get("long") == payload(3, ttl=600)
+
+
+def test_already_expired_token_is_not_cached(cache):
+    TokenCache.put("token-1", payload(1, ttl=-1))
+
+    assert not TokenCache.entries
+    assert not TokenCache.expiry
+
+
+def test_expiry_heap_stays_bounded(cache):
+    for user_id in range(100):
+        TokenCache.put(f"token-{user_id}", payload(user_id, ttl=600))
+
+    assert len(TokenCache.entries) == 3
+    assert len(TokenCache.expiry) <= 2 * config.JWT_CACHE_SIZE + 1
+
+
+def test_reput_keeps_the_new_expiry(cache):
+    TokenCache.put("token-1", payload(1, ttl=10))
+    TokenCache.put("token-1", payload(1, ttl=600))
+
+    cache.now = NOW + 30
+
+    # Элемент кучи от первого put не снимает запись с новым сроком
+    assert TokenCache.get("token-1") == payload(1, ttl=600)
+
+
+@pytest.mark.asyncio
+async def test_auth_overhead_benchmark(monkeypatch):
+    """
+    Время get_principal на один запрос: проверка подписи JWT на каждый запрос против кэша.
+    """
+    user = SimpleNamespace(id=1, username="bench")
+    token = AuthService.create_access_token(AuthService.token_claims(user))
+    requests = 5000
+
+    async def per_request(cache_size: int) -> float:
+        monkeypatch.setattr(config, "JWT_CACHE_SIZE", cache_size)
+        TokenCache.clear()
+        started_at = time.perf_counter()
+        for _ in range(requests):
+            await AuthService.get_principal(token)
+        return (time.perf_counter() - started_at) / requests
+
+    uncached = await per_request(0)
+    cached = await per_request(10_000)
+    hit_rate = TokenCache.metrics()["hit_rate"]
+    TokenCache.clear()
+    print(f"\nget_principal: без кэша {uncached * 1e6:.1f} мкс, с кэшем {cached * 1e6:.1f} мкс, "
+          f"доля попаданий {hit_rate}")
+
+    assert hit_rate > 0.99
+    assert cached < uncached
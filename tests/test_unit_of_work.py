@@ -0,0 +1,95 @@
+"""
+Единица работы на запрос: один коммит на запрос записи, ни одного на чтение,
+и ни одного соединения из пула для запроса, отклоненного проверкой токена.
+"""
+from contextlib import ExitStack
+
+import pytest
+
+from database.db import engine, shard_engines
+from tests.conftest import auth_headers, counted_commits, create_user, recorded_statements, user_shard
+
+pytestmark = pytest.mark.asyncio
+
+
+def executed_queries(statements) -> int:
+    return sum(1 for statement, _ in statements if not statement.startswith("BEGIN"))
+
+
+async def request_counts(client, user, method: str, url: str, **kwargs):
+    """
+    Выполняет запрос и возвращает ответ, число коммитов в шарде пользователя, число коммитов
+    в остальных базах и число SQL-запросов в шарде.
+    """
+    shard = user_shard(user)
+    others = [db_engine for db_engine in {engine, *shard_engines} if db_engine is not shard]
+    with ExitStack() as stack:
+        statements = stack.enter_context(recorded_statements(shard))
+        shard_commits = stack.enter_context(counted_commits(shard))
+        other_commits = [stack.enter_context(counted_commits(db_engine)) for db_engine in others]
+        response = await client.request(method, url, headers=auth_headers(user), **kwargs)
+    return response, shard_commits[0], sum(commits[0] for commits in other_commits), executed_queries(statements)
+
+
+@pytest.mark.parametrize("method, url, body, max_queries", [
+    ("POST", "/habits", {"name": "new", "start_date": "2026-01-01"}, 1),
+    ("PUT", "/habits/{habit_id}", {"name": "renamed"}, 1),
+    ("POST", "/habits/{habit_id}/logs", {"completed": True}, 4),
+    ("POST", "/habits/logs/batch", {"logs": [{"habit_id": "{habit_id}", "completed": False}]}, 5),
+    ("PUT", "/users/me/settings", {"timezone": "Europe/Moscow", "reminder_time": "09:30"}, 2),
+    ("DELETE", "/habits/{habit_id}", None, 4),
+])
+async def test_write_endpoint_commits_once(client, method, url, body, max_queries):
+    user = await create_user("writer", 4001)
+    created = await client.post("/habits", json={"name": "habit", "start_date": "2026-01-01"},
+                                headers=auth_headers(user))
+    habit_id = created.json()["id"]
+    if body is not None and "logs" in body:
+        body = {"logs": [{"habit_id": habit_id, "completed": False}]}
+
+    response, shard_commits, other_commits, queries = await request_counts(
+        client, user, method, url.format(habit_id=habit_id), json=body
+    )
+
+    assert response.status_code == 200, response.text
+    assert shard_commits == 1
+    assert other_commits == 0
+    assert queries <= max_queries
+
+
+@pytest.mark.parametrize("url", ["/habits", "/habits/{habit_id}", "/unlogged_habits", "/habits/{habit_id}/stats"])
+async def test_read_endpoint_does_not_commit(client, url):
+    user = await create_user("reader", 4002)
+    created = await client.post("/habits", json={"name": "habit", "start_date": "2026-01-01"},
+                                headers=auth_headers(user))
+
+    response, shard_commits, other_commits, queries = await request_counts(
+        client, user, "GET", url.format(habit_id=created.json()["id"])
+    )
+
+    assert response.status_code == 200, response.text
+    assert shard_commits == 0
+    assert other_commits == 0
+    assert queries <= 3
+
+
+async def test_failed_write_rolls_back(client):
+    user = await create_user("rollback", 4003)
+
+    response, shard_commits, other_commits, _ = await request_counts(
+        client, user, "PUT", "/habits/999999", json={"name": "missing"}
+    )
+
+    assert response.status_code == 404
+    assert shard_commits == 0
+    assert other_commits == 0
+
+
+@pytest.mark.parametrize("headers", [{}, {"Authorization": "Bearer not-a-token"}])
+async def test_rejected_auth_does_not_check_out_connection(client, headers):
+    checkouts = [db_engine.pool.checkouts for db_engine in [engine, *shard_engines]]
+
+    response = await client.post("/habits", json={"name": "habit", "start_date": "2026-01-01"}, headers=headers)
+
+    assert response.status_code == 401
+    assert [db_engine.pool.checkouts for db_engine in [engine, *shard_engines]] == checkouts
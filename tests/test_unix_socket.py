@@ -0,0 +1,93 @@
+"""
+API на Unix-сокете: бот ходит к нему через HttpUser с адресом unix://, и сравнение задержки
+запросов через Unix-сокет и через локальный TCP.
+"""
+import os
+import socket
+import statistics
+import tempfile
+import time
+
+import pytest
+from aiogram.types import User as TgUser
+
+from TG.funcs_tg import HttpUser, TokenStore, parse_api_url
+from tests.conftest import running_api
+
+pytestmark = pytest.mark.asyncio
+
+TG_USER = TgUser(id=717171, is_bot=False, first_name="Socket", username="socket_user")
+CALLS = 500
+
+
+def use_api_url(monkeypatch, url: str) -> None:
+    base_url, socket_path = parse_api_url(url)
+    monkeypatch.setattr(HttpUser, "base_url", base_url)
+    monkeypatch.setattr(HttpUser, "socket_path", socket_path)
+    monkeypatch.setattr(HttpUser, "tokens", TokenStore())
+
+
+def unix_socket(path: str) -> socket.socket:
+    uds_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    uds_sock.bind(path)
+    return uds_sock
+
+
+def tcp_socket() -> socket.socket:
+    tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    tcp_sock.bind(("127.0.0.1", 0))
+    return tcp_sock
+
+
+async def test_http_user_over_unix_socket(database, monkeypatch):
+    with tempfile.TemporaryDirectory() as socket_dir:
+        path = os.path.join(socket_dir, "api.sock")
+        use_api_url(monkeypatch, f"unix://{path}")
+        async with running_api(unix_socket(path)):
+            await HttpUser.shutdown()
+            try:
+                login = await HttpUser.authenticate_user(TG_USER)
+                habit = await HttpUser.create_habit(TG_USER, {"name": "read", "start_date": "2026-01-01"})
+                habits = await HttpUser.get_habits(TG_USER)
+                connector = HttpUser.session.connector
+            finally:
+                await HttpUser.shutdown()
+
+    assert login["created"] is True
+    assert [item["id"] for item in habits] == [habit["id"]]
+    assert connector.path == path
+
+
+async def median_latency(url: str) -> float:
+    """
+    Медиана задержки GET /metrics/token-cache через HttpUser: обработчик не ходит в базу,
+    поэтому время определяют транспорт и HTTP-стек.
+    """
+    latencies = []
+    for _ in range(CALLS):
+        started_at = time.perf_counter()
+        status, _ = await HttpUser._send(url, method="GET")
+        latencies.append(time.perf_counter() - started_at)
+        assert status == 200
+    return statistics.median(latencies)
+
+
+async def test_unix_socket_against_tcp_latency(database, monkeypatch):
+    results = {}
+    with tempfile.TemporaryDirectory() as socket_dir:
+        path = os.path.join(socket_dir, "api.sock")
+        tcp_sock = tcp_socket()
+        for name, url, sock in (("Unix-сокет", f"unix://{path}", unix_socket(path)),
+                                ("TCP", f"http://127.0.0.1:{tcp_sock.getsockname()[1]}", tcp_sock)):
+            use_api_url(monkeypatch, url)
+            async with running_api(sock):
+                await HttpUser.shutdown()
+                try:
+                    await median_latency(f"{HttpUser.base_url}/metrics/token-cache")  # прогрев
+                    results[name] = await median_latency(f"{HttpUser.base_url}/metrics/token-cache")
+                finally:
+                    await HttpUser.shutdown()
+
+    print("\n" + ", ".join(f"{name}: медиана {latency * 1e6:.0f} мкс" for name, latency in results.items()))
+    # В одном процессе разница транспортов теряется на фоне HTTP-стека: проверяется, что сокет не медленнее
+    assert results["Unix-сокет"] < results["TCP"] * 1.5
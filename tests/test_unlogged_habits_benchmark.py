@@ -0,0 +1,65 @@
+"""
+Бенчмарк /unlogged_habits: время HabitCRUD.get_unlogged_tracked_habits не должно расти
+с длиной истории привычек (1, 100 и 3000 дней записей).
+"""
+import statistics
+import time
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import insert, update
+
+from database.db import shard_for_user, shard_sessions, unit_of_work
+from database.func_db import HabitCRUD
+from database.models import HabitInDB, HabitLogInDB
+from tests.conftest import create_user
+
+pytestmark = pytest.mark.asyncio
+
+TODAY = date(2026, 3, 10)
+HABITS_PER_USER = 5
+RUNS = 40
+
+
+async def seed_history(user_id: int, days: int) -> None:
+    async with unit_of_work(shard_sessions[shard_for_user(user_id)]) as session:
+        habit_ids = []
+        for index in range(HABITS_PER_USER):
+            habit = await HabitCRUD(session).create_habit(
+                user_id, f"habit {index}", None, 21, 21, TODAY - timedelta(days=days), None, 0, 0, True
+            )
+            habit_ids.append(habit.id)
+
+        await session.execute(insert(HabitLogInDB), [
+            {"habit_id": habit_id, "log_date": TODAY - timedelta(days=offset), "completed": offset % 3 != 0}
+            for habit_id in habit_ids
+            for offset in range(1, days + 1)
+        ])
+        await session.execute(
+            update(HabitInDB).where(HabitInDB.id.in_(habit_ids))
+            .values(last_log_date=TODAY - timedelta(days=1), last_log_completed=True)
+        )
+
+
+async def median_latency(user_id: int) -> float:
+    timings = []
+    for _ in range(RUNS):
+        async with shard_sessions[shard_for_user(user_id)]() as session:
+            started_at = time.perf_counter()
+            habits = await HabitCRUD(session).get_unlogged_tracked_habits(user_id, TODAY)
+            timings.append(time.perf_counter() - started_at)
+        assert len(habits) == HABITS_PER_USER
+    return statistics.median(timings)
+
+
+async def test_unlogged_habits_latency_is_flat(database):
+    latencies = {}
+    for days in (1, 100, 3000):
+        user = await create_user(f"history_{days}", 3000 + days)
+        await seed_history(user.id, days)
+        await median_latency(user.id)  # прогрев пула и кэша запросов
+        latencies[days] = await median_latency(user.id)
+
+    print("\n" + "\n".join(f"{days:>5} дней истории: {latency * 1000:.3f} мс" for days, latency in latencies.items()))
+    # Допуск на шум измерений; рост в разы означал бы чтение habit_logs
+    assert latencies[3000] < latencies[1] * 2 + 0.002
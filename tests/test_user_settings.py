@@ -0,0 +1,42 @@
+"""
+Часовой пояс пользователя: смещение от UTC и минута напоминания по UTC, в том числе после перевода часов.
+"""
+from datetime import datetime, timezone
+
+import pytest
+
+from database.db import shard_for_user, shard_sessions, unit_of_work
+from database.func_db import UserCRUD
+from database.models import UserInDB
+from tasks import offsets_boundary
+from tests.conftest import auth_headers, create_user
+
+# Европа переходит на летнее время 29 марта 2026 года в 01:00 UTC
+BERLIN_DST_START = datetime(2026, 3, 29, 1, 0, tzinfo=timezone.utc)
+
+
+@pytest.mark.asyncio
+async def test_refresh_uses_offset_at_upcoming_hour(client):
+    user = await create_user("berlin", 9001)
+    response = await client.put("/users/me/settings", headers=auth_headers(user),
+                                json={"timezone": "Europe/Berlin", "reminder_time": "20:00"})
+    assert response.status_code == 200, response.text
+
+    shard_session = shard_sessions[shard_for_user(user.id)]
+    async with unit_of_work(shard_session) as session:
+        await UserCRUD(session).refresh_utc_offsets(datetime(2026, 3, 29, 0, 30, tzinfo=timezone.utc))
+    async with shard_session() as session:
+        winter = await session.get(UserInDB, user.id)
+    assert (winter.utc_offset_minutes, winter.reminder_utc_minute) == (60, 19 * 60)
+
+    # Запуск в 00:55 считает смещение на 01:00, когда часы уже переведены
+    async with unit_of_work(shard_session) as session:
+        await UserCRUD(session).refresh_utc_offsets(offsets_boundary(datetime(2026, 3, 29, 0, 55, tzinfo=timezone.utc)))
+    async with shard_session() as session:
+        summer = await session.get(UserInDB, user.id)
+    assert (summer.utc_offset_minutes, summer.reminder_utc_minute) == (120, 18 * 60)
+
+
+def test_offsets_boundary():
+    assert offsets_boundary(datetime(2026, 3, 29, 0, 55, tzinfo=timezone.utc)) == BERLIN_DST_START
+    assert offsets_boundary(datetime(2026, 3, 29, 1, 4, tzinfo=timezone.utc)) == BERLIN_DST_START
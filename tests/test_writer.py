@@ -0,0 +1,96 @@
+"""
+Писатель SQLite с групповым коммитом (database.writer) на одной базе: основная база тестов
+без шардов, как в небольших установках.
+"""
+import asyncio
+from datetime import date
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import NoResultFound
+
+from api.pydantic_models import HabitLogCreate
+from database.db import async_session, engine, unit_of_work, RecentWriters
+from database.func_db import HabitLogCRUD
+from database.models import HabitInDB, HabitLogInDB, UserInDB
+from database.writer import run_write, write_queue
+from tests.conftest import counted_commits, recorded_statements
+
+pytestmark = pytest.mark.asyncio
+
+TODAY = date(2026, 3, 10)
+USER_ID = 1
+
+
+async def seed_habits(count: int) -> list[int]:
+    async with unit_of_work(async_session) as session:
+        session.add(UserInDB(id=USER_ID, username="single_db"))
+        await session.flush()
+        await session.execute(insert(HabitInDB), [
+            {"id": habit_id, "user_id": USER_ID, "name": f"habit {habit_id}", "start_date": TODAY}
+            for habit_id in range(1, count + 1)
+        ])
+    return list(range(1, count + 1))
+
+
+@pytest_asyncio.fixture
+async def writer(database):
+    await write_queue.start()
+    yield write_queue
+    await write_queue.stop()
+    write_queue.batches = write_queue.writes = write_queue.failed_commits = 0
+
+
+def log_habit(habit_id: int, log_date: date = TODAY, completed: bool = True):
+    return lambda session: HabitLogCRUD(session).create_habit_log(
+        USER_ID, habit_id, log_date, HabitLogCreate(completed=completed)
+    )
+
+
+async def test_run_write_group_commits_through_writer(writer):
+    habit_ids = await seed_habits(50)
+
+    async with async_session() as db:
+        with counted_commits(engine) as commits:
+            results = await asyncio.gather(
+                *(run_write(db, USER_ID, log_habit(habit_id)) for habit_id in habit_ids),
+                run_write(db, USER_ID, log_habit(10_000)),
+                return_exceptions=True,
+            )
+
+    *logs, missing = results
+    assert isinstance(missing, NoResultFound)
+    assert sorted(log.habit_id for log in logs) == habit_ids
+    # Операции, поставленные одновременно, фиксируются несколькими общими коммитами
+    assert commits[0] == writer.batches < len(habit_ids)
+    assert RecentWriters.is_recent(USER_ID)
+
+    async with async_session() as session:
+        assert await session.scalar(select(func.count()).select_from(HabitLogInDB)) == len(habit_ids)
+
+
+async def test_writer_batch_holds_write_lock_from_start(writer):
+    habit_ids = await seed_habits(2)
+    other_write_done = asyncio.Event()
+
+    async def read_then_write(session):
+        # Чтение в начале пакета, как проверка принадлежности в create_habit_logs_batch
+        await session.scalar(select(HabitInDB.id).where(HabitInDB.id == habit_ids[0]))
+        await asyncio.sleep(0.2)  # другое соединение пытается записать в это время
+        assert not other_write_done.is_set()
+        return await log_habit(habit_ids[0])(session)
+
+    async def other_connection_write():
+        await asyncio.sleep(0.05)
+        async with engine.begin() as conn:
+            await conn.execute(insert(HabitLogInDB).values(habit_id=habit_ids[1], log_date=TODAY, completed=True))
+        other_write_done.set()
+
+    with recorded_statements(engine) as statements:
+        log, _ = await asyncio.gather(write_queue.submit(read_then_write), other_connection_write())
+
+    assert log.habit_id == habit_ids[0]
+    assert "BEGIN IMMEDIATE" in [statement for statement, _ in statements]
+    async with async_session() as session:
+        assert await session.scalar(select(func.count()).select_from(HabitLogInDB)) == 2
@@ -0,0 +1,86 @@
+"""
+Бенчмарк записи в одну SQLite при 100 одновременных «логгерах»: пропускная способность и p99
+задержки отметки привычки через писателя с групповым коммитом и через отдельные транзакции
+(BEGIN IMMEDIATE на каждый запрос).
+"""
+import asyncio
+import statistics
+import time
+from datetime import date
+
+import pytest
+from sqlalchemy import insert
+
+from api.pydantic_models import HabitLogCreate
+from database.db import async_session, begin_write, unit_of_work
+from database.func_db import HabitLogCRUD
+from database.models import HabitInDB, UserInDB
+from database.writer import write_queue
+
+pytestmark = pytest.mark.asyncio
+
+TODAY = date(2026, 3, 10)
+LOGGERS = 100
+WRITES_PER_LOGGER = 5
+
+
+async def seed_habits(first_id: int) -> list[list[int]]:
+    async with unit_of_work(async_session) as session:
+        session.add(UserInDB(id=first_id, username=f"bench_{first_id}"))
+        await session.flush()
+        habit_ids = [first_id + index for index in range(LOGGERS * WRITES_PER_LOGGER)]
+        await session.execute(insert(HabitInDB), [
+            {"id": habit_id, "user_id": first_id, "name": "habit", "start_date": TODAY} for habit_id in habit_ids
+        ])
+    return [habit_ids[index::LOGGERS] for index in range(LOGGERS)]
+
+
+async def direct_write(operation):
+    async with unit_of_work(async_session) as session:
+        await begin_write(session)
+        return await operation(session)
+
+
+async def run_loggers(user_id: int, habits_by_logger: list[list[int]], write) -> tuple[float, list[float], int]:
+    latencies, errors = [], 0
+
+    async def logger(habit_ids: list[int]) -> None:
+        nonlocal errors
+        for habit_id in habit_ids:
+            started_at = time.perf_counter()
+            try:
+                await write(lambda session: HabitLogCRUD(session).create_habit_log(
+                    user_id, habit_id, TODAY, HabitLogCreate(completed=True)
+                ))
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(logger(habit_ids) for habit_ids in habits_by_logger))
+    return time.perf_counter() - started_at, latencies, errors
+
+
+def p99(latencies: list[float]) -> float:
+    return statistics.quantiles(latencies, n=100)[98]
+
+
+async def test_group_commit_throughput_at_100_loggers(database):
+    results = {}
+    await write_queue.start()
+    try:
+        results["писатель"] = await run_loggers(1, await seed_habits(1), write_queue.submit)
+    finally:
+        await write_queue.stop()
+    results["транзакции"] = await run_loggers(10_001, await seed_habits(10_001), direct_write)
+
+    total = LOGGERS * WRITES_PER_LOGGER
+    print("\n" + "\n".join(
+        f"{mode:>10}: {total / elapsed:8.0f} записей/с, p99 {p99(latencies) * 1000:7.1f} мс, ошибок {errors}"
+        for mode, (elapsed, latencies, errors) in results.items()
+    ))
+    queue_elapsed, queue_latencies, queue_errors = results["писатель"]
+    direct_elapsed, direct_latencies, _ = results["транзакции"]
+    assert queue_errors == 0
+    assert queue_elapsed < direct_elapsed
+    assert p99(queue_latencies) < p99(direct_latencies)